@@ -1,6 +1,10 @@
+from django import forms
 from django.contrib import admin, messages
-from django.core.mail import send_mail
-from .models import User, Car, Booking
+from django.utils import timezone
+from . import outbox
+from .backends import invalidate_users
+from .bookings import overlapping_bookings
+from .models import User, Car, Booking, EmailOutbox, SlowQuery
 
 
 @admin.register(User)
@@ -18,35 +22,36 @@ class UserAdmin(admin.ModelAdmin):
 
     def approve_selected_owners(self, request, queryset):
         """Admin bulk action: Approve multiple owners."""
-        owners = queryset.filter(role="owner", is_approved=False)
-        if not owners.exists():
+        owners = list(queryset.filter(role="owner", is_approved=False).values_list("pk", "username", "email"))
+        if not owners:
             self.message_user(request, "No pending owners found.", level=messages.WARNING)
             return
 
-        count = 0
-        for owner in owners:
-            owner.is_approved = True
-            owner.is_active = True
-            owner.save()
-            count += 1
-
-            try:
-                send_mail(
-                    subject="✅ Account Approved",
-                    message=(
-                        f"Hello {owner.username},\n\n"
-                        "Your owner account has been approved by the admin.\n"
-                        "You can now log in and start adding your cars.\n\n"
-                        "Best regards,\nRoyal Cars Team"
-                    ),
-                    from_email=None,
-                    recipient_list=[owner.email],
-                    fail_silently=True,
-                )
-            except Exception as e:
-                self.message_user(
-                    request, f"⚠️ Email not sent to {owner.email}: {e}", level=messages.WARNING
-                )
+        # UPDATE واحد بدل save() لكل owner (الـ rollups ما بتعتمد على is_approved)
+        count = User.objects.filter(pk__in=[pk for pk, _, _ in owners], is_approved=False).update(
+            is_approved=True, is_active=True
+        )
+        # update() ما بيطلق post_save: نمسح نسخ الكاش بإيدنا (core.backends)
+        invalidate_users(*(pk for pk, _, _ in owners))
+
+        # كل الإيميلات على اتصال SMTP واحد؛ اللي بيفشل بيضل بالـ outbox وبيرجع يتبعت من الـ worker
+        result = outbox.send_now(
+            (
+                "✅ Account Approved",
+                f"Hello {username},\n\n"
+                "Your owner account has been approved by the admin.\n"
+                "You can now log in and start adding your cars.\n\n"
+                "Best regards,\nRoyal Cars Team",
+                None,
+                [email],
+            )
+            for _, username, email in owners
+        )
+        for message in result["failed"]:
+            recipient = ", ".join(message.recipients) or "(no email)"
+            self.message_user(
+                request, f"⚠️ Email not sent to {recipient}: {message.last_error}", level=messages.WARNING
+            )
 
         self.message_user(
             request,
@@ -65,67 +70,103 @@ class CarAdmin(admin.ModelAdmin):
     ordering = ("-year", "name")
 
 
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = "__all__"
+
+    def clean(self):
+        """Refuse a status the booking can't move to, or a blocking booking that overlaps another one."""
+        cleaned_data = super().clean()
+        car, status = cleaned_data.get("car"), cleaned_data.get("status")
+        loaded = self.instance._loaded_status
+        if self.instance.pk and status and status != loaded and not self.instance.can_transition(status):
+            self.add_error("status", f"A {loaded} booking can't be moved to {status}.")
+        pickup_date, pickup_time, return_date, return_time = (
+            cleaned_data.get(field) for field in ("pickup_date", "pickup_time", "return_date", "return_time")
+        )
+        if car and status in Booking.BLOCKING_STATUSES and pickup_date and pickup_time and return_date:
+            period = Booking.period(pickup_date, pickup_time, return_date, return_time)
+            # نفس فحص التعارض تبع الحجز من الموقع (core.bookings)
+            if overlapping_bookings(car.pk, *period).exclude(pk=self.instance.pk).exists():
+                raise forms.ValidationError("This car is already booked in the selected period.")
+        return cleaned_data
+
+
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
+    form = BookingAdminForm
     list_display = (
         "user",
         "car",
         "trip_location",
         "distance_km",  
-        "pickup_date",
-        "pickup_time",
+        "pickup_at",
+        "return_at",
         "status",
     )
     list_filter = ("status", "pickup_date")
     search_fields = ("user__username", "car__name", "trip_location")
-    ordering = ("-pickup_date",)
+    ordering = ("-pickup_at",)
 
     def save_model(self, request, obj, form, change):
-        """Detect status changes and send appropriate email notifications."""
+        """Save the other fields, then change the status through ``Booking.transition_to``."""
+        status = obj.status
         if change:
-            old_obj = Booking.objects.get(pk=obj.pk)
-            if old_obj.status != obj.status:
-                subject, message = None, None
-
-                if obj.status == "approved":
-                    subject = "✅ Booking Approved"
-                    message = (
-                        f"Hello {obj.user.username},\n\n"
-                        f"Your booking has been approved!\n\n"
-                        f"Car: {obj.car.name}\n"
-                        f"Trip: {obj.trip_location}\n"
-                        f"Distance: {obj.distance_km} km\n"
-                        f"Date: {obj.pickup_date}\n"
-                        f"Time: {obj.pickup_time}\n\n"
-                        "Thank you for choosing Royal Cars!"
-                    )
-
-                elif obj.status == "rejected":
-                    subject = "❌ Booking Rejected"
-                    message = (
-                        f"Hello {obj.user.username},\n\n"
-                        f"Unfortunately, your booking has been rejected.\n\n"
-                        f"Car: {obj.car.name}\n"
-                        f"Trip: {obj.trip_location}\n"
-                        f"Date: {obj.pickup_date} {obj.pickup_time}\n\n"
-                        "You may contact us for further details."
-                    )
-
-                if subject and message:
-                    try:
-                        send_mail(
-                            subject,
-                            message,
-                            from_email=None,
-                            recipient_list=[obj.user.email],
-                            fail_silently=True,
-                        )
-                        self.message_user(
-                            request, f"📧 Email sent to {obj.user.email}", level=messages.SUCCESS
-                        )
-                    except Exception as e:
-                        self.message_user(
-                            request, f"⚠️ Failed to send email: {e}", level=messages.WARNING
-                        )
-
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+            # كل شي إلا الحالة؛ الحالة بـ UPDATE مشروط (والإيميل من core.signals.notify_renter)
+            obj.status = obj._loaded_status
+            obj.save(update_fields=[f.name for f in obj._meta.concrete_fields if not f.primary_key and f.name != "status"])
+        else:
+            super().save_model(request, obj, form, change)
+
+        if status != obj.status:
+            obj.transition_to(status)
+            if status in (Booking.STATUS_APPROVED, Booking.STATUS_REJECTED) and obj.user and obj.user.email:
+                self.message_user(request, f"📧 Email queued for {obj.user.email}", level=messages.SUCCESS)
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("subject", "recipient_list", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "last_error")
+    ordering = ("-created_at",)
+    readonly_fields = ("attempts", "last_error", "locked_at", "created_at", "sent_at")
+    actions = ["retry_now"]
+
+    def recipient_list(self, obj):
+        return ", ".join(obj.recipients)
+
+    def retry_now(self, request, queryset):
+        """Put failed / pending messages back at the front of the queue."""
+        count = queryset.exclude(status=EmailOutbox.STATUS_SENT).update(
+            status=EmailOutbox.STATUS_PENDING, next_attempt_at=timezone.now(), locked_at=None
+        )
+        self.message_user(request, f"🔁 {count} message(s) queued for retry.", level=messages.SUCCESS)
+
+    retry_now.short_description = "Retry selected messages now"
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ("url_name", "short_statement", "count", "avg_ms", "max_ms", "total_ms", "last_seen")
+    list_filter = ("url_name",)
+    search_fields = ("url_name", "statement")
+    ordering = ("-total_ms",)
+    readonly_fields = (
+        "url_name", "fingerprint", "statement", "sample", "count", "total_ms", "max_ms", "first_seen", "last_seen",
+    )
+
+    def short_statement(self, obj):
+        return obj.statement[:120]
+
+    short_statement.short_description = "Statement"
+
+    def avg_ms(self, obj):
+        return round(obj.avg_ms, 1)
+
+    avg_ms.short_description = "Avg ms"
+
+    def has_add_permission(self, request):
+        # الصفوف بيكتبها core.profiler بس
+        return False
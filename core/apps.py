@@ -1,8 +1,14 @@
 from django.apps import AppConfig
+from django.contrib.staticfiles.apps import StaticFilesConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
     def ready(self):
-        import core.signals
\ No newline at end of file
+        import core.signals
+
+
+class CoreStaticFilesConfig(StaticFilesConfig):
+    # مصادر الـ scss ما بتنخدم للمتصفح، فما منجمعها بـ collectstatic
+    ignore_patterns = [*StaticFilesConfig.ignore_patterns, "scss", "*.scss"]
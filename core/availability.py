@@ -0,0 +1,51 @@
+from django.db.models import OuterRef, QuerySet, Subquery
+from django.utils import timezone
+
+from .bookings import overlap_filter
+from .models import Booking
+
+
+def next_blocking_booking_subquery(now):
+    """Subquery returning the id of the next booking that blocks a car from ``now`` on."""
+    return Subquery(
+        Booking.objects.filter(overlap_filter(now), car=OuterRef("pk"))
+        .order_by("pickup_at")
+        .values("pk")[:1]
+    )
+
+
+def with_next_booking(cars, now=None):
+    """Annotate ``cars`` with ``next_booking_id``."""
+    return cars.annotate(next_booking_id=next_blocking_booking_subquery(now or timezone.now()))
+
+
+def attach_next_bookings(cars, now=None):
+    """
+    Resolve the next blocking booking for every car in ``cars`` in two queries
+    (one annotated car query + one booking lookup) instead of one per car.
+
+    ``cars`` is a queryset, or a list of cars already loaded through
+    ``with_next_booking`` (e.g. one page of it). Sets
+    ``car.unavailable_booking`` (``None`` when the car is free) and returns
+    the evaluated list of cars.
+    """
+    if isinstance(cars, QuerySet):
+        cars = list(with_next_booking(cars, now))
+
+    booking_ids = {c.next_booking_id for c in cars if c.next_booking_id}
+    return _attach(cars, Booking.objects.in_bulk(booking_ids) if booking_ids else {})
+
+
+async def aattach_next_bookings(cars, now=None):
+    """``attach_next_bookings()`` on the async ORM."""
+    if isinstance(cars, QuerySet):
+        cars = [c async for c in with_next_booking(cars, now).aiterator()]
+
+    booking_ids = {c.next_booking_id for c in cars if c.next_booking_id}
+    return _attach(cars, await Booking.objects.ain_bulk(booking_ids) if booking_ids else {})
+
+
+def _attach(cars, bookings):
+    for c in cars:
+        c.unavailable_booking = bookings.get(c.next_booking_id)
+    return cars
@@ -0,0 +1,47 @@
+"""
+Authentication backend that loads ``request.user`` from the cache.
+
+``AuthenticationMiddleware`` resolves the logged-in user on every request,
+which is one ``core_user`` query before the view runs. ``CachedModelBackend``
+keeps the loaded user in the default cache instead; together with the
+``cached_db`` session engine an authenticated GET needs no auth-related
+queries at all. The receivers in ``core.signals`` drop the cached copy when
+a ``User`` row is saved or deleted; code that changes users with
+``QuerySet.update()`` must call ``invalidate_users()`` itself.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+TIMEOUT = getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 15 * 60)
+
+
+def _key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def _delete(user_ids):
+    cache.delete_many([_key(pk) for pk in user_ids])
+
+
+def invalidate_users(*user_ids):
+    """Forget the cached copies of ``user_ids``."""
+    _delete(user_ids)
+    # ومرة كمان بعد الـ commit: طلب قرأ النسخة القديمة قبل الـ commit ما بيضل مخزّنها
+    transaction.on_commit(lambda: _delete(user_ids))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,328 @@
+"""
+Per-view latency benchmark (``manage.py benchmark``).
+
+A throwaway copy of the configured database is created the same way the
+test runner does it (``test_<NAME>``, or a temporary file for SQLite), filled
+with a synthetic dataset of ``scale`` cars and ``scale`` bookings using
+``bulk_create`` and the derived tables rebuilt (rollups, search tokens, car
+counters, occupancy). Each view is then requested through the test client as the role
+that uses it, and its latency percentiles, query count and peak Python
+memory are reported as a JSON-serialisable dict so runs can be diffed
+between releases.
+
+``compare_handlers()`` fires the same concurrent load at the async views
+(``ASYNC_VIEWS``) through the WSGI handler, one thread per in-flight request
+like a threaded WSGI worker, and through the ASGI handler on one event loop,
+and reports the throughput of each.
+"""
+import asyncio
+import datetime
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import django
+from django.core.cache import cache
+from django.db import connection, connections, reset_queries
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from . import car_stats, occupancy, rollups, search
+from .models import Booking, Car, Contract, Review, User
+
+VIEWS = ["index", "car_partial", "detail", "search_cars", "available_cars", "owner_dashboard", "admin_dashboard"]
+# الـ views اللي إلها نسخة async def (بتنقاس تحت WSGI و ASGI)
+ASYNC_VIEWS = ["car_partial", "search_cars", "available_cars"]
+
+BATCH_SIZE = 1000
+CAR_NAMES = ["BMW X5", "Audi A4", "Toyota Corolla", "Kia Rio", "Mercedes C200", "Volkswagen Golf", "Skoda Octavia"]
+STATUSES = [Booking.STATUS_PENDING, Booking.STATUS_APPROVED, Booking.STATUS_REJECTED, Booking.STATUS_PAID]
+
+
+# ---------------------------------------------------------------------------
+# Throwaway database
+# ---------------------------------------------------------------------------
+def _benchmark_db_name():
+    if connection.vendor == "sqlite":
+        return os.path.join(tempfile.gettempdir(), f"rootsplus_benchmark_{os.getpid()}.sqlite3")
+    return f"test_{connection.settings_dict['NAME']}_benchmark"
+
+
+def create_database(verbosity=0):
+    """Create and migrate the benchmark database; returns the name to restore afterwards."""
+    old_name = connection.settings_dict["NAME"]
+    connection.settings_dict.setdefault("TEST", {})
+    connection.settings_dict["TEST"]["NAME"] = _benchmark_db_name()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    return old_name
+
+
+def destroy_database(old_name, verbosity=0):
+    connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+# ---------------------------------------------------------------------------
+# Dataset
+# ---------------------------------------------------------------------------
+def _ids(model):
+    # MySQL ما بيرجع الـ ids من bulk_create، فبنقرأهم (القاعدة فاضية أصلاً)
+    return list(model.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def seed(scale, seed_value=0):
+    """Fill the (empty) database with ``scale`` cars and ``scale`` bookings."""
+    rng = random.Random(seed_value)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    today = now.date()
+    n_owners = max(1, scale // 20)
+    n_renters = max(1, scale // 10)
+
+    # كل المستخدمين بنفس الـ hash (أسرع من make_password لكل واحد)
+    template = User(username="template")
+    template.set_password("benchmark")
+
+    users = [User(username="bench-admin", role=User.Roles.ADMIN, is_staff=True, password=template.password)]
+    users += [
+        User(username=f"owner{i}", email=f"owner{i}@example.com", role=User.Roles.OWNER, is_approved=True,
+             company_name=f"Company {i}", password=template.password,
+             date_joined=now - datetime.timedelta(days=rng.randrange(365)))
+        for i in range(n_owners)
+    ]
+    users += [
+        User(username=f"renter{i}", email=f"renter{i}@example.com", password=template.password,
+             date_joined=now - datetime.timedelta(days=rng.randrange(365)))
+        for i in range(n_renters)
+    ]
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    owner_ids = list(User.objects.filter(role=User.Roles.OWNER).order_by("pk").values_list("pk", flat=True))
+    renter_ids = list(User.objects.filter(role=User.Roles.USER).order_by("pk").values_list("pk", flat=True))
+
+    Car.objects.bulk_create(
+        [
+            Car(owner_id=owner_ids[i % n_owners], name=f"{rng.choice(CAR_NAMES)} {i}",
+                year=rng.randrange(2010, 2026), transmission=rng.choice(["AUTO", "MANUAL"]),
+                mileage=str(rng.randrange(1000, 200000)), price=Decimal(rng.randrange(25, 300)),
+                is_available=rng.random() > 0.1, description="Benchmark car")
+            for i in range(scale)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    car_ids = _ids(Car)
+    prices = dict(Car.objects.values_list("pk", "price"))
+
+    bookings = []
+    for i in range(scale):
+        pickup = today + datetime.timedelta(days=rng.randrange(-180, 180))
+        drop = pickup + datetime.timedelta(days=rng.randrange(1, 8))
+        pickup_at, return_at = Booking.period(pickup, datetime.time(10), drop, datetime.time(10))
+        bookings.append(Booking(
+            user_id=rng.choice(renter_ids), car_id=car_ids[i % len(car_ids)], status=rng.choice(STATUSES),
+            trip_location="Ramallah → Nablus (50 km)", distance_km=50,
+            pickup_date=pickup, pickup_time=datetime.time(10), return_date=drop, return_time=datetime.time(10),
+            pickup_at=pickup_at, return_at=return_at,
+            created_at=now - datetime.timedelta(days=rng.randrange(365)),
+        ))
+    Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+
+    paid = Booking.objects.filter(status=Booking.STATUS_PAID).values_list(
+        "pk", "user_id", "car_id", "pickup_date", "return_date"
+    )
+    contracts, reviews = [], []
+    for pk, user_id, car_id, pickup, ret in paid.iterator():
+        days = (ret - pickup).days or 1
+        contracts.append(Contract(booking_id=pk, daily_rate=prices[car_id], rental_days=days,
+                                  total_amount=prices[car_id] * days))
+        if rng.random() < 0.6:
+            reviews.append(Review(booking_id=pk, user_id=user_id, rating=rng.randrange(1, 6), comment="Benchmark"))
+    Contract.objects.bulk_create(contracts, batch_size=BATCH_SIZE)
+    Review.objects.bulk_create(reviews, batch_size=BATCH_SIZE)
+
+    # bulk_create ما بيطلق signals: نبني الجداول المشتقة مرة وحدة
+    rollups.rebuild()
+    search.rebuild_index()
+    car_stats.reconcile()
+    occupancy.rebuild()
+    return {"users": len(users), "cars": scale, "bookings": scale, "contracts": len(contracts), "reviews": len(reviews)}
+
+
+# ---------------------------------------------------------------------------
+# Measuring
+# ---------------------------------------------------------------------------
+def _requests():
+    """``{view: (user or None, path, params)}``."""
+    owner = User.objects.filter(role=User.Roles.OWNER).order_by("pk").first()
+    admin = User.objects.get(username="bench-admin")
+    car_id = Car.objects.order_by("-booking_count", "pk").values_list("pk", flat=True).first()
+    pickup = datetime.date.today() + datetime.timedelta(days=30)
+    return {
+        "index": (None, reverse("index"), {}),
+        "car_partial": (None, reverse("car_partial"), {"sort": "popular"}),
+        "detail": (None, reverse("detail", args=[car_id]), {}),
+        "search_cars": (None, reverse("search_cars"), {"q": "bmw 20"}),
+        "available_cars": (None, reverse("available_cars"), {
+            "pickup": f"{pickup}T10:00", "return": f"{pickup + datetime.timedelta(days=3)}T10:00",
+        }),
+        "owner_dashboard": (owner, reverse("owner_dashboard"), {}),
+        "admin_dashboard": (admin, reverse("admin_dashboard"), {}),
+    }
+
+
+def _percentile(samples, p):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def measure(views=None, iterations=50, warmup=3, cold_cache=False):
+    """Benchmark ``views`` against the current database."""
+    plans = _requests()
+    results = {}
+    for view in views or VIEWS:
+        user, path, params = plans[view]
+        client = Client()
+        if user:
+            client.force_login(user)
+
+        def get():
+            if cold_cache:
+                cache.clear()
+            return client.get(path, params)
+
+        for _ in range(warmup):
+            get()
+
+        # request_started بيفضّي الـ query log، فلازم العدّ يبدأ من صفر
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            response = get()
+        # captured_queries بتنقرأ من الـ log لما نطلبها، والطلبات الجاية بتفضّيه
+        queries = len(captured)
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            get()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        get()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[view] = {
+            "status": response.status_code,
+            "queries": queries,
+            "p50_ms": round(_percentile(timings, 50), 3),
+            "p95_ms": round(_percentile(timings, 95), 3),
+            "p99_ms": round(_percentile(timings, 99), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+    return results
+
+
+def _throughput(timings, elapsed):
+    return {
+        "requests_per_second": round(len(timings) / elapsed, 1),
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+    }
+
+
+def _wsgi_load(path, params, requests, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        Client().get(path, params)
+        return (time.perf_counter() - start) * 1000
+
+    barrier = threading.Barrier(concurrency)
+
+    def close(_):
+        # كل thread فتح اتصال للقاعدة؛ الـ barrier بيضمن إن كل thread بيسكّر تبعه
+        barrier.wait()
+        connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - start
+        list(pool.map(close, range(concurrency)))
+    return _throughput(timings, elapsed)
+
+
+async def _asgi_load(path, params, requests, concurrency):
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            await client.get(path, params)
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(one() for _ in range(requests)))
+    return _throughput(timings, time.perf_counter() - start)
+
+
+def compare_handlers(views=None, requests=200, concurrency=20):
+    """Throughput of ``views`` (async ones only) under the WSGI and the ASGI handler."""
+    plans = _requests()
+    results = {}
+    for view in views or ASYNC_VIEWS:
+        if view not in ASYNC_VIEWS:
+            continue
+        _, path, params = plans[view]
+        Client().get(path, params)  # تسخين (الكاش، الـ templates)
+        results[view] = {
+            "wsgi": _wsgi_load(path, params, requests, concurrency),
+            "asgi": asyncio.run(_asgi_load(path, params, requests, concurrency)),
+        }
+    return results
+
+
+def run(scale, views=None, iterations=50, warmup=3, cold_cache=False, verbosity=0, concurrency=0):
+    """
+    Build a throwaway database at ``scale``, benchmark ``views`` and drop it
+    again. With ``concurrency`` also compare WSGI and ASGI throughput.
+    """
+    setup_test_environment()
+    # كاش بالذاكرة عشان ما نلمس كاش الإنتاج (ولا نمسحه مع --cold-cache)
+    isolated_cache = override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}}
+    )
+    isolated_cache.enable()
+    old_name = create_database(verbosity)
+    try:
+        start = time.perf_counter()
+        dataset = seed(scale)
+        seed_seconds = time.perf_counter() - start
+        results = measure(views, iterations, warmup, cold_cache)
+        throughput = compare_handlers(views, iterations, concurrency) if concurrency else None
+    finally:
+        destroy_database(old_name, verbosity)
+        isolated_cache.disable()
+        teardown_test_environment()
+
+    return {
+        "scale": scale,
+        "iterations": iterations,
+        "cold_cache": cold_cache,
+        "database": connection.vendor,
+        "django": django.get_version(),
+        "python": platform.python_version(),
+        "dataset": dataset,
+        "seed_seconds": round(seed_seconds, 2),
+        "views": results,
+        **({"concurrency": concurrency, "throughput": throughput} if concurrency else {}),
+    }
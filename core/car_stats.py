@@ -0,0 +1,65 @@
+"""
+Denormalized popularity / rating counters on ``Car``.
+
+``booking_count``, ``rating_sum``, ``rating_count`` and ``avg_rating`` are
+kept current with atomic ``F()`` updates from the Booking / Review signal
+handlers in ``core.signals``, so sorting cars by popularity or rating is a
+plain indexed ORDER BY. ``manage.py reconcile_car_stats`` recomputes them.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from . import fragments
+from .models import Booking, Car, Review
+
+AVG_RATING = Case(
+    When(rating_count__gt=0, then=Cast("rating_sum", FloatField()) / F("rating_count")),
+    default=None,
+    output_field=FloatField(),
+)
+
+
+def bump_bookings(car_id, delta):
+    if car_id:
+        Car.objects.filter(pk=car_id).update(booking_count=Greatest(F("booking_count") + delta, 0))
+
+
+def bump_rating(car_id, rating, delta):
+    """Add (``delta=1``) or remove (``delta=-1``) one review of ``rating`` stars."""
+    if not car_id:
+        return
+    cars = Car.objects.filter(pk=car_id)
+    with transaction.atomic():
+        cars.update(
+            rating_sum=Greatest(F("rating_sum") + rating * delta, 0),
+            rating_count=Greatest(F("rating_count") + delta, 0),
+        )
+        # تحديث منفصل: MySQL بيقيّم الـ SET من اليسار لليمين
+        cars.update(avg_rating=AVG_RATING)
+
+
+def _per_car(queryset, aggregate):
+    return Coalesce(
+        Subquery(
+            queryset.filter(car=OuterRef("pk")).order_by().values("car").annotate(v=aggregate).values("v")[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def reconcile(cars=None):
+    """Recompute every counter from the bookings / reviews tables. Returns the number of cars updated."""
+    cars = Car.objects.all() if cars is None else cars
+    reviews = Review.objects.annotate(car=F("booking__car"))
+    with transaction.atomic():
+        updated = cars.update(
+            booking_count=_per_car(Booking.objects.all(), Count("pk")),
+            rating_sum=_per_car(reviews, Sum("rating")),
+            rating_count=_per_car(reviews, Count("pk")),
+        )
+        cars.update(avg_rating=AVG_RATING)
+    # الـ update ما بيطلق signals، فبنفضي كاش القوائم يدوياً
+    fragments.invalidate(fragments.CAR_LISTINGS)
+    return updated
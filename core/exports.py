@@ -0,0 +1,118 @@
+"""
+Row-level Excel export for the admin report.
+
+The workbook is built with openpyxl's ``write_only`` mode: every sheet is
+written row by row to a temporary file while the querysets are read with
+``.iterator()``. The finished file is spooled to disk and streamed back
+with ``FileResponse``, so memory stays flat however many rows are exported.
+"""
+import datetime
+import tempfile
+
+import openpyxl
+from django.http import FileResponse
+from django.utils import timezone
+
+from .models import Booking, Car, Contract, User
+
+CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _excel_datetime(value):
+    # Excel ما بيدعم الـ timezone
+    if value is not None and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _in_range(queryset, field, start_date, end_date):
+    # [start, end + يوم) بدل __date: الـ index على العمود بيضل شغّال
+    if start_date and end_date:
+        queryset = queryset.filter(**{
+            f"{field}__gte": _start_of_day(start_date),
+            f"{field}__lt": _start_of_day(end_date + datetime.timedelta(days=1)),
+        })
+    return queryset
+
+
+def booking_rows(start_date=None, end_date=None):
+    bookings = _in_range(Booking.objects.order_by("pk"), "created_at", start_date, end_date)
+    values = bookings.values_list(
+        "pk", "user__username", "car__name", "car__owner__username", "status",
+        "trip_location", "distance_km", "pickup_date", "pickup_time",
+        "return_date", "return_time", "created_at",
+    )
+    for row in values.iterator(chunk_size=CHUNK_SIZE):
+        yield [*row[:-1], _excel_datetime(row[-1])]
+
+
+def contract_rows(start_date=None, end_date=None):
+    contracts = _in_range(Contract.objects.order_by("pk"), "created_at", start_date, end_date)
+    values = contracts.values_list(
+        "pk", "booking_id", "booking__user__username", "booking__car__owner__username",
+        "booking__car__name", "booking__status", "rental_days", "daily_rate",
+        "total_amount", "created_at",
+    )
+    for row in values.iterator(chunk_size=CHUNK_SIZE):
+        yield [*row[:-1], _excel_datetime(row[-1])]
+
+
+def car_rows(start_date=None, end_date=None):
+    cars = _in_range(Car.objects.order_by("pk"), "created_at", start_date, end_date)
+    values = cars.values_list(
+        "pk", "name", "owner__username", "year", "transmission", "mileage",
+        "price", "is_available", "created_at",
+    )
+    for row in values.iterator(chunk_size=CHUNK_SIZE):
+        yield [*row[:-1], _excel_datetime(row[-1])]
+
+
+def owner_rows(start_date=None, end_date=None):
+    owners = _in_range(User.objects.filter(role=User.Roles.OWNER).order_by("pk"), "date_joined", start_date, end_date)
+    values = owners.values_list(
+        "pk", "username", "email", "phone", "company_name", "is_approved", "is_active", "date_joined",
+    )
+    for row in values.iterator(chunk_size=CHUNK_SIZE):
+        yield [*row[:-1], _excel_datetime(row[-1])]
+
+
+SHEETS = [
+    ("Bookings", ["ID", "Renter", "Car", "Owner", "Status", "Trip", "Distance (km)",
+                  "Pickup Date", "Pickup Time", "Return Date", "Return Time", "Created At"], booking_rows),
+    ("Contracts", ["ID", "Booking", "Renter", "Owner", "Car", "Booking Status",
+                   "Rental Days", "Daily Rate", "Total", "Created At"], contract_rows),
+    ("Cars", ["ID", "Name", "Owner", "Year", "Transmission", "Mileage",
+              "Price", "Available", "Created At"], car_rows),
+    ("Owners", ["ID", "Username", "Email", "Phone", "Company", "Approved",
+                "Active", "Joined"], owner_rows),
+]
+
+
+def admin_report_response(summary_rows, filename, start_date=None, end_date=None):
+    """
+    Build the admin report (summary sheet + one sheet per table) and return
+    it as a streamed attachment.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+
+    ws = wb.create_sheet("Admin Report")
+    ws.append(["Metric", "Value"])
+    for row in summary_rows:
+        ws.append(row)
+
+    for title, header, rows in SHEETS:
+        ws = wb.create_sheet(title)
+        ws.append(header)
+        for row in rows(start_date, end_date):
+            ws.append(row)
+
+    spool = tempfile.TemporaryFile(suffix=".xlsx")
+    wb.save(spool)
+    spool.seek(0)
+    return FileResponse(spool, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
@@ -0,0 +1,89 @@
+"""
+Tag-based cache for rendered HTML fragments.
+
+A fragment is stored under a key that embeds the current version of each of
+its tags. Invalidating a tag just gives it a new version, so every fragment
+rendered under the old one is never read again (and expires on its own)
+without having to know or delete the individual keys. The receivers in
+``core.signals`` invalidate ``CAR_LISTINGS`` whenever a car, booking or
+review changes.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+CAR_LISTINGS = "car-listings"
+
+TIMEOUT = getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 60 * 60)
+
+
+def _tag_key(tag):
+    return f"fragment-tag:{tag}"
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def versions(tags):
+    """Current version of each tag, creating the ones the cache doesn't have."""
+    keys = [_tag_key(tag) for tag in tags]
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+async def aversions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    found = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def _bump(tags):
+    cache.set_many({_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def invalidate(*tags):
+    """Drop every fragment tagged with one of ``tags``."""
+    _bump(tags)
+    # ومرة كمان بعد الـ commit: طلب قرأ البيانات القديمة قبل الـ commit ما بيضل مخزّن
+    transaction.on_commit(lambda: _bump(tags))
+
+
+def _fragment_key(name, params, tag_versions):
+    digest = hashlib.md5(repr(params).encode(), usedforsecurity=False).hexdigest()
+    return f"fragment:{name}:{'.'.join(map(str, tag_versions))}:{digest}"
+
+
+def get_or_render(name, params, tags, render):
+    """
+    Return the cached fragment ``name`` for ``params``, or call ``render()``
+    and cache its result until one of ``tags`` is invalidated.
+    """
+    key = _fragment_key(name, params, versions(tags))
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, TIMEOUT)
+    return mark_safe(html)
+
+
+async def aget_or_render(name, params, tags, render):
+    """``get_or_render()`` with an async ``render``."""
+    key = _fragment_key(name, params, await aversions(tags))
+    html = await cache.aget(key)
+    if html is None:
+        html = await render()
+        await cache.aset(key, html, TIMEOUT)
+    return mark_safe(html)
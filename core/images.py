@@ -0,0 +1,90 @@
+"""
+Resized derivatives of uploaded car photos.
+
+Every ``Car.image`` gets a thumbnail, card and detail rendition in WebP and
+JPEG, stored next to the original (``cars/audi.png`` ->
+``cars/audi.card.webp``, ``cars/audi.card.jpg`` ...). They are generated when
+the image is saved (see ``core.signals``) and by ``manage.py
+regenerate_images`` for existing files; the ``car_picture`` template tag
+serves them with ``srcset`` so a listing card downloads a ~640px image
+instead of the multi-megabyte upload.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# الاسم -> العرض بالبكسل (الارتفاع بيتناسب، وما منكبّر الصور الصغيرة)
+SIZES = getattr(settings, "IMAGE_DERIVATIVE_SIZES", {"thumb": 320, "card": 640, "detail": 1280})
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+QUALITY = getattr(settings, "IMAGE_DERIVATIVE_QUALITY", 80)
+# الكروت خلفيتها بيضا، فالشفافية بتتعبى أبيض بالـ JPEG
+BACKGROUND = (255, 255, 255)
+
+
+def derivative_name(name, size, ext):
+    root, _ = os.path.splitext(name)
+    return f"{root}.{size}.{ext}"
+
+
+def derivative_names(name):
+    return [derivative_name(name, size, ext) for size in SIZES for ext in FORMATS]
+
+
+def _flatten(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        flat = Image.new("RGB", image.size, BACKGROUND)
+        flat.paste(image, mask=image.getchannel("A"))
+        return flat
+    return image.convert("RGB")
+
+
+def _render(image, width, fmt):
+    copy = image.copy()
+    if copy.width > width:
+        copy = copy.resize((width, round(copy.height * width / copy.width)), Image.LANCZOS)
+    out = BytesIO()
+    if fmt == "JPEG":
+        _flatten(copy).save(out, fmt, quality=QUALITY, optimize=True, progressive=True)
+    else:
+        copy.save(out, fmt, quality=QUALITY, method=4)
+    return out.getvalue()
+
+
+def generate(field_file):
+    """Write every derivative of ``field_file`` (an ``ImageFieldFile``). Returns the stored names."""
+    storage = field_file.storage
+    with field_file.open("rb") as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.mode in ("LA", "P") else "RGB")
+
+    written = []
+    for size, width in SIZES.items():
+        for ext, fmt in FORMATS.items():
+            name = derivative_name(field_file.name, size, ext)
+            if storage.exists(name):
+                storage.delete(name)
+            written.append(storage.save(name, ContentFile(_render(image, width, fmt))))
+    return written
+
+
+def delete(name, storage):
+    """Remove the derivatives of the image stored as ``name``."""
+    for derived in derivative_names(name):
+        if storage.exists(derived):
+            storage.delete(derived)
+
+
+def urls(field_file, ext):
+    """``{size: url}`` of the ``ext`` derivatives of ``field_file``."""
+    storage = field_file.storage
+    return {size: storage.url(derivative_name(field_file.name, size, ext)) for size in SIZES}
+
+
+def srcset(field_file, ext):
+    return ", ".join(f"{url} {SIZES[size]}w" for size, url in urls(field_file, ext).items())
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main views against a throwaway database of the given scale and print the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=int, default=1000, help="Number of cars (and bookings) to generate.")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per view.")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per view before measuring.")
+        parser.add_argument(
+            "--views", nargs="+", choices=benchmark.VIEWS, default=benchmark.VIEWS, help="Views to benchmark."
+        )
+        parser.add_argument("--cold-cache", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument(
+            "--concurrency", type=int, default=0,
+            help="Also fire --iterations requests this many at a time at the async views under WSGI and ASGI.",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["scale"] < 1 or options["iterations"] < 1 or options["concurrency"] < 0:
+            raise CommandError("--scale and --iterations must be positive, --concurrency can't be negative.")
+        report = benchmark.run(
+            options["scale"],
+            views=options["views"],
+            iterations=options["iterations"],
+            warmup=options["warmup"],
+            cold_cache=options["cold_cache"],
+            concurrency=options["concurrency"],
+            verbosity=max(options["verbosity"] - 1, 0),
+        )
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}."))
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import occupancy
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-car occupancy index used by the availability search."
+
+    def handle(self, *args, **options):
+        rows = occupancy.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} occupied car-day(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily rollup rows used by the admin dashboard and exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--metric",
+            action="append",
+            choices=rollups.METRICS,
+            help="Only rebuild this metric (can be repeated). Defaults to all metrics.",
+        )
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(options["metric"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily rollups ({written} rows)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import car_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the booking and rating counters stored on every car."
+
+    def handle(self, *args, **options):
+        updated = car_stats.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled stats for {updated} car(s)."))
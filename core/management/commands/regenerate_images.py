@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Car
+from core.signals import sync_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Build the thumbnail / card / detail derivatives of existing car images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild derivatives that already exist.")
+
+    def handle(self, *args, **options):
+        cars = Car.objects.exclude(image="").exclude(image__isnull=True).only("pk", "image", "image_derived")
+        done = failed = 0
+        for car in cars.iterator(chunk_size=200):
+            if options["force"]:
+                car.image_derived = ""
+            sync_image_derivatives(car)
+            if car.has_image_derivatives:
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f"  Could not read {car.image.name} (car #{car.pk})")
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {done} car image(s), {failed} failed."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails of the outbox over one reused SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=outbox.BATCH_SIZE, help="Messages claimed per batch.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling the outbox instead of exiting when it is empty.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = outbox.send_pending(batch_size=options["batch_size"])
+            sent, failed = len(result["sent"]), len(result["failed"])
+            if sent or failed or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed."))
+                for message in result["failed"]:
+                    self.stderr.write(f"  #{message.pk} {', '.join(message.recipients)}: {message.last_error}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
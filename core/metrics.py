@@ -0,0 +1,267 @@
+"""
+Application metrics in the Prometheus text format.
+
+Every process keeps its own registry in memory (one lock, so any number of
+worker threads can update it) and writes it to its own JSON file in
+``METRICS_DIR`` at most every ``METRICS_FLUSH_INTERVAL`` seconds. The
+``metrics`` view adds up the files of all the workers, so a scrape gives the
+same totals whichever worker answers it. Files of stopped workers are kept
+(their counts still belong to the totals); clear the directory on deploy,
+when the counters restart anyway.
+
+``MetricsMiddleware`` records the latency of every request by ``core.urls``
+route name and status code, and its number of database queries. The
+business counters are bumped where the events happen: ``core.signals``
+(bookings), ``core.outbox`` (emails) and ``core.payments`` (Stripe sessions).
+"""
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram", "Request latency by core.urls route name and status code.", LATENCY_BUCKETS,
+    ),
+    "http_request_queries": ("histogram", "Database queries per request by route name.", QUERY_BUCKETS),
+    "bookings_total": ("counter", "Booking lifecycle events (created, approved, rejected, paid).", None),
+    "emails_sent_total": ("counter", "Emails delivered from the outbox.", None),
+    "stripe_checkout_sessions_total": ("counter", "Stripe Checkout Sessions created.", None),
+}
+
+
+def _directory():
+    return getattr(settings, "METRICS_DIR", os.path.join(settings.BASE_DIR, "metrics"))
+
+
+def _flush_interval():
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """The counters and histograms of this process."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # الكتابة على الملف بقفل لحالها: inc/observe ما بيستنوا الـ I/O
+        self._flush_lock = threading.Lock()
+        # pid + random: ملف جديد حتى لو النظام رجّع نفس الـ pid لعملية جديدة
+        self.filename = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count over the last bucket, sum]
+        self._flushed_at = 0.0
+        self._timer = None
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            due = self._changed()
+        if due:
+            self.flush()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(buckets) + 1) + [0]
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+            due = self._changed()
+        if due:
+            self.flush()
+
+    def _changed(self):
+        """True when the caller should flush now (called with ``_lock`` held)."""
+        interval = _flush_interval()
+        now = time.monotonic()
+        if now - self._flushed_at >= interval:
+            self._flushed_at = now  # باقي الـ threads ما بيكتبوا كمان مرة بنفس اللحظة
+            return True
+        if self._timer is None:
+            # ولا تحديث بيضل بالذاكرة أكتر من interval، حتى لو الـ worker صار فاضي
+            self._timer = threading.Timer(interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        return False
+
+    def flush(self):
+        # الـ snapshot تحت _lock والكتابة برّاه؛ _flush_lock بيخلي آخر snapshot هو آخر ملف
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                self._flushed_at = time.monotonic()
+                data = self._dump()
+            self._write(data)
+
+    def _write(self, data):
+        directory = _directory()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)  # اللي بيقرأ ما بيشوف ملف نصه مكتوب
+
+    def _dump(self):
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+            "histograms": [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return self._dump()
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+# worker بيعمل fork بعد الـ import (gunicorn --preload): سجل فاضي وملف خاص فيه
+os.register_at_fork(after_in_child=REGISTRY._reset)
+
+
+def _merge(dump, counters, histograms):
+    for name, labels, value in dump["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in dump["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(values)
+        elif len(total) == len(values):  # ملف من قبل ما تتغير الـ buckets ما بينجمع
+            histograms[key] = [a + b for a, b in zip(total, values)]
+
+
+def collect():
+    """``(counters, histograms)`` summed over every worker's file and this process's live registry."""
+    counters, histograms = {}, {}
+    directory = _directory()
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    for filename in names:
+        if not filename.endswith(".json") or filename == REGISTRY.filename:
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                _merge(json.load(f), counters, histograms)
+        except (OSError, ValueError):
+            continue  # worker بيكتب ملفه هلق، أو ملف تالف
+    _merge(REGISTRY.snapshot(), counters, histograms)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (0.0.4)."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), values):
+                cumulative += count
+                le = bound if bound == "+Inf" else float(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _route(request):
+    match = request.resolver_match
+    if match is None:
+        return "(unresolved)"
+    # الـ admin وغيره: اسم الـ namespace بس، عشان ما يكتر عدد الـ labels
+    return match.namespaces[0] if match.namespaces else match.url_name or "(unnamed)"
+
+
+def _counting(queries):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(queries))
+    return stack
+
+
+def _observe_request(request, response, elapsed, queries):
+    route = _route(request)
+    observe("http_request_duration_seconds", elapsed, route=route, status=response.status_code)
+    observe("http_request_queries", queries.count, route=route)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        with _counting(queries):
+            response = self.get_response(request)
+        _observe_request(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        # الـ connections لكل thread، والـ ORM بالـ async views بيشتغل بـ thread الـ sync_to_async
+        counting = await sync_to_async(_counting)(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counting.close)()
+        _observe_request(request, response, time.perf_counter() - started, queries)
+        return response
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:18
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    """Fill the new columns from the current car price, BATCH_SIZE contracts at a time."""
+    Contract = apps.get_model("core", "Contract")
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Contract.objects.filter(pk__gt=last_pk, daily_rate__isnull=True)
+            .select_related("booking__car")
+            .order_by("pk")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for contract in batch:
+            booking = contract.booking
+            contract.daily_rate = booking.car.price if booking.car_id else Decimal("0")
+            contract.rental_days = (booking.return_date - booking.pickup_date).days or 1
+            contract.total_amount = contract.daily_rate * contract.rental_days
+
+        Contract.objects.bulk_update(batch, ["daily_rate", "rental_days", "total_amount"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contract',
+            name='daily_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='contract',
+            name='rental_days',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contract',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['created_at', 'total_amount'], name='contract_created_amount_idx'),
+        ),
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+    ]
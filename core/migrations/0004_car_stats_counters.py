@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:20
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_car_stats(apps, schema_editor):
+    Car = apps.get_model("core", "Car")
+    Booking = apps.get_model("core", "Booking")
+    Review = apps.get_model("core", "Review")
+
+    def per_car(queryset, aggregate):
+        return Coalesce(
+            Subquery(
+                queryset.filter(car=OuterRef("pk")).order_by().values("car").annotate(v=aggregate).values("v")[:1],
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    reviews = Review.objects.annotate(car=F("booking__car"))
+    Car.objects.update(
+        booking_count=per_car(Booking.objects.all(), Count("pk")),
+        rating_sum=per_car(reviews, Sum("rating")),
+        rating_count=per_car(reviews, Count("pk")),
+    )
+    Car.objects.update(
+        avg_rating=Case(
+            When(rating_count__gt=0, then=Cast("rating_sum", FloatField()) / F("rating_count")),
+            default=None,
+            output_field=FloatField(),
+        )
+    )
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_contract_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='avg_rating',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='booking_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['booking_count'], name='car_booking_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['avg_rating'], name='car_avg_rating_idx'),
+        ),
+        migrations.RunPython(backfill_car_stats, migrations.RunPython.noop),
+    ]
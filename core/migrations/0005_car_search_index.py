@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:21
+
+import django.db.models.deletion
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def build_search_index(apps, schema_editor):
+    """Same tokens as core.search.car_tokens, frozen for this migration."""
+    Car = apps.get_model("core", "Car")
+    CarSearchToken = apps.get_model("core", "CarSearchToken")
+    labels = {"AUTO": "Automatic", "MANUAL": "Manual"}
+
+    def tokenize(text):
+        return [w[:64] for w in re.findall(r"\w+", str(text or "").lower())]
+
+    last_pk = 0
+    while True:
+        batch = list(Car.objects.filter(pk__gt=last_pk).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        rows = []
+        for car in batch:
+            tokens = dict.fromkeys(tokenize(car.name), 3)
+            for token in tokenize(f"{car.year} {car.transmission} {labels.get(car.transmission, '')}"):
+                tokens.setdefault(token, 1)
+            rows += [CarSearchToken(car_id=car.pk, token=t, weight=w) for t, w in tokens.items()]
+        CarSearchToken.objects.bulk_create(rows)
+        last_pk = batch[-1].pk
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_car_stats_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['transmission', 'year'], name='car_transmission_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['year'], name='car_year_idx'),
+        ),
+        migrations.AddField(
+            model_name='carsearchtoken',
+            name='car',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.car'),
+        ),
+        migrations.AddConstraint(
+            model_name='carsearchtoken',
+            constraint=models.UniqueConstraint(fields=('token', 'car'), name='unique_car_search_token'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
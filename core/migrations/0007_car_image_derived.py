@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='image_derived',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:55
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+# نفس BLOCKING_STATUSES وقت هالـ migration
+BLOCKING_STATUSES = ["pending", "approved", "awaiting_contract", "paid"]
+
+
+def build_occupancy(apps, schema_editor):
+    """Same rows as core.occupancy.rebuild, frozen for this migration."""
+    Booking = apps.get_model("core", "Booking")
+    CarOccupancy = apps.get_model("core", "CarOccupancy")
+    today = timezone.localdate()
+
+    rows = set()
+    periods = Booking.objects.filter(status__in=BLOCKING_STATUSES, return_date__gte=today).values_list(
+        "car_id", "pickup_date", "return_date"
+    )
+    for car_id, pickup, ret in periods.iterator(chunk_size=BATCH_SIZE):
+        day = max(pickup, today)
+        while day <= ret:
+            rows.add((car_id, day))
+            day += datetime.timedelta(days=1)
+    CarOccupancy.objects.bulk_create(
+        [CarOccupancy(car_id=car_id, day=day) for car_id, day in rows], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_booking_checkout_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.car')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'car'), name='unique_car_occupancy_day')],
+            },
+        ),
+        migrations.RunPython(build_occupancy, migrations.RunPython.noop),
+    ]
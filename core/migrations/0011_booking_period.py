@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def fill_periods(apps, schema_editor):
+    """Same values as Booking.period(), frozen for this migration, one batch of pks at a time."""
+    Booking = apps.get_model("core", "Booking")
+    last_pk = 0
+    while True:
+        batch = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pickup_date", "pickup_time", "return_date", "return_time")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for booking in batch:
+            booking.pickup_at = timezone.make_aware(
+                datetime.datetime.combine(booking.pickup_date, booking.pickup_time)
+            )
+            booking.return_at = timezone.make_aware(
+                datetime.datetime.combine(booking.return_date, booking.return_time or datetime.time.max)
+            )
+        Booking.objects.bulk_update(batch, ["pickup_at", "return_at"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_car_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='pickup_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='return_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_periods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='pickup_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='return_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_car_dates_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['car', 'return_at', 'pickup_at'], name='booking_car_period_idx'),
+        ),
+    ]
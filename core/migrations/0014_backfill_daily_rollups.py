@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:40
+
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    """Same rows as ``manage.py rebuild_rollups``: the signals only keep existing rollups current."""
+    from core import rollups
+
+    rollups.rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_slow_query'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
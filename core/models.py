@@ -1,13 +1,52 @@
+import datetime
+from decimal import Decimal
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.utils import timezone
 from django.conf import settings
 
 
+# =====================
+# Rollup tracking (core.rollups)
+# =====================
+class RollupTracked:
+    """
+    Remembers the ``ROLLUP_FIELDS`` (attnames) a row was loaded with.
+
+    ``core.rollups`` moves a saved or deleted row's counts from these values
+    to the current ones without reading the row again. Only ``from_db`` and
+    ``refresh_from_db`` capture them, so new instances cost nothing.
+    """
+    ROLLUP_FIELDS = ()
+    _rollup_values = None  # None لصف جديد
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rollup_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # حقل deferred انقرأ هلق: ما نلمس القيم اللي انقرأت قبل (ممكن تكون تغيّرت بالذاكرة)
+        self.remember_rollup_values(None if fields is None else {self._meta.get_field(f).attname for f in fields})
+
+    def remember_rollup_values(self, names=None):
+        values = dict(self._rollup_values or {})
+        for name in self.ROLLUP_FIELDS:
+            if name in self.__dict__ and (names is None or name in names):
+                values[name] = self.__dict__[name]
+        self._rollup_values = values
+
+
 # =====================
 # Custom User Model
 # =====================
-class User(AbstractUser):
+class User(RollupTracked, AbstractUser):
+    ROLLUP_FIELDS = ("date_joined", "role")
+
     class Roles(models.TextChoices):
         USER = "user", "User"
         OWNER = "owner", "Owner"
@@ -30,11 +69,19 @@ class User(AbstractUser):
     def is_admin(self):
         return self.role == self.Roles.ADMIN
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # قائمة الشركات والصفحة الرئيسية: owners المعتمدين
+            models.Index(fields=["role", "is_approved"], name="user_role_approved_idx"),
+        ]
+
 
 # =====================
 # Car Model
 # =====================
-class Car(models.Model):
+class Car(RollupTracked, models.Model):
+    ROLLUP_FIELDS = ("created_at", "is_available")
+
     TRANSMISSION_CHOICES = [
         ("AUTO", "Automatic"),
         ("MANUAL", "Manual"),
@@ -54,34 +101,119 @@ class Car(models.Model):
     mileage = models.CharField(max_length=50)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to="cars/", blank=True, null=True)
+    # اسم الصورة اللي انعملتلها نسخ مصغّرة (core.images)؛ إذا ما طابق image.name بنعرض الأصل
+    image_derived = models.CharField(max_length=255, blank=True, editable=False)
     description = models.TextField(blank=True)
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # عدادات محفوظة للترتيب السريع (core.car_stats) بدل COUNT/AVG على الحجوزات
+    booking_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.year})"
 
+    @property
+    def has_image_derivatives(self):
+        return bool(self.image) and self.image_derived == self.image.name
+
     class Meta:
         ordering = ["-year", "name"]
+        indexes = [
+            models.Index(fields=["booking_count"], name="car_booking_count_idx"),
+            models.Index(fields=["avg_rating"], name="car_avg_rating_idx"),
+            models.Index(fields=["transmission", "year"], name="car_transmission_year_idx"),
+            models.Index(fields=["year"], name="car_year_idx"),
+            # الاستعلامات بتفلتر بـ is_available__in=[True]: على SQLite الـ =True بتنكتب
+            # WHERE "is_available" لحالها وما بتعمل seek على هاد الـ index
+            models.Index(fields=["is_available", "price"], name="car_available_price_idx"),
+        ]
+
+
+# =====================
+# Car Search Index (core.search)
+# =====================
+class CarSearchToken(models.Model):
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name="search_tokens")
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.token} → {self.car_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["token", "car"], name="unique_car_search_token"),
+        ]
+
+
+# =====================
+# Car Occupancy Index (core.occupancy)
+# =====================
+class CarOccupancy(models.Model):
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name="occupancy")
+    day = models.DateField()
+
+    def __str__(self):
+        return f"{self.car_id} @ {self.day}"
+
+    class Meta:
+        constraints = [
+            # day أول: البحث بمدى تواريخ بيقرأ الـ index بس (بدون الجدول)
+            models.UniqueConstraint(fields=["day", "car"], name="unique_car_occupancy_day"),
+        ]
 
 
 # =====================
 # Booking Model
 # =====================
-class Booking(models.Model):
+# بيطلع بعد كل تغيير حالة عبر Booking.transition_to(): sender=Booking, booking, old_status, new_status
+booking_status_changed = Signal()
+
+
+class InvalidTransition(Exception):
+    """Raised when a booking can't move to the requested status."""
+
+
+class Booking(RollupTracked, models.Model):
+    ROLLUP_FIELDS = ("created_at", "status", "user_id")
+
     STATUS_PENDING = "pending"
     STATUS_APPROVED = "approved"
     STATUS_REJECTED = "rejected"
     STATUS_PAID = "paid"
+    STATUS_AWAITING_CONTRACT = "awaiting_contract"
 
     STATUS_CHOICES = [
         (STATUS_PENDING, "Pending"),
         (STATUS_APPROVED, "Approved"),
         (STATUS_REJECTED, "Rejected"),
         (STATUS_PAID, "Paid"),
+        (STATUS_AWAITING_CONTRACT, "Awaiting contract"),
     ]
 
+    # الحالات المسموح ننتقل لها من كل حالة (transition_to)
+    TRANSITIONS = {
+        STATUS_PENDING: {STATUS_APPROVED, STATUS_REJECTED},
+        STATUS_APPROVED: {STATUS_AWAITING_CONTRACT, STATUS_REJECTED},
+        STATUS_AWAITING_CONTRACT: {STATUS_PAID, STATUS_REJECTED},
+        STATUS_PAID: set(),
+        STATUS_REJECTED: set(),
+    }
+
+    # الحالات اللي بتحجز السيارة فعلياً (المرفوض ما بيحجز)
+    BLOCKING_STATUSES = [
+        STATUS_PENDING,
+        STATUS_APPROVED,
+        STATUS_AWAITING_CONTRACT,
+        STATUS_PAID,
+    ]
+    # الأجزاء اللي بتنحسب منها pickup_at / return_at
+    PERIOD_FIELDS = {"pickup_date", "pickup_time", "return_date", "return_time"}
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -106,19 +238,91 @@ class Booking(models.Model):
     pickup_time = models.TimeField()
     return_date = models.DateField()  # تاريخ الإرجاع الجديد
     return_time = models.TimeField(null=True, blank=True)
+    # نفس الفترة كـ datetime (بتنحسب بـ save()): فحص التعارض مقارنة وحدة على مدى
+    pickup_at = models.DateTimeField(editable=False)
+    return_at = models.DateTimeField(editable=False)
     special_request = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
     created_at = models.DateTimeField(default=timezone.now)
 
+    # آخر جلسة Stripe Checkout مفتوحة للحجز (core.payments بيرجعها لحد ما تنتهي)
+    checkout_session_id = models.CharField(max_length=255, blank=True, editable=False)
+    checkout_url = models.TextField(blank=True, editable=False)
+    checkout_amount = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    checkout_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # الحالة زي ما انقرأت من القاعدة (None لحجز جديد)
+    _loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or "status" in fields:
+            self._loaded_status = self.status
+
+    def can_transition(self, status):
+        return status in self.TRANSITIONS.get(self._loaded_status, ())
+
+    def transition_to(self, status):
+        """
+        Move the booking to ``status``, writing only that column.
+
+        The ``UPDATE`` is conditional on the status the booking was loaded
+        with, so no re-fetch is needed and a concurrent change makes it fail
+        instead of being overwritten. Raises ``InvalidTransition`` when
+        ``status`` isn't reachable from the loaded status or the row has
+        moved on since. ``.update()`` skips ``post_save``, so everything that
+        depends on the status listens to ``booking_status_changed`` instead.
+        """
+        old_status = self._loaded_status
+        if not self.can_transition(status):
+            raise InvalidTransition(f"Booking #{self.pk} can't go from {old_status!r} to {status!r}.")
+        with transaction.atomic():
+            if not Booking.objects.filter(pk=self.pk, status=old_status).update(status=status):
+                raise InvalidTransition(f"Booking #{self.pk} is no longer {old_status!r}.")
+            self.status = self._loaded_status = status
+            booking_status_changed.send(sender=Booking, booking=self, old_status=old_status, new_status=status)
+
+    @staticmethod
+    def period(pickup_date, pickup_time, return_date, return_time):
+        """``(pickup_at, return_at)`` for the given parts; no return time means the end of the return day."""
+        return (
+            timezone.make_aware(datetime.datetime.combine(pickup_date, pickup_time)),
+            timezone.make_aware(datetime.datetime.combine(return_date, return_time or datetime.time.max)),
+        )
+
     @property
     def rental_days(self):
         return (self.return_date - self.pickup_date).days
 
+    def save(self, *args, **kwargs):
+        self.pickup_at, self.return_at = self.period(
+            self.pickup_date, self.pickup_time, self.return_date, self.return_time
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & self.PERIOD_FIELDS:
+            kwargs["update_fields"] = {*update_fields, "pickup_at", "return_at"}
+        super().save(*args, **kwargs)
+        if update_fields is None or "status" in update_fields:
+            self._loaded_status = self.status
+
     def __str__(self):
         return f"Booking #{self.pk} - {self.user} → {self.car}"
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # فحص التعارض (core.bookings.overlap_filter): car + range على return_at
+            models.Index(fields=["car", "return_at", "pickup_at"], name="booking_car_period_idx"),
+            models.Index(fields=["status", "created_at"], name="booking_status_created_idx"),
+            # profile / my_bookings: حجوزات المستخدم الأحدث أولاً
+            models.Index(fields=["user", "created_at"], name="booking_user_created_idx"),
+        ]
 
 
 
@@ -138,14 +342,33 @@ class OwnerProfile(models.Model):
 # Contract
 # =====================
 
-class Contract(models.Model):
+class Contract(RollupTracked, models.Model):
+    ROLLUP_FIELDS = ("created_at", "total_amount")
+
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name="contract")
     created_at = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
 
+    # نسخة ثابتة من السعر وقت إنشاء العقد (ما بتتغير لو المالك عدّل سعر السيارة)
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    rental_days = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def snapshot_price(self):
+        """Copy the car's current daily rate and the rental length onto the contract."""
+        car = self.booking.car
+        self.daily_rate = car.price if car else Decimal("0")
+        self.rental_days = self.booking.rental_days or 1  # نفس اللي بندفعه في Stripe
+        self.total_amount = self.daily_rate * self.rental_days
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.daily_rate is None:
+            self.snapshot_price()
+        super().save(*args, **kwargs)
+
     @property
     def total_price(self):
-        return self.booking.rental_days * self.booking.car.price
+        return self.total_amount
 
     @property
     def owner_company(self):
@@ -155,11 +378,117 @@ class Contract(models.Model):
 
     def __str__(self):
         return f"Contract for Booking #{self.booking.id}"
-    
 
-class Review(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "total_amount"], name="contract_created_amount_idx"),
+        ]
+
+
+class Review(RollupTracked, models.Model):
+    ROLLUP_FIELDS = ("created_at", "rating")
+
     booking = models.OneToOneField('Booking', on_delete=models.CASCADE, related_name='review')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     rating = models.IntegerField(default=5)  # من 1 لـ 5
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+# =====================
+# Daily Rollups (تجميعات يومية للـ Dashboard)
+# =====================
+class DailyRollup(models.Model):
+    METRIC_USERS = "users"                      # status = role
+    METRIC_CARS = "cars"                        # status = available / unavailable
+    METRIC_BOOKINGS = "bookings"                # status = booking status
+    METRIC_RENTER_BOOKINGS = "renter_bookings"  # status = booking status, subject = renter id
+    METRIC_PAYMENTS = "payments"                # subject = owner id, amount = paid total
+    METRIC_REVIEWS = "reviews"                  # amount = sum of ratings
+
+    day = models.DateField()
+    metric = models.CharField(max_length=32)
+    status = models.CharField(max_length=20, blank=True, default="")
+    subject_id = models.PositiveBigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.metric}/{self.status or '-'}: {self.count}"
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "day", "status", "subject_id"],
+                name="unique_daily_rollup",
+            ),
+        ]
+
+
+# =====================
+# Email Outbox (core.outbox)
+# =====================
+class EmailOutbox(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)} ({self.status})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+
+# =====================
+# Slow Queries (core.profiler)
+# =====================
+class SlowQuery(models.Model):
+    """One row per (URL name, query fingerprint), accumulated over every sampled slow run."""
+
+    url_name = models.CharField(max_length=200)
+    fingerprint = models.CharField(max_length=40)
+    statement = models.TextField()  # الـ SQL بعد ما شلنا القيم (core.profiler.normalize)
+    sample = models.TextField()  # أبطأ نسخة فعلية (مع placeholders، بدون params)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+    def __str__(self):
+        return f"{self.url_name}: {self.statement[:80]}"
+
+    class Meta:
+        ordering = ["-total_ms"]
+        constraints = [
+            models.UniqueConstraint(fields=["url_name", "fingerprint"], name="unique_slow_query_per_url"),
+        ]
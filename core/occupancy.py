@@ -0,0 +1,100 @@
+"""
+Per-car occupancy index for date-range availability search.
+
+``CarOccupancy`` holds one row per (day, car) that a blocking booking touches
+(the local days from ``pickup_at`` up to ``return_at``). "Which cars are free
+from A to B" then becomes an anti-join against an index range scan on
+``day``, instead of running the overlap query for every car: a car with a row
+strictly inside the period is busy, and only the cars with a row on the first
+or last day go through the exact overlap check of ``core.bookings``. Only
+today and later days are kept: the Booking signals in ``core.signals``
+re-sync a car's future rows when one of its bookings changes, and
+``manage.py rebuild_occupancy`` rebuilds the whole table (dropping past
+days).
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .bookings import overlap_filter
+from .models import Booking, Car, CarOccupancy
+
+ONE_DAY = datetime.timedelta(days=1)
+
+# الحقول اللي لو تغيّرت لازم نعيد حساب أيام السيارة
+TRACKED_FIELDS = {"car", "car_id", "status", "pickup_at", "return_at"}
+
+
+def _first_day(pickup_at):
+    return timezone.localtime(pickup_at).date()
+
+
+def _last_day(return_at):
+    # الفترة مفتوحة من آخرها: حجز بيرجع 00:00 ما بيلمس هداك اليوم
+    return timezone.localtime(return_at - datetime.timedelta(microseconds=1)).date()
+
+
+def _days(periods, start):
+    days = set()
+    for pickup_at, return_at in periods:
+        day, last = max(_first_day(pickup_at), start), _last_day(return_at)
+        while day <= last:
+            days.add(day)
+            day += ONE_DAY
+    return days
+
+
+def _blocking(today):
+    start = timezone.make_aware(datetime.datetime.combine(today, datetime.time.min))
+    return Booking.objects.filter(overlap_filter(start))
+
+
+def refresh_car(car_id):
+    """Bring the future occupancy rows of ``car_id`` in line with its bookings."""
+    today = timezone.localdate()
+    wanted = _days(_blocking(today).filter(car_id=car_id).values_list("pickup_at", "return_at"), today)
+    stored = set(CarOccupancy.objects.filter(car_id=car_id, day__gte=today).values_list("day", flat=True))
+
+    if stale := stored - wanted:
+        CarOccupancy.objects.filter(car_id=car_id, day__in=stale).delete()
+    if missing := wanted - stored:
+        # refresh متزامن لنفس السيارة ممكن يكون ضاف نفس اليوم
+        CarOccupancy.objects.bulk_create(
+            [CarOccupancy(car_id=car_id, day=day) for day in sorted(missing)], ignore_conflicts=True
+        )
+
+
+def rebuild(batch_size=1000):
+    """Rebuild the occupancy of every car from the blocking bookings. Returns the number of rows."""
+    today = timezone.localdate()
+    rows = set()
+    periods = _blocking(today).values_list("car_id", "pickup_at", "return_at")
+    for car_id, pickup, ret in periods.iterator(chunk_size=batch_size):
+        rows.update((car_id, day) for day in _days([(pickup, ret)], today))
+
+    with transaction.atomic():
+        CarOccupancy.objects.all().delete()
+        CarOccupancy.objects.bulk_create(
+            [CarOccupancy(car_id=car_id, day=day) for car_id, day in rows], batch_size=batch_size
+        )
+    return len(rows)
+
+
+def busy_cars(pickup_at, return_at):
+    """Subqueries of the ids of cars booked somewhere in ``pickup_at`` → ``return_at``."""
+    first, last = _first_day(pickup_at), _last_day(return_at)
+    # يوم كامل جوّا الفترة: أي حجز عليه بيعارض أكيد
+    inside = CarOccupancy.objects.filter(day__gt=first, day__lt=last).values("car_id")
+    # أول وآخر يوم: بيعارض بس إذا تقاطع بالوقت
+    edges = Booking.objects.filter(
+        overlap_filter(pickup_at, return_at),
+        car_id__in=CarOccupancy.objects.filter(day__in={first, last}).values("car_id"),
+    ).values("car_id")
+    return inside, edges
+
+
+def available_cars(pickup_at, return_at):
+    """Available cars with no booking in ``pickup_at`` → ``return_at``."""
+    inside, edges = busy_cars(pickup_at, return_at)
+    return Car.objects.filter(is_available__in=[True]).exclude(pk__in=inside).exclude(pk__in=edges)
@@ -0,0 +1,199 @@
+"""
+Durable email outbox.
+
+Views and admin actions call ``enqueue()`` instead of ``send_mail()``: it is
+one INSERT, so no request waits on an SMTP handshake. ``manage.py
+send_outbox`` drains the table in batches over a single reused SMTP
+connection, retrying failed messages with exponential backoff until
+``OUTBOX_MAX_ATTEMPTS`` is reached.
+
+Bulk notifications that should go out immediately (the owner approval admin
+action) use ``send_now()``: one connection for the whole batch, and whatever
+fails is stored as pending for the worker.
+"""
+import datetime
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics
+from .models import EmailOutbox
+
+BATCH_SIZE = getattr(settings, "OUTBOX_BATCH_SIZE", 50)
+MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+BACKOFF_SECONDS = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 60)
+MAX_BACKOFF_SECONDS = getattr(settings, "OUTBOX_MAX_BACKOFF_SECONDS", 6 * 60 * 60)
+# أخطاء خاصة بالرسالة نفسها: الاتصال لسا صالح وما في داعي نفتحه من جديد
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+# رسائل "sending" أقدم من هيك معناها الـ worker وقع، فبنرجع ناخدها
+LOCK_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+def _row(subject, message, recipient_list, from_email=None):
+    return EmailOutbox(
+        subject=subject[:255],
+        body=message,
+        from_email=from_email or "",
+        recipients=[r for r in recipient_list if r],
+    )
+
+
+def enqueue(subject, message, recipient_list, from_email=None):
+    """Queue one email (same arguments as ``send_mail``). Returns the outbox row."""
+    row = _row(subject, message, recipient_list, from_email)
+    row.save()
+    return row
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS))
+
+
+def claim(batch_size=BATCH_SIZE, ids=None):
+    """Lock up to ``batch_size`` due messages for this worker and return them."""
+    now = timezone.now()
+    due = EmailOutbox.objects.filter(
+        Q(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+        | Q(status=EmailOutbox.STATUS_SENDING, locked_at__lt=now - LOCK_TIMEOUT)
+    )
+    if ids is not None:
+        due = due.filter(pk__in=ids)
+
+    with transaction.atomic():
+        if db_connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due.order_by("next_attempt_at", "pk")[:batch_size])
+        EmailOutbox.objects.filter(pk__in=[m.pk for m in batch]).update(
+            status=EmailOutbox.STATUS_SENDING, locked_at=now
+        )
+    return batch
+
+
+def _deliver(batch, mail_connection):
+    """Send ``batch`` over ``mail_connection``. Returns ``(sent, failed)`` lists of outbox rows."""
+    sent, failed = [], []
+    for message in batch:
+        if not message.recipients:
+            message.last_error = "No recipients."
+            failed.append(message)
+            continue
+        email = EmailMessage(
+            message.subject,
+            message.body,
+            message.from_email or settings.DEFAULT_FROM_EMAIL,
+            message.recipients,
+            connection=mail_connection,
+        )
+        try:
+            mail_connection.send_messages([email])
+        except Exception as e:
+            message.last_error = f"{type(e).__name__}: {e}"
+            failed.append(message)
+            if not isinstance(e, MESSAGE_ERRORS):
+                # الاتصال ممكن يكون انقطع: نسكّره ونفتحه من جديد للرسالة الجاية
+                mail_connection.close()
+                try:
+                    mail_connection.open()
+                except Exception:
+                    pass
+        else:
+            sent.append(message)
+    if sent:
+        metrics.inc("emails_sent_total", len(sent))
+    return sent, failed
+
+
+def _fail(message, now):
+    message.attempts += 1
+    message.locked_at = None
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = EmailOutbox.STATUS_FAILED
+    else:
+        message.status = EmailOutbox.STATUS_PENDING
+        message.next_attempt_at = now + backoff(message.attempts)
+
+
+def _record(sent, failed):
+    now = timezone.now()
+    if sent:
+        EmailOutbox.objects.filter(pk__in=[m.pk for m in sent]).update(
+            status=EmailOutbox.STATUS_SENT, sent_at=now, locked_at=None, last_error=""
+        )
+    for message in failed:
+        _fail(message, now)
+    if failed:
+        EmailOutbox.objects.bulk_update(failed, ["attempts", "locked_at", "status", "next_attempt_at", "last_error"])
+
+
+def send_pending(batch_size=BATCH_SIZE, max_batches=None, ids=None, mail_connection=None):
+    """
+    Drain due messages batch by batch over one SMTP connection.
+
+    Returns ``{"sent": [...], "failed": [...]}`` with the outbox rows of
+    every attempted message (``failed`` holds rows that will be retried
+    or gave up, with ``last_error`` set).
+    """
+    result = {"sent": [], "failed": []}
+    mail_connection = mail_connection or get_connection(fail_silently=False)
+    opened = False
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            batch = claim(batch_size, ids)
+            if not batch:
+                break
+            if not opened:
+                try:
+                    mail_connection.open()
+                except Exception as e:
+                    # الـ SMTP واقف: الدفعة بتفشل بالـ backoff العادي بدل ما تضل "sending" لحد LOCK_TIMEOUT
+                    for message in batch:
+                        message.last_error = f"{type(e).__name__}: {e}"
+                    _record([], batch)
+                    result["failed"] += batch
+                    break
+                opened = True
+            sent, failed = _deliver(batch, mail_connection)
+            _record(sent, failed)
+            result["sent"] += sent
+            result["failed"] += failed
+            batches += 1
+    finally:
+        if opened:
+            mail_connection.close()
+    return result
+
+
+def send_now(messages, mail_connection=None):
+    """
+    Send ``(subject, message, from_email, recipient_list)`` tuples right away
+    over one SMTP connection (like ``send_mass_mail``) and store them with one
+    INSERT: delivered ones as sent, the others as pending so the worker
+    retries them. Returns ``{"sent": [...], "failed": [...]}``.
+    """
+    rows = [_row(subject, body, recipients, from_email) for subject, body, from_email, recipients in messages]
+    mail_connection = mail_connection or get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+    except Exception as e:
+        for row in rows:
+            row.last_error = f"{type(e).__name__}: {e}"
+        sent, failed = [], rows
+    else:
+        try:
+            sent, failed = _deliver(rows, mail_connection)
+        finally:
+            mail_connection.close()
+
+    now = timezone.now()
+    for row in sent:
+        row.status, row.sent_at = EmailOutbox.STATUS_SENT, now
+    for row in failed:
+        _fail(row, now)
+    EmailOutbox.objects.bulk_create(rows)
+    return {"sent": sent, "failed": failed}
+
@@ -0,0 +1,135 @@
+"""
+Keyset (seek) pagination.
+
+Instead of ``OFFSET n`` every page continues from the ordering values of the
+last row of the previous page (``WHERE (year, name, id) < (...)``), so page
+cost stays constant however deep the visitor scrolls. The cursor is an
+opaque URL-safe token holding those values.
+
+The ordering defaults to the queryset / ``Meta.ordering`` (``-year, name``
+for ``Car``, ``-created_at`` for ``Booking``) with ``pk`` appended as a
+tie-breaker so the order is total.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+CURSOR_PARAM = "cursor"
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder بيقص الـ microseconds لـ milliseconds، والـ seek بعدها بينط عن صفوف بنفس الـ millisecond
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.next_query = ""  # الـ query string للصفحة الجاية (بيتعبى من paginate)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if not {"pk", "-pk", "id", "-id"} & set(ordering):
+            ordering.append("pk")
+        self.ordering = ordering
+        self.fields = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+    # -- cursors --------------------------------------------------------
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == "pk" else meta.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name) for name, _ in self.fields]
+        raw = json.dumps(values, cls=_CursorEncoder).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Return the ordering values stored in ``cursor``, or ``None`` if it is invalid."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if len(values) != len(self.fields):
+                return None
+            return [
+                None if value is None else self._field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError, FieldDoesNotExist):
+            return None
+
+    # -- seeking --------------------------------------------------------
+    def _seek(self, values):
+        """
+        ``Q`` selecting the rows after ``values``. NULLs sort as the smallest
+        value (MySQL / SQLite behaviour).
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            if descending:
+                after = Q(pk__in=[]) if value is None else Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True})
+            else:
+                after = Q(**{f"{name}__isnull": False}) if value is None else Q(**{f"{name}__gt": value})
+            condition |= equal & after
+            equal &= Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+        return condition
+
+    def _page_queryset(self, cursor):
+        queryset = self.queryset.order_by(*self.ordering)
+        values = self.decode_cursor(cursor) if cursor else None
+        if values is not None:
+            queryset = queryset.filter(self._seek(values))
+        return queryset[: self.per_page + 1]
+
+    def _page(self, rows):
+        object_list = rows[: self.per_page]
+        next_cursor = self.encode_cursor(object_list[-1]) if len(rows) > self.per_page else None
+        return KeysetPage(object_list, next_cursor)
+
+    def page(self, cursor=None):
+        return self._page(list(self._page_queryset(cursor)))
+
+    async def apage(self, cursor=None):
+        return self._page([row async for row in self._page_queryset(cursor).aiterator()])
+
+
+def _link(request, page):
+    if page.has_next:
+        params = request.GET.copy()
+        params[CURSOR_PARAM] = page.next_cursor
+        page.next_query = params.urlencode()
+    return page
+
+
+def paginate(request, queryset, per_page, ordering=None):
+    """Return the ``KeysetPage`` selected by ``?cursor=`` on ``request``."""
+    return _link(request, KeysetPaginator(queryset, per_page, ordering).page(request.GET.get(CURSOR_PARAM)))
+
+
+async def apaginate(request, queryset, per_page, ordering=None):
+    """``paginate()`` on the async ORM."""
+    return _link(request, await KeysetPaginator(queryset, per_page, ordering).apage(request.GET.get(CURSOR_PARAM)))
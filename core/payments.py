@@ -0,0 +1,127 @@
+"""
+Stripe Checkout sessions for bookings.
+
+Creating a Checkout Session is a full round trip to Stripe, so the open
+session of a booking (id, URL, amount and expiry) is stored on the booking
+and reused while it is still valid: a renter who double-clicks "Pay" or comes
+back from the cancel page is sent to the same session instead of waiting for
+a new one. Creation uses an idempotency key derived from the booking, the
+amount and the session it replaces, so concurrent clicks that both miss the
+stored session still get the same session back from Stripe.
+
+All calls go through one ``StripeClient`` with a pooled keep-alive
+``requests`` session and short connect/read timeouts. ``STRIPE_API_BASE``
+points it at another server (the tests run against a local stub).
+"""
+import datetime
+from functools import lru_cache
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+from .models import Booking
+
+# (connect, read) بالثواني؛ STRIPE_TIMEOUT و STRIPE_MAX_NETWORK_RETRIES بيغيّروهم
+TIMEOUT = (3, 10)
+MAX_NETWORK_RETRIES = 2
+POOL_SIZE = getattr(settings, "STRIPE_POOL_SIZE", 10)
+# جلسة باقيلها أقل من هيك ما منرجعها (ما بيلحق يدفع)
+REUSE_MARGIN = datetime.timedelta(minutes=getattr(settings, "STRIPE_SESSION_REUSE_MARGIN_MINUTES", 10))
+
+StripeError = stripe.StripeError
+
+
+@lru_cache(maxsize=None)
+def _client(api_key, api_base, timeout, max_network_retries):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return stripe.StripeClient(
+        api_key,
+        base_addresses={"api": api_base} if api_base else None,
+        max_network_retries=max_network_retries,
+        http_client=stripe.RequestsClient(timeout=timeout, session=session),
+    )
+
+
+def client():
+    """The shared ``StripeClient`` for the current Stripe settings."""
+    return _client(
+        settings.STRIPE_SECRET_KEY or "",
+        getattr(settings, "STRIPE_API_BASE", None),
+        getattr(settings, "STRIPE_TIMEOUT", TIMEOUT),
+        getattr(settings, "STRIPE_MAX_NETWORK_RETRIES", MAX_NETWORK_RETRIES),
+    )
+
+
+def amount_cents(booking):
+    return int(booking.car.price * (booking.rental_days or 1) * 100)
+
+
+def reusable(booking, amount):
+    """Whether the stored session of ``booking`` can still be paid for ``amount``."""
+    return bool(
+        booking.checkout_session_id
+        and booking.checkout_amount == amount
+        and booking.checkout_expires_at
+        and booking.checkout_expires_at - timezone.now() > REUSE_MARGIN
+    )
+
+
+def idempotency_key(booking, amount):
+    # نفس المفتاح لنفس (الحجز، المبلغ، الجلسة اللي بنبدّلها): الضغطات المتزامنة بترجع نفس الجلسة
+    return f"booking-{booking.pk}-checkout-{amount}-{booking.checkout_session_id or 'new'}"
+
+
+def checkout_url(booking, image_url=None):
+    """
+    URL of an open Checkout Session for ``booking``, reusing the stored one
+    when possible. Raises ``StripeError`` when Stripe can't be reached.
+    """
+    amount = amount_cents(booking)
+    if reusable(booking, amount):
+        return booking.checkout_url
+
+    rental_days = booking.rental_days or 1
+    session = client().v1.checkout.sessions.create(
+        {
+            "mode": "payment",
+            "payment_method_types": ["card"],
+            "line_items": [
+                {
+                    "price_data": {
+                        "currency": "usd",
+                        "product_data": {
+                            "name": f"{booking.car.name} ({rental_days} days)",
+                            "description": f"Trip: {booking.trip_location}",
+                            "images": [image_url] if image_url else [],
+                        },
+                        "unit_amount": amount,  # السعر الكلي
+                    },
+                    "quantity": 1,
+                }
+            ],
+            "metadata": {"booking_id": str(booking.pk), "user_id": str(booking.user_id)},
+            "success_url": f"{settings.DOMAIN}/payment/success/?session_id={{CHECKOUT_SESSION_ID}}&booking={booking.pk}",
+            "cancel_url": f"{settings.DOMAIN}/payment/cancel/?booking={booking.pk}",
+        },
+        {"idempotency_key": idempotency_key(booking, amount)},
+    )
+
+    metrics.inc("stripe_checkout_sessions_total")
+
+    booking.checkout_session_id = session.id
+    booking.checkout_url = session.url
+    booking.checkout_amount = amount
+    booking.checkout_expires_at = datetime.datetime.fromtimestamp(session.expires_at, datetime.timezone.utc)
+    Booking.objects.filter(pk=booking.pk).update(
+        checkout_session_id=booking.checkout_session_id,
+        checkout_url=booking.checkout_url,
+        checkout_amount=booking.checkout_amount,
+        checkout_expires_at=booking.checkout_expires_at,
+    )
+    return booking.checkout_url
@@ -0,0 +1,178 @@
+"""
+Per-request SQL profiler.
+
+``SQLProfilerMiddleware`` is opt-in (``SQL_PROFILER=1`` puts it at the top of
+``MIDDLEWARE``). It wraps every database connection with
+``connection.execute_wrapper`` for the duration of the request and:
+
+* sets ``request.sql_profile`` to the ``QueryRecorder`` (query count, total
+  SQL time and the normalized statements grouped by fingerprint), and adds a
+  ``Server-Timing: sql`` header so the numbers show up in the browser's
+  network panel;
+* samples the queries slower than ``SQL_PROFILER_THRESHOLD_MS`` into
+  ``SlowQuery``, one row per URL name and fingerprint, which the admin lists
+  by total time.
+
+Statements are normalized before fingerprinting (literals, placeholders,
+``IN`` lists and multi-row ``VALUES`` collapsed), so the same query with
+different parameters lands in the same row. Params are never stored.
+"""
+import hashlib
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Case, F, TextField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+_NORMALIZE = [
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"SAVEPOINT \"?\w+\"?"), "SAVEPOINT ?"),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%s|\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\?(?:, \?)*\)"), "(...)"),
+    # INSERT بعدة صفوف: VALUES (...), (...), ... → VALUES (...)
+    (re.compile(r"\(\.\.\.\)(?:, \(\.\.\.\))+"), "(...)"),
+]
+
+
+def normalize(sql):
+    """``sql`` with every literal replaced by ``?`` and lists collapsed."""
+    for pattern, replacement in _NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode()).hexdigest()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that times every query of one request."""
+
+    def __init__(self):
+        self.queries = []  # (sql, duration_ms)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms in self.queries)
+
+    def statements(self, min_ms=0):
+        """``{fingerprint: {"statement", "sample", "count", "total_ms", "max_ms"}}`` of the queries over ``min_ms``."""
+        grouped = {}
+        for sql, ms in self.queries:
+            if ms < min_ms:
+                continue
+            statement = normalize(sql)
+            group = grouped.setdefault(
+                fingerprint(statement),
+                {"statement": statement, "sample": sql, "count": 0, "total_ms": 0, "max_ms": 0},
+            )
+            group["count"] += 1
+            group["total_ms"] += ms
+            if ms > group["max_ms"]:
+                group["max_ms"], group["sample"] = ms, sql
+        return grouped
+
+
+def record_slow(url_name, statements):
+    """Add ``statements`` (``QueryRecorder.statements()``) to the ``SlowQuery`` rows of ``url_name``."""
+    now = timezone.now()
+    for key, s in statements.items():
+        rows = SlowQuery.objects.filter(url_name=url_name, fingerprint=key)
+        # الترتيب مهم: MySQL بينفّذ الـ SET بالترتيب، فلازم sample ينحسب من max_ms القديم قبل ما يتغير
+        changes = dict(
+            count=F("count") + s["count"],
+            total_ms=F("total_ms") + s["total_ms"],
+            # العيّنة = أبطأ نسخة شفناها
+            sample=Case(
+                When(max_ms__lt=s["max_ms"], then=Value(s["sample"])), default=F("sample"), output_field=TextField()
+            ),
+            max_ms=Greatest(F("max_ms"), Value(s["max_ms"])),
+            last_seen=now,
+        )
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    url_name=url_name, fingerprint=key, statement=s["statement"], sample=s["sample"],
+                    count=s["count"], total_ms=s["total_ms"], max_ms=s["max_ms"], last_seen=now,
+                )
+        except IntegrityError:
+            # طلب تاني سبقنا وأنشأ الصف
+            rows.update(**changes)
+
+
+class SQLProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold_ms = getattr(settings, "SQL_PROFILER_THRESHOLD_MS", 100)
+        self.sample_rate = getattr(settings, "SQL_PROFILER_SAMPLE_RATE", 1.0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with self._recording(recorder):
+            response = self.get_response(request)
+        slow = self._finish(request, response, recorder)
+        if slow:
+            record_slow(*slow)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        # الـ connections لكل thread، والـ ORM بالـ async views بيشتغل بـ thread الـ sync_to_async
+        recording = await sync_to_async(self._recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        slow = self._finish(request, response, recorder)
+        if slow:
+            await sync_to_async(record_slow)(*slow)
+        return response
+
+    def _recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def _finish(self, request, response, recorder):
+        """Attach the profile to the request/response; ``(url_name, statements)`` to record, or ``None``."""
+        request.sql_profile = recorder
+        timing = f'sql;dur={recorder.total_ms:.1f};desc="{recorder.count} queries"'
+        if "Server-Timing" in response.headers:
+            timing = f"{response.headers['Server-Timing']}, {timing}"
+        response.headers["Server-Timing"] = timing
+
+        slow = recorder.statements(min_ms=self.threshold_ms)
+        if not slow or random.random() >= self.sample_rate:
+            return None
+        match = request.resolver_match
+        return match.view_name if match else "(unresolved)", slow
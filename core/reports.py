@@ -0,0 +1,113 @@
+"""
+Report metrics shared by the admin dashboard and the Excel / PDF exports.
+
+All KPIs come from the ``DailyRollup`` rows (see ``core.rollups``) with
+conditional aggregation: every scalar KPI is one ``Sum(..., filter=Q(...))``
+in a single query, and each chart series is one more grouped query.
+"""
+from decimal import Decimal
+
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Booking, DailyRollup, User
+
+PROFIT_RATE = Decimal("0.10")
+
+BOOKING_STATUSES = [status for status, _ in Booking.STATUS_CHOICES]
+
+
+def _rollups(start_date=None, end_date=None):
+    rollups = DailyRollup.objects.all()
+    if start_date and end_date:
+        rollups = rollups.filter(day__range=[start_date, end_date])
+    return rollups
+
+
+def _sum(field, metric, status=None):
+    condition = Q(metric=metric)
+    if status is not None:
+        condition &= Q(status=status)
+    return Sum(field, filter=condition)
+
+
+def report_metrics(start_date=None, end_date=None):
+    """
+    Every user, car, booking, payment and review KPI in one query.
+
+    ``start_date``/``end_date`` (both or neither) restrict the report to
+    rows created in that window, like the date filter of the exports.
+    """
+    aggregates = {
+        "total_owners": _sum("count", DailyRollup.METRIC_USERS, User.Roles.OWNER),
+        "total_renters": _sum("count", DailyRollup.METRIC_USERS, User.Roles.USER),
+        "available_cars": _sum("count", DailyRollup.METRIC_CARS, "available"),
+        "unavailable_cars": _sum("count", DailyRollup.METRIC_CARS, "unavailable"),
+        "total_bookings": _sum("count", DailyRollup.METRIC_BOOKINGS),
+        "payments_count": _sum("count", DailyRollup.METRIC_PAYMENTS),
+        "total_payments": _sum("amount", DailyRollup.METRIC_PAYMENTS),
+        "total_reviews": _sum("count", DailyRollup.METRIC_REVIEWS),
+        "rating_sum": _sum("amount", DailyRollup.METRIC_REVIEWS),
+    }
+    for status in BOOKING_STATUSES:
+        aggregates[status] = _sum("count", DailyRollup.METRIC_BOOKINGS, status)
+
+    metrics = {key: value or 0 for key, value in _rollups(start_date, end_date).aggregate(**aggregates).items()}
+
+    metrics["total_users"] = metrics["total_owners"] + metrics["total_renters"]
+    metrics["total_cars"] = metrics["available_cars"] + metrics["unavailable_cars"]
+    metrics["total_payments"] = Decimal(metrics["total_payments"])
+    metrics["profits"] = metrics["total_payments"] * PROFIT_RATE
+    rating_sum = Decimal(metrics.pop("rating_sum"))
+    metrics["avg_rating"] = rating_sum / metrics["total_reviews"] if metrics["total_reviews"] else 0
+    metrics["booking_status_data"] = {status: metrics[status] for status in BOOKING_STATUSES}
+    return metrics
+
+
+def payments_by_month(start_date=None, end_date=None):
+    """``[{"month": date, "count": n, "total": x}]`` of paid contracts, by month."""
+    return list(
+        _rollups(start_date, end_date)
+        .filter(metric=DailyRollup.METRIC_PAYMENTS)
+        .annotate(month=TruncMonth("day"))
+        .values("month")
+        .annotate(count=Sum("count"), total=Sum("amount"))
+        .order_by("month")
+    )
+
+
+def _username():
+    return Subquery(User.objects.filter(pk=OuterRef("subject_id")).values("username")[:1])
+
+
+def owner_payments(start_date=None, end_date=None):
+    """``[{"owner": username, "total": x}]`` of paid contracts per owner."""
+    rows = (
+        _rollups(start_date, end_date)
+        .filter(metric=DailyRollup.METRIC_PAYMENTS, subject_id__gt=0)
+        .values("subject_id")
+        .annotate(owner=_username(), total=Sum("amount"))
+        .order_by("subject_id")
+    )
+    return [{"owner": r["owner"], "total": r["total"]} for r in rows if r["owner"]]
+
+
+def renter_bookings(start_date=None, end_date=None):
+    """Per renter booking counts by status, for the dashboard chart."""
+    rows = (
+        _rollups(start_date, end_date)
+        .filter(
+            metric=DailyRollup.METRIC_RENTER_BOOKINGS,
+            subject_id__in=User.objects.filter(role=User.Roles.USER).values("pk"),
+        )
+        .values("subject_id", "status")
+        .annotate(username=_username(), count=Sum("count"))
+        .order_by("subject_id")
+    )
+
+    renters = {}
+    for r in rows:
+        data = renters.setdefault(r["subject_id"], {"username": r["username"], **dict.fromkeys(BOOKING_STATUSES, 0)})
+        if r["status"] in data:
+            data[r["status"]] = r["count"]
+    return list(renters.values())
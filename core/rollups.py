@@ -0,0 +1,334 @@
+"""
+Daily rollups for the admin dashboard and the admin exports.
+
+Every KPI is stored as rows of ``DailyRollup`` (one per day / metric / status
+/ subject), so the dashboard reads O(days) rows instead of scanning the
+users, cars, bookings, contracts and reviews tables on every page load.
+
+Rows are kept current by the signal handlers in ``core.signals``: a save or
+delete adds its own difference (``count = count + n``, ``amount = amount + x``)
+to the rows it moves between, computed from the values the instance was
+loaded with. Nothing is re-aggregated and no row is deleted and re-inserted,
+so concurrent bookings only ever wait on the one row they both change.
+``manage.py rebuild_rollups`` regenerates everything from scratch.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, Car, Contract, DailyRollup, Review, User
+
+# الـ models التاريخية (migrations) ما فيها الثوابت
+STATUS_PAID = Booking.STATUS_PAID
+
+METRICS = [
+    DailyRollup.METRIC_USERS,
+    DailyRollup.METRIC_CARS,
+    DailyRollup.METRIC_BOOKINGS,
+    DailyRollup.METRIC_RENTER_BOOKINGS,
+    DailyRollup.METRIC_PAYMENTS,
+    DailyRollup.METRIC_REVIEWS,
+]
+
+
+def local_day(value):
+    """The rollup day a datetime belongs to (same as ``__date`` lookups)."""
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+# ---------------------------------------------------------------------------
+# Collecting rows from the source tables
+# ---------------------------------------------------------------------------
+def _grouped(queryset, date_field, *fields, amount=None):
+    aggregates = {"n": Count("pk")}
+    if amount:
+        aggregates["total"] = Sum(amount)
+    return (
+        queryset.annotate(rollup_day=TruncDate(date_field))
+        .values("rollup_day", *fields)
+        .annotate(**aggregates)
+        .order_by()
+    )
+
+
+def _collect(metric, apps=global_apps):
+    """Return ``{(day, status, subject_id): [count, amount]}`` for ``metric``."""
+    rows = defaultdict(lambda: [0, Decimal("0")])
+    # apps = الـ models التاريخية لما بنشتغل من migration
+    User, Car, Booking, Contract, Review = (
+        apps.get_model("core", name) for name in ("User", "Car", "Booking", "Contract", "Review")
+    )
+
+    if metric == DailyRollup.METRIC_USERS:
+        for r in _grouped(User.objects.all(), "date_joined", "role"):
+            rows[(r["rollup_day"], r["role"], 0)][0] += r["n"]
+
+    elif metric == DailyRollup.METRIC_CARS:
+        for r in _grouped(Car.objects.all(), "created_at", "is_available"):
+            status = "available" if r["is_available"] else "unavailable"
+            rows[(r["rollup_day"], status, 0)][0] += r["n"]
+
+    elif metric == DailyRollup.METRIC_BOOKINGS:
+        for r in _grouped(Booking.objects.all(), "created_at", "status"):
+            rows[(r["rollup_day"], r["status"], 0)][0] += r["n"]
+
+    elif metric == DailyRollup.METRIC_RENTER_BOOKINGS:
+        bookings = Booking.objects.filter(user__isnull=False)
+        for r in _grouped(bookings, "created_at", "status", "user_id"):
+            rows[(r["rollup_day"], r["status"], r["user_id"])][0] += r["n"]
+
+    elif metric == DailyRollup.METRIC_REVIEWS:
+        for r in _grouped(Review.objects.all(), "created_at", amount="rating"):
+            row = rows[(r["rollup_day"], "", 0)]
+            row[0] += r["n"]
+            row[1] += Decimal(r["total"] or 0)
+
+    elif metric == DailyRollup.METRIC_PAYMENTS:
+        contracts = Contract.objects.filter(booking__status=STATUS_PAID)
+        for r in _grouped(contracts, "created_at", "booking__car__owner_id", amount="total_amount"):
+            row = rows[(r["rollup_day"], "", r["booking__car__owner_id"] or 0)]
+            row[0] += r["n"]
+            row[1] += r["total"] or 0
+
+    else:
+        raise ValueError(f"Unknown rollup metric: {metric}")
+
+    return rows
+
+
+def _build(metric, rows, model=DailyRollup):
+    return [
+        model(day=d, metric=metric, status=status, subject_id=subject, count=n, amount=amount)
+        for (d, status, subject), (n, amount) in rows.items()
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Incremental updates (core.signals)
+# ---------------------------------------------------------------------------
+def tracks(instance, update_fields):
+    """False when a save with ``update_fields`` (e.g. ``last_login``) can't change the rollups."""
+    if not update_fields:
+        return True
+    meta = instance._meta
+    tracked = {*instance.ROLLUP_FIELDS, *(meta.get_field(name).name for name in instance.ROLLUP_FIELDS)}
+    return bool(tracked & set(update_fields))
+
+
+def _values(instance):
+    return {name: getattr(instance, name) for name in instance.ROLLUP_FIELDS}
+
+
+def _loaded(instance):
+    # الحقول الـ deferred ما بتنحفظ، فقيمتها الحالية هي نفسها القديمة
+    return {**_values(instance), **(instance._rollup_values or {})}
+
+
+def _rows(model, values):
+    """``[(metric, day, status, subject_id, amount)]`` a row of ``model`` with ``values`` counts once in."""
+    created = values["date_joined" if model is User else "created_at"]
+    if created is None:
+        return []
+    day = local_day(created)
+    if model is User:
+        return [(DailyRollup.METRIC_USERS, day, values["role"], 0, 0)]
+    if model is Car:
+        return [(DailyRollup.METRIC_CARS, day, "available" if values["is_available"] else "unavailable", 0, 0)]
+    if model is Booking:
+        rows = [(DailyRollup.METRIC_BOOKINGS, day, values["status"], 0, 0)]
+        if values["user_id"] is not None:
+            rows.append((DailyRollup.METRIC_RENTER_BOOKINGS, day, values["status"], values["user_id"], 0))
+        return rows
+    if model is Review:
+        return [(DailyRollup.METRIC_REVIEWS, day, "", 0, values["rating"])]
+    return []  # Contract: بس لما الحجز مدفوع (_add_payment)
+
+
+def _add(deltas, rows, sign):
+    for metric, day, status, subject, amount in rows:
+        delta = deltas.setdefault((metric, day, status, subject), [0, Decimal("0")])
+        delta[0] += sign
+        delta[1] += sign * Decimal(amount or 0)
+
+
+def _add_payment(deltas, sign, created_at, total_amount, owner_id):
+    if created_at is not None:
+        _add(deltas, [(DailyRollup.METRIC_PAYMENTS, local_day(created_at), "", owner_id or 0, total_amount)], sign)
+
+
+def _add_booking_payment(deltas, booking_id, sign):
+    contract = (
+        Contract.objects.filter(booking_id=booking_id)
+        .values_list("created_at", "total_amount", "booking__car__owner_id")
+        .first()
+    )
+    if contract:
+        _add_payment(deltas, sign, *contract)
+
+
+def _contract_owner_if_paid(contract):
+    booking = Booking.objects.filter(pk=contract.booking_id).values_list("status", "car__owner_id").first()
+    if booking and booking[0] == Booking.STATUS_PAID:
+        return booking[1] or 0
+    return None
+
+
+def _key_filter(key):
+    metric, day, status, subject = key
+    return Q(metric=metric, day=day, status=status, subject_id=subject)
+
+
+def apply(deltas):
+    """
+    Add ``{(metric, day, status, subject_id): [count, amount]}`` to the rollup rows.
+
+    One ``UPDATE ... SET count = count + CASE ...`` for every existing row,
+    then the missing rows are created (first event of the day) and emptied
+    ones removed, so ``rebuild()`` would write exactly the same rows.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    conditions = {key: _key_filter(key) for key in deltas}
+    rows = DailyRollup.objects.filter(reduce(or_, conditions.values()))
+
+    def change(index, output_field):
+        whens = [When(conditions[key], then=Value(delta[index])) for key, delta in deltas.items()]
+        return Case(*whens, default=Value(0), output_field=output_field)
+
+    updated = rows.update(
+        count=F("count") + change(0, IntegerField()),
+        amount=F("amount") + change(1, DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+    increments = [key for key, (count, _) in deltas.items() if count > 0]
+    if updated < len(deltas) and increments:
+        existing = set(
+            DailyRollup.objects.filter(reduce(or_, (conditions[key] for key in increments)))
+            .values_list("metric", "day", "status", "subject_id")
+        )
+        for key in increments:
+            if key not in existing:
+                _create(key, *deltas[key])
+
+    if any(count < 0 for count, _ in deltas.values()):
+        rows.filter(count=0).delete()  # صف فضي، متل ما بيطلع من rebuild()
+
+
+def _create(key, count, amount):
+    metric, day, status, subject = key
+    try:
+        with transaction.atomic():
+            DailyRollup.objects.create(
+                metric=metric, day=day, status=status, subject_id=subject, count=count, amount=amount,
+            )
+    except IntegrityError:
+        # حفظ تاني سبقنا وأنشأ الصف
+        DailyRollup.objects.filter(_key_filter(key)).update(count=F("count") + count, amount=F("amount") + amount)
+
+
+def _move(instance, old, new):
+    model = instance._meta.concrete_model
+    deltas = {}
+    if old is not None:
+        _add(deltas, _rows(model, old), -1)
+    if new is not None:
+        _add(deltas, _rows(model, new), 1)
+
+    if model is Contract:
+        owner_id = _contract_owner_if_paid(instance)
+        if owner_id is not None:
+            if old is not None:
+                _add_payment(deltas, -1, old["created_at"], old["total_amount"], owner_id)
+            if new is not None:
+                _add_payment(deltas, 1, new["created_at"], new["total_amount"], owner_id)
+    elif model is Booking and old is not None and new is not None:
+        # الدفع بيتحسب على يوم العقد: بيدخل ويطلع مع حالة paid
+        was_paid, is_paid = old["status"] == Booking.STATUS_PAID, new["status"] == Booking.STATUS_PAID
+        if was_paid != is_paid:
+            _add_booking_payment(deltas, instance.pk, 1 if is_paid else -1)
+
+    apply(deltas)
+
+
+def saved(instance, created):
+    """Apply one save of ``instance`` (``post_save``)."""
+    _move(instance, None if created else _loaded(instance), _values(instance))
+    instance.remember_rollup_values()
+
+
+def deleted(instance):
+    """Apply one delete of ``instance`` (``post_delete``).
+
+    Deleting a booking leaves its payment to the ``Contract`` delete it cascades to.
+    """
+    _move(instance, _loaded(instance), None)
+
+
+def transitioned(booking, old_status, new_status):
+    """Apply a ``Booking.transition_to()`` (a plain UPDATE, so no ``post_save``)."""
+    new = _values(booking)
+    _move(booking, {**new, "status": old_status}, {**new, "status": new_status})
+    booking.remember_rollup_values()
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+def rebuild(metrics=None, apps=global_apps):
+    """
+    Drop and regenerate all rollups. Returns the number of rows written.
+
+    ``apps`` is the migration state when called from a data migration.
+    """
+    rollup_model = apps.get_model("core", "DailyRollup")
+    written = 0
+    for metric in metrics or METRICS:
+        with transaction.atomic():
+            rows = _collect(metric, apps)
+            rollup_model.objects.filter(metric=metric).delete()
+            written += len(rollup_model.objects.bulk_create(_build(metric, rows, rollup_model), batch_size=1000))
+    return written
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+def _rollups(metric, start=None, end=None):
+    rollups = DailyRollup.objects.filter(metric=metric)
+    if start and end:
+        rollups = rollups.filter(day__range=[start, end])
+    return rollups
+
+
+def totals(metric, start=None, end=None):
+    """``{status: {"count": n, "amount": x}}`` summed over the date range."""
+    rows = (
+        _rollups(metric, start, end)
+        .values("status")
+        .annotate(count=Sum("count"), amount=Sum("amount"))
+        .order_by()
+    )
+    return {r["status"]: {"count": r["count"] or 0, "amount": r["amount"] or Decimal("0")} for r in rows}
+
+
+def totals_by_subject(metric, start=None, end=None):
+    """``{(subject_id, status): {"count": n, "amount": x}}`` summed over the date range."""
+    rows = (
+        _rollups(metric, start, end)
+        .values("subject_id", "status")
+        .annotate(count=Sum("count"), amount=Sum("amount"))
+        .order_by()
+    )
+    return {
+        (r["subject_id"], r["status"]): {"count": r["count"] or 0, "amount": r["amount"] or Decimal("0")}
+        for r in rows
+    }
+
@@ -0,0 +1,142 @@
+"""
+Indexed car search.
+
+Each car is split into lowercase tokens (name words, year, transmission code
+and label) stored in ``CarSearchToken`` with a unique (token, car) B-tree
+index. A query term matches tokens that start with it (``LIKE 'term%'``,
+an index range scan), every term must match, and cars are ranked by the
+summed weight of their matching tokens. Typed filters (year range,
+transmission) go straight to the indexed ``Car`` columns.
+
+The token rows are refreshed from the Car signals in ``core.signals``;
+``manage.py rebuild_search_index`` rebuilds them for all cars.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, When
+
+from .models import Car, CarSearchToken
+
+NAME_WEIGHT = 3
+FIELD_WEIGHT = 1
+MAX_TERMS = 6
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# الحقول اللي لو تغيّرت لازم نعيد فهرسة السيارة
+INDEXED_FIELDS = {"name", "year", "transmission"}
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return [w[:64] for w in _WORD.findall(str(text or "").lower())]
+
+
+def car_tokens(car):
+    """``{token: weight}`` for one car."""
+    tokens = {}
+    for token in tokenize(car.name):
+        tokens[token] = NAME_WEIGHT
+    labels = dict(Car.TRANSMISSION_CHOICES)
+    for token in tokenize(f"{car.year} {car.transmission} {labels.get(car.transmission, '')}"):
+        tokens.setdefault(token, FIELD_WEIGHT)
+    return tokens
+
+
+def index_cars(cars):
+    """Replace the search tokens of ``cars``."""
+    cars = list(cars)
+    with transaction.atomic():
+        CarSearchToken.objects.filter(car__in=cars).delete()
+        CarSearchToken.objects.bulk_create(
+            [
+                CarSearchToken(car=car, token=token, weight=weight)
+                for car in cars
+                for token, weight in car_tokens(car).items()
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_index(batch_size=1000):
+    """Re-index every car, ``batch_size`` cars at a time. Returns the number of cars."""
+    CarSearchToken.objects.all().delete()
+    indexed, last_pk = 0, 0
+    while True:
+        batch = list(Car.objects.filter(pk__gt=last_pk).order_by("pk")[:batch_size])
+        if not batch:
+            return indexed
+        index_cars(batch)
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+
+
+def _search_query(query, year_min, year_max, transmission, limit, offset, available_only):
+    """
+    ``(queryset, ranked, limit)``: ``queryset`` yields up to ``limit + 1`` cars,
+    or car ids in relevance order when ``ranked``.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+
+    car_filters = {}
+    if available_only:
+        car_filters["is_available__in"] = [True]
+    if year_min:
+        car_filters["year__gte"] = year_min
+    if year_max:
+        car_filters["year__lte"] = year_max
+    if transmission:
+        car_filters["transmission"] = transmission
+
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+    if not terms:
+        return Car.objects.filter(**car_filters)[offset:offset + limit + 1], False, limit
+
+    any_term = Q()
+    matches = {}
+    for i, term in enumerate(terms):
+        any_term |= Q(token__startswith=term)
+        matches[f"term_{i}"] = Max(Case(When(token__startswith=term, then=1), default=0, output_field=IntegerField()))
+
+    # كل كلمة لازم تطابق توكن واحد على الأقل للسيارة
+    ranked = (
+        CarSearchToken.objects.filter(any_term, **{f"car__{k}": v for k, v in car_filters.items()})
+        .values("car_id")
+        .annotate(score=Sum("weight"), **matches)
+        .filter(**{name: 1 for name in matches})
+        .order_by("-score", "car_id")
+        .values_list("car_id", flat=True)[offset:offset + limit + 1]
+    )
+    return ranked, True, limit
+
+
+def _ordered(cars, car_ids):
+    return [cars[pk] for pk in car_ids if pk in cars]
+
+
+def search_cars(query="", year_min=None, year_max=None, transmission=None,
+                limit=DEFAULT_LIMIT, offset=0, available_only=True):
+    """
+    Return ``(cars, has_more)`` for one page of results.
+
+    With a text query cars are ordered by relevance (then id); without one
+    they keep the default ``Car`` ordering.
+    """
+    queryset, ranked, limit = _search_query(query, year_min, year_max, transmission, limit, offset, available_only)
+    rows = list(queryset)
+    if not ranked:
+        return rows[:limit], len(rows) > limit
+    return _ordered(Car.objects.in_bulk(rows[:limit]), rows[:limit]), len(rows) > limit
+
+
+async def asearch_cars(query="", year_min=None, year_max=None, transmission=None,
+                       limit=DEFAULT_LIMIT, offset=0, available_only=True):
+    """``search_cars()`` on the async ORM."""
+    queryset, ranked, limit = _search_query(query, year_min, year_max, transmission, limit, offset, available_only)
+    rows = [row async for row in queryset.aiterator()]
+    if not ranked:
+        return rows[:limit], len(rows) > limit
+    return _ordered(await Car.objects.ain_bulk(rows[:limit]), rows[:limit]), len(rows) > limit
@@ -13,4 +13,228 @@ def create_default_admin(sender, **kwargs):
                 password="admin",
                 role="admin"
             )
-            print("✅ Default admin created (username=admin, password=admin)")
\ No newline at end of file
+            print("✅ Default admin created (username=admin, password=admin)")
+
+# ===========================
+# Daily rollups (core.rollups)
+# ===========================
+from django.db.models.signals import post_delete, post_save
+
+from . import rollups
+from .models import Booking, Car, Contract, Review
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_save, sender=Car)
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Review)
+def rollup_saved(sender, instance, created, **kwargs):
+    if kwargs.get("raw") or not rollups.tracks(instance, kwargs.get("update_fields")):
+        return
+    rollups.saved(instance, created)
+
+
+@receiver(post_delete, sender=get_user_model())
+@receiver(post_delete, sender=Car)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Review)
+def rollup_deleted(sender, instance, **kwargs):
+    rollups.deleted(instance)
+
+
+# ===========================
+# Car popularity / rating counters (core.car_stats)
+# ===========================
+from . import car_stats
+
+
+@receiver(post_save, sender=Booking)
+def count_booking_created(sender, instance, created, **kwargs):
+    if created and not kwargs.get("raw"):
+        car_stats.bump_bookings(instance.car_id, 1)
+
+
+@receiver(post_delete, sender=Booking)
+def count_booking_deleted(sender, instance, **kwargs):
+    car_stats.bump_bookings(instance.car_id, -1)
+
+
+def _review_car_id(review):
+    return Booking.objects.filter(pk=review.booking_id).values_list("car_id", flat=True).first()
+
+
+@receiver(post_save, sender=Review)
+def count_review_created(sender, instance, created, **kwargs):
+    if created and not kwargs.get("raw"):
+        car_stats.bump_rating(_review_car_id(instance), instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def count_review_deleted(sender, instance, **kwargs):
+    car_stats.bump_rating(_review_car_id(instance), instance.rating, -1)
+
+
+# ===========================
+# Car search index (core.search)
+# ===========================
+from . import search
+
+
+@receiver(post_save, sender=Car)
+def index_car(sender, instance, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if kwargs.get("raw") or (update_fields and not search.INDEXED_FIELDS & set(update_fields)):
+        return
+    search.index_cars([instance])
+
+
+# ===========================
+# Image derivatives (core.images)
+# ===========================
+from . import images
+
+
+def sync_image_derivatives(car):
+    """(Re)build the derivatives of ``car.image`` if they are missing or stale."""
+    current = car.image.name if car.image else ""
+    if car.image_derived == current:
+        return
+    storage = car._meta.get_field("image").storage
+    if car.image_derived:
+        images.delete(car.image_derived, storage)
+    derived = ""
+    if current:
+        try:
+            images.generate(car.image)
+            derived = current
+        except (OSError, ValueError):
+            pass  # صورة تالفة: بنضل نعرض الأصل
+    Car.objects.filter(pk=car.pk).update(image_derived=derived)
+    car.image_derived = derived
+
+
+@receiver(post_save, sender=Car)
+def derive_car_image(sender, instance, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if kwargs.get("raw") or (update_fields and "image" not in update_fields):
+        return
+    sync_image_derivatives(instance)
+
+
+@receiver(post_delete, sender=Car)
+def delete_car_image_derivatives(sender, instance, **kwargs):
+    if instance.image_derived:
+        images.delete(instance.image_derived, instance._meta.get_field("image").storage)
+
+
+# ===========================
+# Cached car listings (core.fragments)
+# ===========================
+from . import fragments
+
+
+@receiver([post_save, post_delete], sender=Car)
+@receiver([post_save, post_delete], sender=Booking)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_car_listings(sender, **kwargs):
+    fragments.invalidate(fragments.CAR_LISTINGS)
+
+
+
+# ===========================
+# Cached request.user (core.backends)
+# ===========================
+from .backends import invalidate_users
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_users(instance.pk)
+
+
+# ===========================
+# Car occupancy index (core.occupancy)
+# ===========================
+from . import occupancy
+
+
+@receiver(post_save, sender=Booking)
+def refresh_occupancy_on_save(sender, instance, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if kwargs.get("raw") or (update_fields and not occupancy.TRACKED_FIELDS & set(update_fields)):
+        return
+    occupancy.refresh_car(instance.car_id)
+
+
+@receiver(post_delete, sender=Booking)
+def refresh_occupancy_on_delete(sender, instance, **kwargs):
+    occupancy.refresh_car(instance.car_id)
+
+
+# ===========================
+# Booking status transitions (Booking.transition_to)
+# ===========================
+from . import outbox
+from .models import booking_status_changed
+
+
+@receiver(booking_status_changed)
+def refresh_after_transition(sender, booking, old_status, new_status, **kwargs):
+    # transition_to بيكتب بـ UPDATE (بدون post_save): نحدّث كل اللي بيعتمد على الحالة
+    rollups.transitioned(booking, old_status, new_status)
+    occupancy.refresh_car(booking.car_id)
+    fragments.invalidate(fragments.CAR_LISTINGS)
+
+
+@receiver(booking_status_changed)
+def notify_renter(sender, booking, old_status, new_status, **kwargs):
+    # من awaiting_contract = الزبون نفسه رفض العقد، ما في داعي نبعتله
+    rejected = new_status == Booking.STATUS_REJECTED and old_status != Booking.STATUS_AWAITING_CONTRACT
+    if new_status != Booking.STATUS_APPROVED and not rejected:
+        return
+    if not (booking.user and booking.user.email):
+        return
+
+    if rejected:
+        subject = "❌ Booking Rejected"
+        message = (
+            f"Hello {booking.user.username},\n\n"
+            f"Unfortunately, your booking has been rejected.\n\n"
+            f"Car: {booking.car.name}\n"
+            f"Trip: {booking.trip_location}\n"
+            f"Date: {booking.pickup_date} {booking.pickup_time}\n\n"
+            "You may contact us for further details."
+        )
+    else:
+        subject = "✅ Booking Approved"
+        message = (
+            f"Hello {booking.user.username},\n\n"
+            f"Your booking has been approved!\n\n"
+            f"Car: {booking.car.name}\n"
+            f"Trip: {booking.trip_location}\n"
+            f"Distance: {booking.distance_km} km\n"
+            f"Date: {booking.pickup_date}\n"
+            f"Time: {booking.pickup_time}\n\n"
+            "Thank you for choosing Royal Cars!"
+        )
+    outbox.enqueue(subject, message, [booking.user.email], from_email="noreply@royalcars.com")
+
+
+# ===========================
+# Business counters (core.metrics)
+# ===========================
+from . import metrics
+
+
+@receiver(post_save, sender=Booking)
+def count_booking_metric(sender, instance, created, **kwargs):
+    if created and not kwargs.get("raw"):
+        metrics.inc("bookings_total", event="created")
+
+
+@receiver(booking_status_changed)
+def count_transition_metric(sender, new_status, **kwargs):
+    if new_status in (Booking.STATUS_APPROVED, Booking.STATUS_REJECTED, Booking.STATUS_PAID):
+        metrics.inc("bookings_total", event=new_status)
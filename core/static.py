@@ -0,0 +1,66 @@
+"""
+Serving collected static files outside DEBUG.
+
+Files whose name carries the content hash from ``staticfiles.json`` never
+change, so they are sent with a one-year ``immutable`` Cache-Control and
+browsers don't revalidate them on repeat visits. When the client accepts it,
+the precompressed ``.br`` / ``.gz`` sibling written by
+``core.storage.CompressedManifestStaticFilesStorage`` is sent instead of the
+original. Unhashed names get a short max-age.
+"""
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = getattr(settings, "STATIC_MUTABLE_MAX_AGE", 60 * 60)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def hashed_names():
+    """The set of hashed file names in the manifest (built once per storage)."""
+    names = getattr(staticfiles_storage, "_hashed_names", None)
+    if names is None:
+        names = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+        staticfiles_storage._hashed_names = names
+    return names
+
+
+def _accepted(request):
+    header = request.headers.get("Accept-Encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",")}
+
+
+def serve(request, path):
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = _accepted(request)
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(fullpath + suffix):
+            fullpath, encoding = fullpath + suffix, name
+            break
+
+    response = FileResponse(open(fullpath, "rb"), content_type=content_type or "application/octet-stream")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    if path in hashed_names():
+        response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = f"public, max-age={MUTABLE_MAX_AGE}"
+    return response
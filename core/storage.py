@@ -0,0 +1,73 @@
+"""
+Static files storage for ``collectstatic``.
+
+``ManifestStaticFilesStorage`` already copies every asset under a
+content-hashed name (``css/style.3f9a1c2b7d4e.css``) and writes
+``staticfiles.json``, which ``{% static %}`` uses to emit the hashed URLs.
+This storage additionally writes ``.gz`` and ``.br`` siblings of the text
+assets, so they can be served precompressed with far-future cache headers
+(see ``core.static``). Brotli output needs the optional ``brotli`` package.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".css", ".js", ".map", ".json", ".svg", ".txt", ".xml", ".html", ".ico", ".eot", ".ttf", ".otf",
+}
+# ملفات أصغر من هيك ما بتستاهل نسخة مضغوطة
+MIN_SIZE = 256
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+ENCODINGS = [("gz", _gzip)] + ([("br", _brotli)] if brotli else [])
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # ملفات ناقصة (زي img/default-car.png) بترجع لاسمها الأصلي بدل ما تكسر الصفحة
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if dry_run or isinstance(processed, Exception) or not hashed_name:
+                continue
+            yield from self.compress(hashed_name)
+
+    def compress(self, name):
+        """Write the compressed siblings of ``name``; yields them like ``post_process``."""
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_SIZE:
+            return
+        for suffix, compress in ENCODINGS:
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            target = f"{name}.{suffix}"
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(compressed))
+            yield name, target, True
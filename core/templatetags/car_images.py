@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core import images
+
+register = template.Library()
+
+# عرض الصورة على الشاشة حسب مكانها، عشان المتصفح يختار أصغر نسخة كافية
+SIZES_ATTR = {
+    "thumb": "160px",
+    "card": "(min-width: 992px) 350px, (min-width: 768px) 50vw, 100vw",
+    "detail": "(min-width: 992px) 58vw, 100vw",
+}
+
+
+@register.simple_tag
+def car_picture(car, size="card", **attrs):
+    """
+    ``<picture>`` for ``car.image`` with WebP/JPEG ``srcset``s. Falls back to
+    a plain ``<img>`` of the original while its derivatives don't exist yet.
+
+        {% car_picture car "card" class="card-img-top" style="height: 220px" %}
+    """
+    attrs.setdefault("alt", car.name)
+    attrs.setdefault("loading", "lazy" if size != "detail" else "eager")
+    attrs.setdefault("decoding", "async")
+    extra = format_html_join(" ", '{}="{}"', attrs.items())
+
+    if not car.has_image_derivatives:
+        return format_html('<img src="{}" {}>', car.image.url, extra)
+
+    sizes = SIZES_ATTR.get(size, "100vw")
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" {}></picture>',
+        images.srcset(car.image, "webp"),
+        sizes,
+        images.urls(car.image, "jpg")[size],
+        images.srcset(car.image, "jpg"),
+        sizes,
+        extra,
+    )
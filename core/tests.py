@@ -1,3 +1,1780 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    backends, benchmark, fragments, images, metrics, occupancy, outbox, payments, profiler, reports, rollups, search,
+    urls,
+)
+from .admin import BookingAdminForm
+from .bookings import BookingConflict, create_booking, overlapping_bookings
+from .models import (
+    Booking, Car, CarOccupancy, Contract, DailyRollup, EmailOutbox, InvalidTransition, Review, SlowQuery, User,
+)
+from .pagination import KeysetPaginator
+
+# الكاش الافتراضي ملفات تحت BASE_DIR/cache: التستات اللي بتمسحه أو بتعتمد عليه بتاخد كاش بالذاكرة
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    """Fire many overlapping booking requests from threads at the same cars."""
+
+    REQUESTS = 300
+    WORKERS = 16
+    CARS = 3
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        self.renter = User.objects.create_user("renter")
+        self.cars = [
+            Car.objects.create(
+                owner=self.owner, name=f"Car {i}", year=2022,
+                transmission="AUTO", mileage="1000", price=40,
+            )
+            for i in range(self.CARS)
+        ]
+
+    def _book(self, n):
+        car = self.cars[n % self.CARS]
+        pickup = datetime.date(2030, 1, 1) + datetime.timedelta(days=n % 2)
+        try:
+            create_booking(
+                user=self.renter,
+                car_id=car.pk,
+                pickup_date=pickup,
+                pickup_time=datetime.time(10, 0),
+                return_date=pickup + datetime.timedelta(days=3),
+                return_time=datetime.time(10, 0),
+            )
+            return "created"
+        except BookingConflict:
+            return "conflict"
+        finally:
+            close_old_connections()
+
+    def test_overlapping_requests_never_double_book(self):
+        barrier = threading.Barrier(self.WORKERS)
+
+        def worker(n):
+            if n < self.WORKERS:
+                barrier.wait()
+            return self._book(n)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(worker, range(self.REQUESTS)))
+        elapsed = time.perf_counter() - started
+
+        created = results.count("created")
+        conflicts = results.count("conflict")
+        sys.stderr.write(
+            f"\n[booking stress] {self.REQUESTS} requests in {elapsed:.2f}s "
+            f"({self.REQUESTS / elapsed:.0f} req/s), created={created}, conflicts={conflicts}\n"
+        )
+
+        # كل طلب يا إما انحجز يا إما رجع تعارض، وكل سيارة انحجزت مرة وحدة بس
+        self.assertEqual(created + conflicts, self.REQUESTS)
+        self.assertEqual(created, self.CARS)
+        for car in self.cars:
+            self.assertEqual(Booking.objects.filter(car=car).count(), 1)
+
+
+class BookingConflictTests(TestCase):
+    def setUp(self):
+        self.renter = User.objects.create_user("renter")
+        self.car = Car.objects.create(name="Car", year=2022, transmission="AUTO", mileage="1", price=40)
+        self.pickup = datetime.date(2030, 1, 1)
+
+    def _book(self, pickup, days):
+        return create_booking(
+            user=self.renter,
+            car_id=self.car.pk,
+            pickup_date=pickup,
+            pickup_time=datetime.time(10, 0),
+            return_date=pickup + datetime.timedelta(days=days),
+            return_time=datetime.time(10, 0),
+        )
+
+    def test_overlap_is_rejected(self):
+        self._book(self.pickup, 3)
+        with self.assertRaises(BookingConflict):
+            self._book(self.pickup + datetime.timedelta(days=2), 3)
+
+    def test_rejected_booking_does_not_block(self):
+        booking = self._book(self.pickup, 3)
+        Booking.objects.filter(pk=booking.pk).update(status=Booking.STATUS_REJECTED)
+        self._book(self.pickup, 3)
+
+    def test_back_to_back_bookings_do_not_overlap(self):
+        first = self._book(self.pickup, 3)
+        # الفترة مفتوحة من آخرها: الإرجاع 10:00 والاستلام 10:00 بنفس اليوم
+        second = self._book(first.return_date, 2)
+        self.assertEqual(second.pickup_at, first.return_at)
+        with self.assertRaises(BookingConflict):
+            create_booking(
+                user=self.renter, car_id=self.car.pk,
+                pickup_date=first.return_date, pickup_time=datetime.time(9, 59),
+                return_date=first.return_date, return_time=datetime.time(10, 1),
+            )
+
+    def test_period_follows_the_date_and_time_fields(self):
+        booking = self._book(self.pickup, 3)
+        self.assertEqual(booking.pickup_at, timezone.make_aware(datetime.datetime(2030, 1, 1, 10)))
+
+        booking.return_time = None
+        booking.save(update_fields=["return_time"])
+        booking.refresh_from_db()
+        # بدون وقت إرجاع = آخر يوم الإرجاع
+        self.assertEqual(booking.return_at, timezone.make_aware(datetime.datetime(2030, 1, 4, 23, 59, 59, 999999)))
+
+    def test_admin_form_runs_the_same_overlap_check(self):
+        booking = self._book(self.pickup, 3)
+        data = {
+            "user": self.renter.pk, "car": self.car.pk, "status": Booking.STATUS_PENDING,
+            "pickup_date": "2030-01-03", "pickup_time": "10:00", "return_date": "2030-01-05", "return_time": "10:00",
+            "created_at": "2030-01-01 10:00",
+        }
+        self.assertFalse(BookingAdminForm(data).is_valid())
+        self.assertTrue(BookingAdminForm({**data, "status": Booking.STATUS_REJECTED}).is_valid())
+        # تعديل الحجز نفسه ما بيتعارض مع حاله
+        self.assertTrue(BookingAdminForm({**data, "pickup_date": "2030-01-01"}, instance=booking).is_valid())
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        self.renter = User.objects.create_user("renter")
+        self.car = Car.objects.create(owner=self.owner, name="Car", year=2022, transmission="AUTO", mileage="1", price=40)
+        self.booking = Booking.objects.create(
+            user=self.renter, car=self.car,
+            pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+            return_date=datetime.date(2030, 1, 4), return_time=datetime.time(10, 0),
+        )
+
+    def _snapshot(self):
+        return sorted(
+            DailyRollup.objects.values_list("day", "metric", "status", "subject_id", "count", "amount")
+        )
+
+    def test_saves_keep_rollups_current(self):
+        Contract.objects.create(booking=self.booking)
+        self.booking.status = Booking.STATUS_PAID
+        self.booking.save()
+        Review.objects.create(booking=self.booking, user=self.renter, rating=4)
+
+        bookings = rollups.totals(DailyRollup.METRIC_BOOKINGS)
+        self.assertEqual(bookings[Booking.STATUS_PAID]["count"], 1)
+        self.assertNotIn(Booking.STATUS_PENDING, bookings)
+
+        payments = rollups.totals_by_subject(DailyRollup.METRIC_PAYMENTS)
+        self.assertEqual(payments[(self.owner.pk, "")]["amount"], 120)
+
+        reviews = rollups.totals(DailyRollup.METRIC_REVIEWS)[""]
+        self.assertEqual((reviews["count"], reviews["amount"]), (1, 4))
+
+    def test_rebuild_matches_incremental_rows(self):
+        Contract.objects.create(booking=self.booking)
+        self.booking.status = Booking.STATUS_PAID
+        self.booking.save()
+        incremental = self._snapshot()
+
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_delete_removes_counts(self):
+        self.booking.delete()
+        self.assertEqual(rollups.totals(DailyRollup.METRIC_BOOKINGS), {})
+
+    def test_changes_are_applied_as_deltas(self):
+        contract = Contract.objects.create(booking=self.booking)
+        for status in (Booking.STATUS_APPROVED, Booking.STATUS_AWAITING_CONTRACT, Booking.STATUS_PAID):
+            Booking.objects.get(pk=self.booking.pk).transition_to(status)
+        Review.objects.create(booking=self.booking, user=self.renter, rating=5)
+        car = Car.objects.get(pk=self.car.pk)
+        car.is_available = False
+        car.save()
+        contract.total_amount = 200
+        contract.save()
+        incremental = self._snapshot()
+
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+        self.assertEqual(rollups.totals_by_subject(DailyRollup.METRIC_PAYMENTS)[(self.owner.pk, "")]["amount"], 200)
+
+        Contract.objects.get(pk=contract.pk).delete()
+        self.assertEqual(rollups.totals(DailyRollup.METRIC_PAYMENTS), {})
+
+    def test_deferred_fields_keep_the_loaded_values(self):
+        car = Car.objects.only("pk", "is_available").get(pk=self.car.pk)
+        car.is_available = False
+        car.created_at  # deferred: بيعمل refresh_from_db(fields=["created_at"])
+        car.save()
+        totals = rollups.totals(DailyRollup.METRIC_CARS)
+        self.assertEqual(set(totals), {"unavailable"})
+
+    def test_saves_without_tracked_changes_skip_rollups(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.renter.save(update_fields=["last_login"])
+            self.car.name = "Renamed"
+            self.car.save()
+        self.assertFalse([q for q in ctx.captured_queries if "core_dailyrollup" in q["sql"]])
+
+
+class AdminExcelExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("boss", role="admin")
+        owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        renter = User.objects.create_user("renter")
+        for i in range(5):
+            car = Car.objects.create(owner=owner, name=f"Car {i}", year=2022, transmission="AUTO", mileage="1", price=40)
+            booking = Booking.objects.create(
+                user=renter, car=car,
+                pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+                return_date=datetime.date(2030, 1, 3), return_time=datetime.time(10, 0),
+            )
+            Contract.objects.create(booking=booking)
+
+    def test_streams_row_level_sheets(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("export_excel"))
+
+        self.assertTrue(response.streaming)
+        wb = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        self.assertEqual(wb.sheetnames, ["Admin Report", "Bookings", "Contracts", "Cars", "Owners"])
+        self.assertEqual(len(list(wb["Bookings"].iter_rows(min_row=2))), 5)
+        contract = next(wb["Contracts"].iter_rows(min_row=2, values_only=True))
+        self.assertEqual(contract[6:9], (2, 40, 80))
+
+    def test_date_range_filters_rows(self):
+        self.client.force_login(self.admin)
+        today = timezone.localdate()
+        response = self.client.get(reverse("export_excel"), {"start_date": today, "end_date": today})
+        wb = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(wb["Bookings"].iter_rows(min_row=2))), 5)
+
+        response = self.client.get(reverse("export_excel"), {"start_date": "2000-01-01", "end_date": "2000-01-02"})
+        wb = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(wb["Bookings"].iter_rows(min_row=2))), 0)
+
+    def test_exports_require_admin(self):
+        for name in ("export_excel", "export_pdf"):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse(name)).status_code, 302)
+            self.client.force_login(User.objects.get(username="renter"))
+            self.assertEqual(self.client.get(reverse(name)).status_code, 403)
+
+    def test_invalid_date_is_rejected(self):
+        self.client.force_login(self.admin)
+        for name in ("export_excel", "export_pdf"):
+            response = self.client.get(reverse(name), {"start_date": "2030-13-01", "end_date": "nope"})
+            self.assertEqual(response.status_code, 400)
+
+
+class ReportMetricsTests(TestCase):
+    def _seed(self, n):
+        owner = User.objects.create_user(f"owner{n}", role="owner", is_approved=True)
+        renter = User.objects.create_user(f"renter{n}")
+        for i in range(n):
+            car = Car.objects.create(owner=owner, name=f"Car {i}", year=2022, transmission="AUTO", mileage="1", price=40)
+            booking = Booking.objects.create(
+                user=renter, car=car,
+                pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+                return_date=datetime.date(2030, 1, 3), return_time=datetime.time(10, 0),
+            )
+            Contract.objects.create(booking=booking)
+            booking.status = Booking.STATUS_PAID
+            booking.save()
+            Review.objects.create(booking=booking, user=renter, rating=4)
+
+    def test_values(self):
+        self._seed(3)
+        m = reports.report_metrics()
+        self.assertEqual((m["total_owners"], m["total_renters"], m["total_users"]), (1, 1, 2))
+        self.assertEqual((m["total_cars"], m["total_bookings"], m["paid"], m["pending"]), (3, 3, 3, 0))
+        self.assertEqual((m["payments_count"], m["total_payments"]), (3, 240))
+        self.assertEqual(m["profits"], 24)
+        self.assertEqual((m["total_reviews"], m["avg_rating"]), (3, 4))
+        self.assertEqual(reports.owner_payments(), [{"owner": "owner3", "total": 240}])
+        self.assertEqual(reports.renter_bookings()[0]["paid"], 3)
+
+    def test_every_booking_status_is_reported(self):
+        self._seed(1)
+        booking = Booking.objects.get()
+        Booking.objects.filter(pk=booking.pk).update(status=Booking.STATUS_AWAITING_CONTRACT)
+        call_command("rebuild_rollups", stdout=StringIO())
+
+        m = reports.report_metrics()
+        self.assertEqual((m["awaiting_contract"], m["paid"]), (1, 0))
+        self.assertEqual(set(m["booking_status_data"]), {status for status, _ in Booking.STATUS_CHOICES})
+        self.assertEqual(reports.renter_bookings()[0]["awaiting_contract"], 1)
+
+    def test_query_count_does_not_grow_with_data(self):
+        for n in (2, 8):
+            self._seed(n)
+            with self.assertNumQueries(1):
+                reports.report_metrics("2000-01-01", "2100-01-01")
+            with self.assertNumQueries(3):
+                reports.payments_by_month()
+                reports.owner_payments()
+                reports.renter_bookings()
+
+    def test_dashboard_and_exports_query_budget(self):
+        self._seed(5)
+        admin = User.objects.create_user("boss", role="admin")
+        self.client.force_login(admin)
+
+        # user (أول طلب بعد الـ login؛ الـ session من الكاش) + KPIs + 3 recent tables + 3 charts
+        with self.assertNumQueries(8):
+            self.client.get(reverse("admin_dashboard"))
+        with self.assertNumQueries(1):
+            self.client.get(reverse("export_pdf"))
+        # KPIs + one query per row-level sheet
+        with self.assertNumQueries(5):
+            b"".join(self.client.get(reverse("export_excel")).streaming_content)
+
+
+class ContractPriceSnapshotTests(TestCase):
+    def test_price_is_frozen_at_creation(self):
+        car = Car.objects.create(name="Car", year=2022, transmission="AUTO", mileage="1", price=40)
+        booking = Booking.objects.create(
+            car=car,
+            pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+            return_date=datetime.date(2030, 1, 4), return_time=datetime.time(10, 0),
+        )
+        contract = Contract.objects.create(booking=booking)
+        self.assertEqual((contract.daily_rate, contract.rental_days, contract.total_amount), (40, 3, 120))
+
+        car.price = 100
+        car.save()
+        contract.refresh_from_db()
+        self.assertEqual(contract.total_price, 120)
+
+
+class CarStatsTests(TestCase):
+    def setUp(self):
+        self.renter = User.objects.create_user("renter")
+        self.car = Car.objects.create(name="Car", year=2022, transmission="AUTO", mileage="1", price=40)
+
+    def _booking(self):
+        return Booking.objects.create(
+            user=self.renter, car=self.car,
+            pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+            return_date=datetime.date(2030, 1, 3), return_time=datetime.time(10, 0),
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        first, second = self._booking(), self._booking()
+        Review.objects.create(booking=first, user=self.renter, rating=5)
+        Review.objects.create(booking=second, user=self.renter, rating=2)
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.booking_count, self.car.rating_sum, self.car.rating_count), (2, 7, 2))
+        self.assertEqual(self.car.avg_rating, 3.5)
+
+        second.delete()
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.booking_count, self.car.rating_count, self.car.avg_rating), (1, 1, 5.0))
+
+    def test_reconcile_repairs_drift(self):
+        booking = self._booking()
+        Review.objects.create(booking=booking, user=self.renter, rating=4)
+        Car.objects.update(booking_count=9, rating_sum=0, rating_count=0, avg_rating=None)
+
+        call_command("reconcile_car_stats", stdout=StringIO())
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.booking_count, self.car.rating_sum, self.car.avg_rating), (1, 4, 4.0))
+
+
+class CarSearchTests(TestCase):
+    def setUp(self):
+        def car(name, year, transmission, available=True):
+            return Car.objects.create(
+                name=name, year=year, transmission=transmission, mileage="1", price=40, is_available=available,
+            )
+
+        self.bmw_x5 = car("BMW X5", 2022, "AUTO")
+        self.bmw_320 = car("BMW 320i", 2018, "MANUAL")
+        self.kia = car("Kia Rio", 2022, "AUTO")
+        car("BMW X3", 2022, "AUTO", available=False)
+
+    def _search(self, **params):
+        response = self.client.get(reverse("search_cars"), params)
+        return response.json()
+
+    def _names(self, **params):
+        return [r["name"] for r in self._search(**params)["results"]]
+
+    def test_prefix_terms_must_all_match(self):
+        self.assertEqual(self._names(q="bm x5"), ["BMW X5"])
+        self.assertEqual(sorted(self._names(q="bmw")), ["BMW 320i", "BMW X5"])
+
+    def test_name_matches_rank_above_field_matches(self):
+        self.bmw_320.name = "BMW 320i Automatic"
+        self.bmw_320.save()
+        self.assertEqual(self._names(q="automatic")[0], "BMW 320i Automatic")
+
+    def test_typed_filters(self):
+        self.assertEqual(sorted(self._names(q="bmw", year_min=2020)), ["BMW X5"])
+        self.assertEqual(self._names(transmission="manual"), ["BMW 320i"])
+
+    def test_paging(self):
+        first = self._search(q="2022", limit=1)
+        second = self._search(q="2022", limit=1, offset=first["next_offset"])
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        self.assertNotEqual(first["results"][0]["id"], second["results"][0]["id"])
+
+    def test_reindex_on_rename(self):
+        self.kia.name = "Kia Sportage"
+        self.kia.save()
+        self.assertEqual(self._names(q="sportage"), ["Kia Sportage"])
+        self.assertEqual(self._names(q="rio"), [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # أسماء وسنوات مكررة عشان نتأكد إن الـ pk بيكسر التعادل
+        for i in range(25):
+            Car.objects.create(
+                name=f"Car {i % 4}", year=2018 + i % 3, transmission="AUTO", mileage="1", price=40 + i % 5,
+            )
+        Car.objects.filter(pk__in=list(Car.objects.values_list("pk", flat=True)[:10])).update(avg_rating=4.5)
+
+    def _walk(self, queryset, per_page=7, ordering=None):
+        paginator = KeysetPaginator(queryset, per_page, ordering)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen += [car.pk for car in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_walks_every_row_once_in_meta_ordering(self):
+        expected = list(Car.objects.order_by("-year", "name", "pk").values_list("pk", flat=True))
+        self.assertEqual(self._walk(Car.objects.all()), expected)
+
+    def test_nullable_descending_ordering(self):
+        expected = list(Car.objects.order_by("-avg_rating", "pk").values_list("pk", flat=True))
+        self.assertEqual(self._walk(Car.objects.order_by("-avg_rating"), per_page=4), expected)
+
+    def test_cursor_keeps_microseconds(self):
+        car = Car.objects.first()
+        base = timezone.make_aware(datetime.datetime(2030, 1, 1, 10, 0, 0))
+        expected = []
+        for micro in (123900, 123500, 123100, 122000):
+            booking = Booking.objects.create(
+                car=car, pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10, 0),
+                return_date=datetime.date(2030, 1, 3), return_time=datetime.time(10, 0),
+            )
+            Booking.objects.filter(pk=booking.pk).update(created_at=base.replace(microsecond=micro))
+            expected.append(booking.pk)
+        self.assertEqual(self._walk(Booking.objects.order_by("-created_at"), per_page=1), expected)
+
+    def test_page_cost_is_constant(self):
+        paginator = KeysetPaginator(Car.objects.all(), 5)
+        page = paginator.page()
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                page = paginator.page(page.next_cursor)
+
+    def test_bad_cursor_returns_first_page(self):
+        first = KeysetPaginator(Car.objects.all(), 5).page()
+        self.assertEqual(KeysetPaginator(Car.objects.all(), 5).page("garbage").object_list, first.object_list)
+
+    def test_car_partial_load_more(self):
+        response = self.client.get(reverse("car_partial"), {"sort": "price_low"})
+        self.assertEqual(len(response.context["cars"]), 12)
+        next_query = response.context["page"].next_query
+        self.assertIn("sort=price_low", next_query)
+
+        response = self.client.get(reverse("car_partial") + "?" + next_query)
+        self.assertEqual(len(response.context["cars"]), 12)
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for ``smtplib``; refuses recipients in ``reject``."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reject=()):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.reject = set(reject)
+        self.connections = 0
+        self.delivered = []  # (recipients, data)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 fake ESMTP")
+        recipients = []
+        while line := self.rfile.readline():
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 fake")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip().strip("<>")
+                if address in self.server.reject:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                self.server.delivered.append((recipients, b"".join(data)))
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Not implemented")
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("SMTP is down")
+
+    def send_messages(self, email_messages):
+        raise AssertionError("never opened")
+
+
+class EmailOutboxTests(TestCase):
+    def smtp_settings(self, server):
+        return override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=server.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_TIMEOUT=5,
+        )
+
+    def test_contact_form_only_enqueues(self):
+        response = self.client.post(reverse("contact"), {
+            "name": "Sam", "email": "sam@example.com", "subject": "Hi", "message": "Hello",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.status, EmailOutbox.STATUS_PENDING)
+        self.assertIn("Hi", queued.subject)
+
+    def test_drains_over_one_connection_and_backs_off_failures(self):
+        for i in range(5):
+            outbox.enqueue(f"Message {i}", "Body", [f"user{i}@example.com"], from_email="noreply@example.com")
+        bounced = outbox.enqueue("Bounce", "Body", ["nobody@example.com"])
+
+        with FakeSMTPServer(reject={"nobody@example.com"}) as server, self.smtp_settings(server):
+            result = outbox.send_pending(batch_size=2)
+
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.delivered), 5)
+        self.assertEqual(len(result["sent"]), 5)
+        self.assertEqual([m.pk for m in result["failed"]], [bounced.pk])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.STATUS_SENT).count(), 5)
+
+        bounced.refresh_from_db()
+        self.assertEqual(bounced.status, EmailOutbox.STATUS_PENDING)
+        self.assertEqual(bounced.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", bounced.last_error)
+        self.assertGreater(bounced.next_attempt_at, bounced.created_at + outbox.backoff(1) / 2)
+
+        # مش وقتها لسا: ولا اتصال بينفتح
+        with FakeSMTPServer() as server, self.smtp_settings(server):
+            self.assertEqual(outbox.send_pending(), {"sent": [], "failed": []})
+        self.assertEqual(server.connections, 0)
+
+    def test_gives_up_after_max_attempts(self):
+        message = outbox.enqueue("Bounce", "Body", ["nobody@example.com"])
+        EmailOutbox.objects.filter(pk=message.pk).update(attempts=outbox.MAX_ATTEMPTS - 1)
+
+        with FakeSMTPServer(reject={"nobody@example.com"}) as server, self.smtp_settings(server):
+            outbox.send_pending()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, EmailOutbox.STATUS_FAILED)
+        self.assertEqual(message.attempts, outbox.MAX_ATTEMPTS)
+
+    @override_settings(EMAIL_BACKEND="core.tests.UnreachableEmailBackend")
+    def test_unreachable_smtp_backs_off_the_claimed_batch(self):
+        messages = [outbox.enqueue(f"Message {i}", "Body", [f"user{i}@example.com"]) for i in range(3)]
+
+        out, err = StringIO(), StringIO()
+        call_command("send_outbox", stdout=out, stderr=err)
+        self.assertIn("Sent 0 email(s), 3 failed.", out.getvalue())
+        self.assertIn("ConnectionRefusedError: SMTP is down", err.getvalue())
+
+        for message in messages:
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts, message.locked_at), (EmailOutbox.STATUS_PENDING, 1, None))
+            self.assertIn("SMTP is down", message.last_error)
+
+    def test_backoff_is_exponential_and_capped(self):
+        self.assertEqual(outbox.backoff(2), 2 * outbox.backoff(1))
+        self.assertEqual(outbox.backoff(50).total_seconds(), outbox.MAX_BACKOFF_SECONDS)
+
+    def test_send_outbox_command(self):
+        outbox.enqueue("Hello", "Body", ["someone@example.com"])
+        out = StringIO()
+        call_command("send_outbox", stdout=out)
+        self.assertIn("Sent 1 email(s), 0 failed.", out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ["someone@example.com"])
+
+    def test_bulk_owner_approval_sends_over_one_connection(self):
+        User.objects.create_superuser("boss", "boss@example.com", "pass")
+        owners = [
+            User.objects.create_user(f"owner{i}", f"owner{i}@example.com", role="owner", is_approved=False)
+            for i in range(20)
+        ]
+        self.client.login(username="boss", password="pass")
+
+        with FakeSMTPServer(reject={"owner3@example.com"}) as server, self.smtp_settings(server):
+            # الـ session من الكاش (cached_db)
+            with self.assertNumQueries(6):
+                response = self.client.post(
+                    reverse("admin:core_user_changelist"),
+                    {"action": "approve_selected_owners", "_selected_action": [o.pk for o in owners]},
+                    follow=False,
+                )
+        self.assertEqual(response.status_code, 302)
+
+        self.assertFalse(User.objects.filter(role="owner", is_approved=False).exists())
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.delivered), 19)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.STATUS_SENT).count(), 19)
+        retry = EmailOutbox.objects.get(status=EmailOutbox.STATUS_PENDING)
+        self.assertEqual(retry.recipients, ["owner3@example.com"])
+
+        notes = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertTrue(any("owner3@example.com" in n for n in notes))
+        self.assertTrue(any("20 owner account(s) approved" in n for n in notes))
+
+
+class CarImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+
+    def upload(self, name="big.png", size=(2000, 1000)):
+        out = BytesIO()
+        Image.new("RGBA", size, (200, 30, 30, 128)).save(out, "PNG")
+        return SimpleUploadedFile(name, out.getvalue(), content_type="image/png")
+
+    def make_car(self, **fields):
+        return Car.objects.create(
+            owner=self.owner, name="Audi", year=2022, transmission="AUTO",
+            mileage="1000", price=40, image=self.upload(), **fields,
+        )
+
+    def test_upload_builds_every_derivative(self):
+        car = self.make_car()
+        car.refresh_from_db()
+        self.assertTrue(car.has_image_derivatives)
+        for size, width in images.SIZES.items():
+            for ext, fmt in images.FORMATS.items():
+                with default_storage.open(images.derivative_name(car.image.name, size, ext)) as f:
+                    derived = Image.open(f)
+                    self.assertEqual((derived.format, derived.width), (fmt, width))
+                    self.assertEqual(derived.height, width // 2)
+
+    def test_small_images_are_not_upscaled(self):
+        car = Car.objects.create(
+            owner=self.owner, name="Kia", year=2020, transmission="AUTO",
+            mileage="1000", price=30, image=self.upload("small.png", (200, 100)),
+        )
+        with default_storage.open(images.derivative_name(car.image.name, "detail", "jpg")) as f:
+            self.assertEqual(Image.open(f).size, (200, 100))
+
+    def test_replacing_the_image_drops_old_derivatives(self):
+        car = self.make_car()
+        old = images.derivative_names(car.image.name)
+        car.image = self.upload("new.png")
+        car.save()
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+        self.assertTrue(all(default_storage.exists(name) for name in images.derivative_names(car.image.name)))
+
+    def test_picture_tag_emits_srcset(self):
+        car = self.make_car()
+        html = Template('{% load car_images %}{% car_picture car "card" class="x" %}').render(Context({"car": car}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(".thumb.webp 320w", html)
+        self.assertIn(".detail.jpg 1280w", html)
+        self.assertIn('src="/media/cars/', html)
+        self.assertIn('class="x"', html)
+
+        car.image_derived = ""
+        html = Template('{% load car_images %}{% car_picture car %}').render(Context({"car": car}))
+        self.assertNotIn("<picture>", html)
+        self.assertIn(car.image.url, html)
+
+    def test_listing_serves_card_derivative(self):
+        self.make_car()
+        response = self.client.get(reverse("car_partial"))
+        self.assertContains(response, ".card.jpg")
+
+    def test_regenerate_command(self):
+        car = self.make_car()
+        for name in images.derivative_names(car.image.name):
+            default_storage.delete(name)
+        Car.objects.update(image_derived="")
+
+        out = StringIO()
+        call_command("regenerate_images", stdout=out)
+        self.assertIn("Generated derivatives for 1 car image(s), 0 failed.", out.getvalue())
+        car.refresh_from_db()
+        self.assertTrue(car.has_image_derivatives)
+        self.assertTrue(all(default_storage.exists(name) for name in images.derivative_names(car.image.name)))
+
+
+class StaticAssetPipelineTests(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+        self.css = "body { color: #123456; background: url(../img/bg.png); }\n" * 50
+        for path, content in [
+            ("css/style.css", self.css.encode()),
+            ("img/bg.png", b"\x89PNG fake"),
+            ("scss/bootstrap.scss", b"$primary: red;"),
+        ]:
+            os.makedirs(os.path.dirname(os.path.join(self.source, path)), exist_ok=True)
+            with open(os.path.join(self.source, path), "wb") as f:
+                f.write(content)
+
+        static = self.settings(
+            STATICFILES_DIRS=[self.source],
+            STATIC_ROOT=self.root,
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+        )
+        static.enable()
+        self.addCleanup(static.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def hashed(self, name):
+        return Template("{% load static %}{% static name %}").render(Context({"name": name}))
+
+    def test_collects_hashed_and_compressed_files_without_scss(self):
+        url = self.hashed("css/style.css")
+        self.assertRegex(url, r"^/static/css/style\.[0-9a-f]{12}\.css$")
+        path = os.path.join(self.root, url.removeprefix("/static/"))
+        with open(path + ".gz", "rb") as f:
+            self.assertIn(b"background", gzip.decompress(f.read()))
+        self.assertTrue(os.path.exists(path + ".br"))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "staticfiles.json")))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "scss")))
+        # الصور ما بتنضغط
+        self.assertFalse(os.path.exists(os.path.join(self.root, self.hashed("img/bg.png").removeprefix("/static/") + ".gz")))
+
+    def test_missing_files_fall_back_to_their_name(self):
+        self.assertEqual(self.hashed("img/missing.png"), "/static/img/missing.png")
+
+    def test_hashed_assets_are_served_precompressed_and_immutable(self):
+        url = self.hashed("css/style.css")
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        response.close()
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        css = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertIn(self.hashed("img/bg.png").removeprefix("/static/css/").replace("/static/", "../"), css)
+
+        response = self.client.get("/static/css/style.css")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertNotIn("immutable", response["Cache-Control"])
+        response.close()
+
+        self.assertEqual(self.client.get("/static/../manage.py").status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CarListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        self.renter = User.objects.create_user("renter")
+        self.car = self.make_car("Audi A4", 40)
+
+    def make_car(self, name, price):
+        return Car.objects.create(
+            owner=self.owner, name=name, year=2022, transmission="AUTO", mileage="1000", price=price,
+        )
+
+    def listing(self, **params):
+        return self.client.get(reverse("car_partial"), params).content.decode()
+
+    def test_hot_requests_do_no_queries(self):
+        first = self.listing(sort="popular")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.listing(sort="popular"), first)
+        # صفحة /car/ بتشارك نفس الـ fragment مع car_partial بدون فلتر
+        self.listing()
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse("car")), '<h4 class="card-title text-uppercase mb-4">Audi A4</h4>')
+
+        # كل فلتر إله مفتاحه
+        self.assertIn("Audi A4", first)
+        self.assertNotIn("Audi A4", self.listing(sort="manual"))
+
+    def test_car_changes_invalidate(self):
+        self.listing()
+        self.make_car("Kia Rio", 30)
+        self.assertIn("Kia Rio", self.listing())
+
+        self.car.name = "Audi A6"
+        self.car.save()
+        self.assertIn("Audi A6", self.listing())
+
+        self.car.delete()
+        self.assertNotIn("Audi A6", self.listing())
+
+    def test_booking_and_review_changes_invalidate(self):
+        booking = Booking.objects.create(
+            user=self.renter, car=self.car, pickup_date=datetime.date(2030, 1, 1),
+            pickup_time=datetime.time(10), return_date=datetime.date(2030, 1, 2),
+            return_time=datetime.time(10), status=Booking.STATUS_PAID,
+        )
+        self.listing()
+        with self.assertNumQueries(0):
+            self.listing()
+
+        Review.objects.create(booking=booking, user=self.renter, rating=4)
+        with self.assertNumQueries(2):  # الصفحة + السيارات المحجوزة
+            self.listing()
+
+        booking.status = Booking.STATUS_APPROVED
+        booking.save()
+        with self.assertNumQueries(2):
+            self.listing()
+
+    def test_blocked_cars_show_their_next_booking(self):
+        self.assertNotIn("Unavailable from", self.listing())
+        Booking.objects.create(
+            user=self.renter, car=self.car, pickup_date=datetime.date(2030, 1, 1),
+            pickup_time=datetime.time(10), return_date=datetime.date(2030, 1, 2),
+            status=Booking.STATUS_APPROVED,
+        )
+        self.assertIn("Unavailable from Jan. 1, 2030", self.listing())
+        self.assertContains(self.client.get(reverse("index")), "Unavailable from Jan. 1, 2030")
+        self.assertContains(
+            self.client.get(reverse("owner_cars", args=[self.owner.pk])), "Unavailable from Jan. 1, 2030"
+        )
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location, self.settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location,
+        }}):
+            self.listing()
+            with self.assertNumQueries(0):
+                self.assertIn("Audi A4", self.listing())
+            fragments.invalidate(fragments.CAR_LISTINGS)
+            with self.assertNumQueries(1):
+                self.listing()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(TestCase):
+    """
+    Every named route of ``core.urls``, requested as the role that uses it,
+    once with a handful of rows and again after seeding many more. The
+    number of queries must not change with the data and must stay within
+    the route's budget: a view that queries per row fails here.
+    """
+
+    # name -> query budget, بدون استعلامي الـ session والمستخدم
+    # (car / car_partial بيتقاسوا بدون كاش؛ الكتابة بتشمل تحديث الـ rollups و الـ occupancy)
+    BUDGETS = {
+        "index": 3,
+        "about": 0,
+        "service": 0,
+        "team": 0,
+        "testimonial": 0,
+        "contact": 0,
+        "login": 0,
+        "logout": 2,
+        "register": 0,
+        "register_owner": 0,
+        "profile": 3,
+        "car": 2,
+        "car_partial": 2,
+        "detail": 2,
+        "search_cars": 2,
+        "available_cars": 1,
+        "booking": 11,
+        "approve_booking": 9,
+        "reject_booking": 10,
+        "owner_dashboard": 10,
+        "add_car": 6,
+        "edit_car": 6,
+        "delete_car": 15,
+        "owner_cars": 4,
+        "owner_profile": 3,
+        "companies_list": 1,
+        "my_bookings": 3,
+        "pay_booking": 1,
+        "payment_success": 14,
+        "payment_cancel": 0,
+        "owner_bookings": 1,
+        "admin_login": 0,
+        "admin_dashboard": 7,
+        "export_excel": 5,
+        "export_pdf": 1,
+        "contract_detail": 2,
+        "create_review": 9,
+        "approve_contract": 10,
+        "decline_contract": 11,
+        "metrics": 0,
+    }
+
+    SMALL = 1
+    LARGE = 25  # أكبر من كل أحجام الصفحات
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.boss = User.objects.create_user("boss", "boss@example.com", role="admin")
+        cls.owner = User.objects.create_user(
+            "owner", "owner@example.com", role="owner", is_approved=True, company_name="Royal",
+        )
+        cls.renter = User.objects.create_user("renter", "renter@example.com", phone="0599")
+        cls.car = cls.make_car(cls.owner, "Audi A4")
+
+    def setUp(self):
+        self.day = 0
+        self.clients = {}
+
+    # -- data -----------------------------------------------------------
+    @staticmethod
+    def make_car(owner, name, price=40):
+        return Car.objects.create(
+            owner=owner, name=name, year=2022, transmission="AUTO", mileage="1000", price=price,
+        )
+
+    def make_booking(self, car=None, user=None, status=Booking.STATUS_PENDING):
+        # كل حجز بفترة جديدة عشان ما يتعارضوا
+        self.day += 3
+        pickup = datetime.date(2031, 1, 1) + datetime.timedelta(days=self.day)
+        return Booking.objects.create(
+            user=user or self.renter, car=car or self.car, status=status,
+            trip_location="Ramallah → Nablus (50 km)", pickup_date=pickup, pickup_time=datetime.time(10),
+            return_date=pickup + datetime.timedelta(days=2), return_time=datetime.time(10),
+        )
+
+    def seed(self, n):
+        for i in range(n):
+            owner = User.objects.create_user(
+                f"owner-{self.day}-{i}", role="owner", is_approved=True, company_name=f"Co {i}",
+            )
+            renter = User.objects.create_user(f"renter-{self.day}-{i}", f"r{i}@example.com")
+            own_car = self.make_car(self.owner, f"BMW {i}", 30 + i)
+            other_car = self.make_car(owner, f"Kia {i}", 60 + i)
+            for car in (self.car, own_car, other_car):
+                for user in (self.renter, renter):
+                    for status in (Booking.STATUS_PENDING, Booking.STATUS_APPROVED,
+                                   Booking.STATUS_REJECTED, Booking.STATUS_AWAITING_CONTRACT):
+                        self.make_booking(car, user, status)
+                    paid = self.make_booking(car, user, Booking.STATUS_PAID)
+                    Contract.objects.create(booking=paid)
+                    Review.objects.create(booking=paid, user=user, rating=1 + i % 5, comment="ok")
+
+    # -- requests -------------------------------------------------------
+    def client_for(self, role, fresh=False):
+        if fresh or role not in self.clients:
+            client = self.client_class()
+            if role:
+                client.force_login(getattr(self, role))
+            if fresh:
+                return client
+            self.clients[role] = client
+        return self.clients[role]
+
+    def route(self, name):
+        """``(role, method, path, data, extra)`` for one request to ``name``, creating what it needs."""
+        owner = self.owner.pk
+        if name in ("index", "about", "service", "team", "testimonial", "contact", "login", "register",
+                    "register_owner", "car", "car_partial", "companies_list", "admin_login"):
+            return None, "get", reverse(name), {}, {}
+        if name == "logout":
+            return "renter", "get", reverse(name), {}, {}
+        if name in ("profile", "my_bookings", "payment_cancel"):
+            return "renter", "get", reverse(name), {}, {}
+        if name == "detail":
+            return None, "get", reverse(name, args=[self.car.pk]), {}, {}
+        if name == "search_cars":
+            return None, "get", reverse(name), {"q": "bmw"}, {}
+        if name == "available_cars":
+            return None, "get", reverse(name), {"pickup": "2031-01-05T10:00", "return": "2031-01-09T10:00"}, {}
+        if name in ("owner_cars", "owner_profile"):
+            return None, "get", reverse(name, args=[owner]), {}, {}
+        if name == "owner_bookings":
+            return "owner", "get", reverse(name, args=[owner]), {}, {}
+        if name == "owner_dashboard":
+            return "owner", "get", reverse(name), {}, {}
+        if name in ("admin_dashboard", "export_excel", "export_pdf", "metrics"):
+            return "boss", "get", reverse(name), {}, {}
+        if name == "booking":
+            car = self.make_car(self.owner, "Fresh")
+            return "renter", "post", reverse(name), {
+                "car": car.pk, "trip_location": "Ramallah → Nablus (50 km)",
+                "pickup_date": "2040-01-01", "pickup_time": "10:00",
+                "return_date": "2040-01-03", "return_time": "10:00",
+            }, {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+        if name in ("approve_booking", "reject_booking"):
+            return "owner", "get", reverse(name, args=[self.make_booking().pk]), {}, {}
+        if name == "add_car":
+            return "owner", "post", reverse(name), {
+                "name": "New", "year": 2023, "transmission": "AUTO", "mileage": "10", "price": 50,
+            }, {}
+        if name == "edit_car":
+            car = self.make_car(self.owner, "Old")
+            return "owner", "post", reverse(name, args=[car.pk]), {
+                "name": "Edited", "year": 2023, "transmission": "AUTO", "mileage": "10", "price": 50,
+                "description": "",
+            }, {}
+        if name == "delete_car":
+            car = self.make_car(self.owner, "Doomed")
+            self.make_booking(car)
+            return "owner", "post", reverse(name, args=[car.pk]), {}, {}
+        if name == "pay_booking":
+            # حجز مش موافق عليه: ما منوصل لـ Stripe
+            return "renter", "get", reverse(name, args=[self.make_booking().pk]), {}, {}
+        if name == "payment_success":
+            booking = self.make_booking(status=Booking.STATUS_APPROVED)
+            return "renter", "get", reverse(name), {"booking": booking.pk}, {}
+        if name == "contract_detail":
+            booking = self.make_booking(status=Booking.STATUS_PAID)
+            Contract.objects.create(booking=booking)
+            return "renter", "get", reverse(name, args=[booking.pk]), {}, {}
+        if name == "create_review":
+            booking = self.make_booking(status=Booking.STATUS_PAID)
+            return "renter", "post", reverse(name, args=[booking.pk]), {"rating": 4, "comment": "Nice"}, {}
+        if name in ("approve_contract", "decline_contract"):
+            booking = self.make_booking(status=Booking.STATUS_AWAITING_CONTRACT)
+            Contract.objects.create(booking=booking)
+            return "renter", "post", reverse(name, args=[booking.pk]), {}, {}
+        raise AssertionError(f"No request defined for route {name!r}")
+
+    def count_queries(self, name):
+        role, method, path, data, extra = self.route(name)
+        # logout بيمسح الـ session، فإله client لحاله
+        client = self.client_for(role) if name != "logout" else self.client_for(role, fresh=True)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data, **extra)
+        self.assertLess(response.status_code, 400, f"{name}: {response.status_code}")
+        # الـ session + المستخدم: ثابتين لكل طلب مسجّل، مش جزء من ميزانية الـ view
+        tables = [q["sql"].split('"')[1] for q in queries.captured_queries[:2] if '"' in q["sql"]]
+        if role and tables == ["django_session", "core_user"]:
+            return len(queries) - 2
+        return len(queries)
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+        self.assertEqual(names, set(self.BUDGETS))
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.seed(self.SMALL)
+        small = {name: self.count_queries(name) for name in self.BUDGETS}
+        self.seed(self.LARGE - self.SMALL)
+        large = {name: self.count_queries(name) for name in self.BUDGETS}
+
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(route=name):
+                self.assertEqual(large[name], small[name], f"{name} runs more queries with more rows")
+                self.assertLessEqual(large[name], budget)
+
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_and_measure_report_every_view(self):
+        dataset = benchmark.seed(20)
+        self.assertEqual(Car.objects.count(), 20)
+        self.assertEqual(Booking.objects.count(), 20)
+        self.assertEqual(Contract.objects.count(), dataset["contracts"])
+
+        results = benchmark.measure(iterations=3, warmup=1)
+        self.assertEqual(set(results), set(benchmark.VIEWS))
+        for view, result in results.items():
+            with self.subTest(view=view):
+                self.assertEqual(result["status"], 200)
+                self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+                self.assertLessEqual(result["p95_ms"], result["p99_ms"])
+                self.assertGreater(result["peak_memory_kb"], 0)
+        # بدون الكاش كل view لازم يلمس القاعدة
+        cold = benchmark.measure(["car_partial"], iterations=1, warmup=0, cold_cache=True)
+        self.assertGreater(cold["car_partial"]["queries"], 0)
+        self.assertEqual(results["car_partial"]["queries"], 0)
+
+
+class HotQueryIndexTests(TestCase):
+    """Every hot filter is answered from one of the composite indexes, not a table scan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(40)
+        cls.renter = User.objects.filter(role=User.Roles.USER).first()
+        cls.car = Car.objects.first()
+
+    def hot_queries(self):
+        today = datetime.date.today()
+        return {
+            "booking_car_period_idx": overlapping_bookings(
+                self.car.pk, *Booking.period(today, datetime.time(10), today + datetime.timedelta(days=3), datetime.time(10))
+            ),
+            "booking_status_created_idx": Booking.objects.filter(
+                status=Booking.STATUS_PENDING, created_at__gte=timezone.now() - datetime.timedelta(days=30)
+            ),
+            "booking_user_created_idx": Booking.objects.filter(user=self.renter).order_by("-created_at")[:5],
+            "car_available_price_idx": Car.objects.filter(is_available__in=[True], price__lte=50).order_by("price"),
+            "user_role_approved_idx": User.objects.filter(role=User.Roles.OWNER, is_approved=True),
+        }
+
+    def test_hot_queries_use_their_index(self):
+        for index, queryset in self.hot_queries().items():
+            with self.subTest(index=index):
+                plan = queryset.explain()
+                self.assertIn(index, plan)
+                if connection.vendor == "sqlite":
+                    # SCAN = قراءة الجدول (أو index كامل) من أوله لآخره
+                    self.assertNotRegex(plan, r"\bSCAN\b")
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """
+    Just enough of the Stripe API for Checkout Sessions: replays the response
+    of a repeated ``Idempotency-Key`` like Stripe does, and fails with 500
+    while ``down`` is set.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeStripeHandler)
+        self.requests = []  # (path, idempotency key, form)
+        self.sessions = {}  # idempotency key -> response
+        self.connections = 0
+        self.down = False
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        key = self.headers.get("Idempotency-Key")
+        self.server.requests.append((self.path, key, form))
+        if self.server.down:
+            return self.reply(500, {"error": {"type": "api_error", "message": "Down"}})
+        if self.path != "/v1/checkout/sessions":
+            return self.reply(404, {"error": {"type": "invalid_request_error", "message": "Unknown path"}})
+        if key not in self.server.sessions:
+            session_id = f"cs_test_{len(self.server.sessions) + 1}"
+            self.server.sessions[key] = {
+                "id": session_id,
+                "object": "checkout.session",
+                "url": f"https://checkout.stripe.test/c/pay/{session_id}",
+                "amount_total": int(form["line_items[0][price_data][unit_amount]"][0]),
+                "expires_at": int(time.time()) + 24 * 60 * 60,
+            }
+        self.reply(200, self.server.sessions[key])
+
+
+class StripeCheckoutTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x", role=User.Roles.OWNER, is_approved=True)
+        self.renter = User.objects.create_user("renter", password="x")
+        self.car = Car.objects.create(
+            owner=self.owner, name="Audi", year=2022, transmission="AUTO", mileage="1000", price="40.00"
+        )
+        self.booking = Booking.objects.create(
+            user=self.renter, car=self.car, status=Booking.STATUS_APPROVED,
+            pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10),
+            return_date=datetime.date(2030, 1, 4),
+        )
+        self.client.force_login(self.renter)
+
+    def stripe_settings(self, server):
+        return override_settings(
+            STRIPE_SECRET_KEY="sk_test_fake", STRIPE_API_BASE=server.url, DOMAIN="http://testserver"
+        )
+
+    def pay(self):
+        return self.client.get(reverse("pay_booking", args=[self.booking.pk]))
+
+    def test_checkout_session_is_created_once_and_reused(self):
+        with FakeStripeServer() as server, self.stripe_settings(server):
+            first = self.pay()
+            second = self.pay()
+
+        self.assertEqual(first.url, "https://checkout.stripe.test/c/pay/cs_test_1")
+        self.assertEqual(second.url, first.url)
+        self.assertEqual(len(server.requests), 1)
+        path, key, form = server.requests[0]
+        self.assertEqual(form["line_items[0][price_data][unit_amount]"], ["12000"])  # 3 أيام × 40
+        self.assertEqual(form["metadata[booking_id]"], [str(self.booking.pk)])
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.checkout_session_id, "cs_test_1")
+        self.assertEqual(self.booking.checkout_amount, 12000)
+        self.assertGreater(self.booking.checkout_expires_at, timezone.now() + datetime.timedelta(hours=23))
+
+    def test_concurrent_clicks_share_one_session(self):
+        # الطلبين قروا الحجز قبل ما أي واحد يخزّن الجلسة
+        first, second = Booking.objects.get(pk=self.booking.pk), Booking.objects.get(pk=self.booking.pk)
+        with FakeStripeServer() as server, self.stripe_settings(server):
+            urls = {payments.checkout_url(first), payments.checkout_url(second)}
+
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(len({key for _, key, _ in server.requests}), 1)
+        self.assertEqual(len(server.sessions), 1)
+
+    def test_requests_reuse_one_connection(self):
+        with FakeStripeServer() as server, self.stripe_settings(server):
+            for days in (1, 2, 3):
+                # مبلغ جديد كل مرة -> جلسة جديدة
+                Booking.objects.filter(pk=self.booking.pk).update(return_date=datetime.date(2030, 1, 1 + days))
+                self.pay()
+
+        self.assertEqual(len(server.sessions), 3)
+        self.assertEqual(server.connections, 1)
+
+    def test_expired_or_repriced_session_is_replaced(self):
+        with FakeStripeServer() as server, self.stripe_settings(server):
+            self.pay()
+            Booking.objects.filter(pk=self.booking.pk).update(
+                checkout_expires_at=timezone.now() + payments.REUSE_MARGIN / 2
+            )
+            expired = self.pay()
+            Car.objects.filter(pk=self.car.pk).update(price="50.00")
+            repriced = self.pay()
+
+        self.assertEqual(expired.url, "https://checkout.stripe.test/c/pay/cs_test_2")
+        self.assertEqual(repriced.url, "https://checkout.stripe.test/c/pay/cs_test_3")
+        self.assertEqual(len({key for _, key, _ in server.requests}), 3)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.checkout_amount, 15000)
+
+    @override_settings(STRIPE_MAX_NETWORK_RETRIES=0)
+    def test_stripe_outage_is_reported_to_the_renter(self):
+        with FakeStripeServer() as server, self.stripe_settings(server):
+            server.down = True
+            response = self.pay()
+
+        self.assertRedirects(response, reverse("my_bookings"), fetch_redirect_response=False)
+        self.assertIn("unavailable", str(list(get_messages(response.wsgi_request))[0]))
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.checkout_session_id, "")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("renter", password="x")
+        self.client.login(username="renter", password="x")
+
+    def test_authenticated_get_runs_no_auth_queries(self):
+        self.client.get(reverse("car_partial"))  # بيعبّي الكاش: user + fragment
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("car_partial"))
+        self.assertEqual(response.status_code, 200)
+        # الـ session لسا محفوظة بالقاعدة (write-through)
+        self.assertTrue(Session.objects.filter(session_key=self.client.session.session_key).exists())
+
+    def test_saving_a_user_refreshes_request_user(self):
+        self.client.get(reverse("profile"))
+        self.user.role = User.Roles.OWNER
+        self.user.save()
+
+        response = self.client.get(reverse("profile"))
+        self.assertEqual(response.wsgi_request.user.role, User.Roles.OWNER)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get(reverse("profile"))
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse("profile"))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_bulk_approval_refreshes_cached_owners(self):
+        owner = User.objects.create_user("owner", password="x", role="owner", is_active=False)
+        User.objects.create_superuser("boss", "boss@example.com", "pass")
+        backends.CachedModelBackend().get_user(owner.pk)  # نسخة قديمة بالكاش
+
+        admin_client = self.client_class()
+        admin_client.login(username="boss", password="pass")
+        admin_client.post(
+            reverse("admin:core_user_changelist"),
+            {"action": "approve_selected_owners", "_selected_action": [owner.pk]},
+        )
+        self.assertTrue(backends.CachedModelBackend().get_user(owner.pk).is_approved)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(30)
+
+    async def test_search_matches_the_sync_implementation(self):
+        for params in ({"query": "bmw"}, {"query": ""}, {"query": "20", "limit": 5, "offset": 5}):
+            with self.subTest(**params):
+                expected = await sync_to_async(search.search_cars)(**params)
+                self.assertEqual(await search.asearch_cars(**params), expected)
+
+        response = await self.async_client.get(reverse("search_cars"), {"q": "bmw", "limit": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    async def test_car_partial_pages_like_the_car_page(self):
+        await sync_to_async(cache.clear)()
+        first = await self.async_client.get(reverse("car_partial"), {"sort": "price_low"})
+        self.assertEqual(first.status_code, 200)
+        html = first.content.decode()
+        self.assertEqual(html.count("car-card"), 12)
+
+        cursor = re.search(r"cursor=([\w-]+)", html).group(1)
+        second = await self.async_client.get(reverse("car_partial"), {"sort": "price_low", "cursor": cursor})
+        prices = [Decimal(p) for p in re.findall(r'data-price="([\d.]+)"', html + second.content.decode())]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(len(prices), 24)
+
+        # نفس الـ HTML اللي بترندره صفحة /car/ (المسار sync)
+        await sync_to_async(cache.clear)()
+        partial = await self.async_client.get(reverse("car_partial"))
+        await sync_to_async(cache.clear)()
+        page = await sync_to_async(self.client.get)(reverse("car"))
+        self.assertIn(partial.content.decode(), page.content.decode())
+
+
+class CarOccupancyTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        self.renter = User.objects.create_user("renter")
+        self.start = timezone.localdate() + datetime.timedelta(days=10)
+        self.audi, self.kia, self.bmw = (
+            Car.objects.create(owner=self.owner, name=name, year=2022, transmission="AUTO", mileage="1", price=40)
+            for name in ("Audi", "Kia", "BMW")
+        )
+
+    def book(self, car, first, last, status=Booking.STATUS_PENDING, times=(datetime.time(10), datetime.time(10))):
+        return Booking.objects.create(
+            user=self.renter, car=car, status=status,
+            pickup_date=self.start + datetime.timedelta(days=first), pickup_time=times[0],
+            return_date=self.start + datetime.timedelta(days=last), return_time=times[1],
+        )
+
+    def available(self, first, last, times=("10:00", "10:00")):
+        pickup = self.start + datetime.timedelta(days=first)
+        drop = self.start + datetime.timedelta(days=last)
+        response = self.client.get(reverse("available_cars"), {
+            "pickup": f"{pickup}T{times[0]}", "return": f"{drop}T{times[1]}",
+        })
+        self.assertEqual(response.status_code, 200)
+        return sorted(r["name"] for r in response.json()["results"])
+
+    def days(self, car):
+        return sorted((d - self.start).days for d in CarOccupancy.objects.filter(car=car).values_list("day", flat=True))
+
+    def test_index_follows_booking_changes(self):
+        booking = self.book(self.audi, 0, 2)
+        self.assertEqual(self.days(self.audi), [0, 1, 2])
+
+        booking.return_date += datetime.timedelta(days=2)
+        booking.save()
+        self.assertEqual(self.days(self.audi), [0, 1, 2, 3, 4])
+
+        booking.status = Booking.STATUS_REJECTED
+        booking.save(update_fields=["status"])
+        self.assertEqual(self.days(self.audi), [])
+
+        kept = self.book(self.kia, 1, 1)
+        self.book(self.kia, 3, 4).delete()
+        self.assertEqual(self.days(self.kia), [1])
+
+        CarOccupancy.objects.all().delete()
+        self.assertEqual(occupancy.rebuild(), 1)
+        self.assertEqual(self.days(self.kia), [1])
+        self.assertEqual(kept.car_id, self.kia.pk)
+
+    def test_search_matches_the_overlap_check(self):
+        self.book(self.audi, 2, 4)
+        self.book(self.kia, 5, 5, times=(datetime.time(9), datetime.time(12)))
+        Car.objects.filter(pk=self.bmw.pk).update(is_available=False)
+
+        self.assertEqual(self.available(0, 1), ["Audi", "Kia"])
+        # أول وآخر يوم: بيعارض بس إذا تقاطع بالوقت
+        self.assertEqual(self.available(0, 2), ["Audi", "Kia"])
+        self.assertEqual(self.available(0, 2, ("10:00", "10:01")), ["Kia"])
+        self.assertEqual(self.available(3, 3, ("08:00", "09:00")), ["Kia"])
+        self.assertEqual(self.available(4, 6), ["Audi"])
+        self.assertEqual(self.available(5, 5, ("13:00", "18:00")), ["Audi", "Kia"])
+        self.assertEqual(self.available(5, 5, ("11:00", "18:00")), ["Audi"])
+
+        # نفس نتيجة فحص التعارض لكل سيارة
+        for first, last, times in (
+            (0, 1, ("10:00", "10:00")), (0, 2, ("09:00", "11:00")), (3, 5, ("10:00", "10:00")),
+            (4, 6, ("09:00", "10:00")), (5, 6, ("12:00", "10:00")), (6, 9, ("10:00", "10:00")),
+        ):
+            with self.subTest(period=(first, last, times)):
+                pickup = self.start + datetime.timedelta(days=first)
+                drop = self.start + datetime.timedelta(days=last)
+                period = Booking.period(
+                    pickup, datetime.time.fromisoformat(times[0]), drop, datetime.time.fromisoformat(times[1])
+                )
+                expected = sorted(
+                    car.name for car in Car.objects.filter(is_available=True)
+                    if not overlapping_bookings(car.pk, *period).exists()
+                )
+                self.assertEqual(self.available(first, last, times), expected)
+
+    def test_invalid_periods_are_rejected(self):
+        url = reverse("available_cars")
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        for params in (
+            {},
+            {"pickup": "tomorrow", "return": "later"},
+            {"pickup": f"{self.start}T10:00", "return": f"{self.start}T09:00"},
+            {"pickup": f"{yesterday}T10:00", "return": f"{self.start}T10:00"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_fleet_wide_search_is_one_query(self):
+        for i in range(30):
+            car = Car.objects.create(owner=self.owner, name=f"Car {i}", year=2020, transmission="AUTO",
+                                     mileage="1", price=40)
+            self.book(car, i % 5, i % 5 + 2)
+        with self.assertNumQueries(1):
+            self.available(0, 1)
+        # الأيام بتنقرأ من الـ index لحاله (range scan على day)
+        plan = occupancy.available_cars(
+            *Booking.period(self.start, datetime.time(10), self.start + datetime.timedelta(days=3), datetime.time(10))
+        ).explain()
+        if connection.vendor == "sqlite":
+            # SQLite بيسمّي index الـ UniqueConstraint لحاله (sqlite_autoindex_...)
+            self.assertRegex(plan, r"USING COVERING INDEX \w*caroccupancy\w* \(day>\? AND day<\?\)")
+        else:
+            self.assertIn("unique_car_occupancy_day", plan)
+
+
+class BookingTransitionTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        self.renter = User.objects.create_user("renter", "renter@example.com")
+        self.car = Car.objects.create(owner=self.owner, name="Audi", year=2022, transmission="AUTO",
+                                      mileage="1", price=40)
+        pickup = timezone.localdate() + datetime.timedelta(days=5)
+        self.booking = Booking.objects.create(
+            user=self.renter, car=self.car, trip_location="Ramallah → Nablus (50 km)",
+            pickup_date=pickup, pickup_time=datetime.time(10),
+            return_date=pickup + datetime.timedelta(days=2), return_time=datetime.time(10),
+        )
+
+    def load(self):
+        return Booking.objects.get(pk=self.booking.pk)
+
+    def test_only_listed_transitions_are_allowed(self):
+        booking = self.load()
+        with self.assertRaises(InvalidTransition):
+            booking.transition_to(Booking.STATUS_PAID)
+
+        for status in (Booking.STATUS_APPROVED, Booking.STATUS_AWAITING_CONTRACT, Booking.STATUS_PAID):
+            booking.transition_to(status)
+            self.assertEqual(self.load().status, status)
+        with self.assertRaises(InvalidTransition):
+            booking.transition_to(Booking.STATUS_REJECTED)
+
+    def test_writes_only_the_status_and_only_from_the_loaded_one(self):
+        booking, stale = self.load(), self.load()
+        booking.trip_location = "Jenin"
+        with CaptureQueriesContext(connection) as queries:
+            booking.transition_to(Booking.STATUS_APPROVED)
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "core_booking"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("SET \"status\" = 'approved' WHERE", updates[0])
+        self.assertIn("\"status\" = 'pending'", updates[0])
+        self.assertEqual(self.load().trip_location, "Ramallah → Nablus (50 km)")
+
+        # نسخة قديمة (انقرأت pending) ما بتقدر تكتب فوق التغيير
+        with self.assertRaises(InvalidTransition):
+            stale.transition_to(Booking.STATUS_REJECTED)
+        self.assertEqual(self.load().status, Booking.STATUS_APPROVED)
+
+    def test_transition_signal_refreshes_caches_and_notifies(self):
+        self.assertEqual(CarOccupancy.objects.filter(car=self.car).count(), 3)
+        self.load().transition_to(Booking.STATUS_REJECTED)
+
+        self.assertFalse(CarOccupancy.objects.filter(car=self.car).exists())
+        rollup = DailyRollup.objects.get(metric=DailyRollup.METRIC_BOOKINGS, day=timezone.localdate())
+        self.assertEqual(rollup.status, Booking.STATUS_REJECTED)
+        self.assertEqual(list(EmailOutbox.objects.values_list("subject", flat=True)), ["❌ Booking Rejected"])
+
+    def test_views_and_admin_go_through_transitions(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse("approve_booking", args=[self.booking.pk]))
+        self.assertEqual(self.load().status, Booking.STATUS_APPROVED)
+        # مرة تانية: الحالة ما بتسمح، والحجز بضل زي ما هو
+        response = self.client.get(reverse("approve_booking", args=[self.booking.pk]), follow=True)
+        self.assertContains(response, "can no longer be approved")
+
+        self.client.force_login(User.objects.create_superuser("boss", "boss@example.com", "pass"))
+        booking = self.load()
+        data = {
+            "user": self.renter.pk, "car": self.car.pk, "trip_location": booking.trip_location,
+            "pickup_date": booking.pickup_date, "pickup_time": "10:00",
+            "return_date": booking.return_date, "return_time": "10:00", "special_request": "",
+            "created_at_0": timezone.localdate(), "created_at_1": "10:00",
+        }
+        url = reverse("admin:core_booking_change", args=[booking.pk])
+        response = self.client.post(url, {**data, "status": Booking.STATUS_PAID})
+        self.assertContains(response, "booking can&#x27;t be moved to paid")
+
+        self.client.post(url, {**data, "status": Booking.STATUS_REJECTED})
+        self.assertEqual(self.load().status, Booking.STATUS_REJECTED)
+        self.assertEqual(
+            list(EmailOutbox.objects.order_by("pk").values_list("subject", flat=True)),
+            ["✅ Booking Approved", "❌ Booking Rejected"],
+        )
+
+
+@override_settings(
+    MIDDLEWARE=["core.profiler.SQLProfilerMiddleware", *settings.MIDDLEWARE], SQL_PROFILER_THRESHOLD_MS=0,
+)
+class SQLProfilerTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        for price in (30, 40):
+            Car.objects.create(owner=self.owner, name="Audi", year=2022, transmission="AUTO", mileage="1", price=price)
+
+    def test_normalized_statements_share_a_fingerprint(self):
+        first = profiler.normalize("SELECT * FROM core_car WHERE id IN (1, 2, 3) AND name = 'a''b'  LIMIT 21")
+        second = profiler.normalize("SELECT * FROM core_car\n WHERE id IN (%s, %s) AND name = %s LIMIT 5")
+        self.assertEqual(first, "SELECT * FROM core_car WHERE id IN (...) AND name = ? LIMIT ?")
+        self.assertEqual(profiler.fingerprint(first), profiler.fingerprint(second))
+        self.assertEqual(
+            profiler.normalize('INSERT INTO t ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t ("a", "b") VALUES (...)',
+        )
+
+    def test_slow_queries_are_grouped_by_url_name(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("owner_dashboard"))
+        profile = response.wsgi_request.sql_profile
+        self.assertGreater(profile.count, 0)
+        self.assertRegex(response.headers["Server-Timing"], rf'sql;dur=[\d.]+;desc="{profile.count} queries"')
+
+        rows = SlowQuery.objects.filter(url_name="owner_dashboard")
+        self.assertEqual(rows.count(), len(profile.statements()))
+        self.assertEqual(sum(rows.values_list("count", flat=True)), profile.count)
+
+        # الطلب التاني بيزيد نفس الصفوف (نفس الـ fingerprints)
+        again = self.client.get(reverse("owner_dashboard")).wsgi_request.sql_profile
+        self.assertEqual(rows.count(), len(profile.statements().keys() | again.statements().keys()))
+        self.assertEqual(sum(rows.values_list("count", flat=True)), profile.count + again.count)
+
+    def test_sample_follows_the_slowest_run(self):
+        def statements(sql, ms):
+            return {"f": {"statement": "SELECT ?", "sample": sql, "count": 1, "total_ms": ms, "max_ms": ms}}
+
+        profiler.record_slow("car", statements("SELECT 1", 150))
+        profiler.record_slow("car", statements("SELECT 2", 300))
+        profiler.record_slow("car", statements("SELECT 3", 200))
+        row = SlowQuery.objects.get(url_name="car")
+        self.assertEqual((row.count, row.max_ms, row.sample), (3, 300, "SELECT 2"))
+
+    async def test_async_views_are_profiled(self):
+        response = await self.async_client.get(reverse("search_cars"), {"q": "audi"})
+        profile = response.asgi_request.sql_profile
+        self.assertGreater(profile.count, 0)
+        self.assertIn(f'desc="{profile.count} queries"', response.headers["Server-Timing"])
+        self.assertTrue(await SlowQuery.objects.filter(url_name="search_cars").aexists())
+
+    @override_settings(SQL_PROFILER_THRESHOLD_MS=10_000)
+    def test_fast_queries_are_only_counted(self):
+        response = self.client.get(reverse("car"))
+        self.assertGreater(response.wsgi_request.sql_profile.count, 0)
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_admin_lists_slow_queries(self):
+        self.client.get(reverse("car"))
+        self.client.force_login(User.objects.create_superuser("boss", "boss@example.com", "pass"))
+        response = self.client.get(reverse("admin:core_slowquery_changelist"), {"url_name": "car"})
+        self.assertContains(response, "core_car")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=self.dir, METRICS_TOKEN="secret")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.REGISTRY._reset()
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        return response.content.decode()
+
+    def test_requests_are_timed_per_route_and_status(self):
+        self.client.get(reverse("car"))
+        self.client.get(reverse("detail", args=[999]))
+        body = self.scrape()
+        self.assertIn('http_request_duration_seconds_count{route="car",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="car",status="200",le="+Inf"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{route="detail",status="404"} 1', body)
+        queries = re.search(r'http_request_queries_sum\{route="car"\} (\d+)', body)
+        self.assertGreater(int(queries.group(1)), 0)
+
+    async def test_async_requests_are_timed(self):
+        await self.async_client.get(reverse("search_cars"), {"q": "audi"})
+        body = await sync_to_async(self.scrape)()
+        self.assertIn('http_request_duration_seconds_count{route="search_cars",status="200"} 1', body)
+        self.assertIn('http_request_queries_count{route="search_cars"} 1', body)
+        queries = re.search(r'http_request_queries_sum\{route="search_cars"\} (\d+)', body)
+        self.assertGreater(int(queries.group(1)), 0)
+
+    def test_business_counters(self):
+        owner = User.objects.create_user("owner", role="owner", is_approved=True)
+        renter = User.objects.create_user("renter", "renter@example.com")
+        car = Car.objects.create(owner=owner, name="Audi", year=2022, transmission="AUTO", mileage="1", price=40)
+        booking = create_booking(
+            user=renter, car_id=car.pk, pickup_date=datetime.date(2030, 1, 1), pickup_time=datetime.time(10),
+            return_date=datetime.date(2030, 1, 3), return_time=datetime.time(10),
+        )
+        booking.transition_to(Booking.STATUS_APPROVED)
+        outbox.send_pending()
+
+        body = self.scrape()
+        self.assertIn('bookings_total{event="created"} 1', body)
+        self.assertIn('bookings_total{event="approved"} 1', body)
+        self.assertIn("emails_sent_total 1", body)
+
+    def test_counts_of_other_processes_and_threads_add_up(self):
+        pid = os.fork()
+        if pid == 0:
+            # worker تاني: سجل فاضي وملف خاص فيه
+            metrics.inc("emails_sent_total", 5)
+            metrics.observe("http_request_queries", 3, route="car")
+            metrics.REGISTRY.flush()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        def worker():
+            for _ in range(1000):
+                metrics.inc("emails_sent_total")
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.observe("http_request_queries", 30, route="car")
+
+        body = metrics.render()
+        self.assertIn("emails_sent_total 8005", body)
+        self.assertIn('http_request_queries_bucket{route="car",le="5.0"} 1', body)
+        self.assertIn('http_request_queries_bucket{route="car",le="50.0"} 2', body)
+        self.assertIn('http_request_queries_sum{route="car"} 33', body)
+
+    def test_endpoint_is_protected(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.client.force_login(User.objects.create_user("renter"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user("boss", role="admin"))
+        self.assertEqual(self.client.get(url).status_code, 200)
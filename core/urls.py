@@ -17,6 +17,7 @@ urlpatterns = [
     path("car/partial/", views.car_partial, name="car_partial"),
     path('detail/<int:pk>/', views.detail, name="detail"),
     path('search/', views.search_cars, name="search_cars"),
+    path('search/available/', views.available_cars, name="available_cars"),
     path('booking/', views.booking_view, name="booking"),
     path('booking/<int:booking_id>/approve/', views.approve_booking, name="approve_booking"),
     path('booking/<int:booking_id>/reject/', views.reject_booking, name="reject_booking"),
@@ -40,4 +41,5 @@ urlpatterns = [
     path("create_review/<int:booking_id>/", views.create_review, name="create_review"),
     path("contracts/<int:booking_id>/approve/", views.approve_contract, name="approve_contract"),
     path("contracts/<int:booking_id>/decline/", views.decline_contract, name="decline_contract"),
+    path("metrics/", views.metrics_view, name="metrics"),
     ]
\ No newline at end of file
@@ -2,30 +2,47 @@ from django.shortcuts import render, redirect, get_object_or_404 , HttpResponseR
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q
-from django.core.mail import send_mail
 from django.conf import settings
+import hmac
 import stripe
-from .models import Booking, Car, Contract, Review
-from django.db.models import Avg, Count, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from .models import Booking, Car, Contract, InvalidTransition, Review
+from .reports import owner_payments, payments_by_month, renter_bookings, report_metrics
+from .availability import aattach_next_bookings, attach_next_bookings, with_next_booking
+from .pagination import KeysetPaginator, apaginate, paginate
+from .bookings import BookingConflict, create_booking
+from .exports import admin_report_response
+from . import fragments, images, metrics, occupancy, outbox, payments, search
+from django.db.models import Count, Sum
 
 from django.utils import timezone
-from datetime import datetime
+from django.utils.dateparse import parse_datetime
+import datetime
 
 
 
 
 User = get_user_model()
 
+# أحجام الصفحات (keyset pagination)
+HOME_PAGE_SIZE = 6
+CARS_PAGE_SIZE = 12
+COMPANIES_PAGE_SIZE = 12
+BOOKINGS_PAGE_SIZE = 20
+
 
 # ===========================
 # PUBLIC PAGES
 # ===========================
 def index(request):
-    owners = User.objects.filter(role="owner", is_approved=True)
-    cars = Car.objects.filter(is_available=True)
+    # الصفحة الرئيسية بتعرض أول صفحة بس (الباقي في car / companies)
+    owners = KeysetPaginator(User.objects.filter(role="owner", is_approved=True), HOME_PAGE_SIZE).page()
+    cars = KeysetPaginator(with_next_booking(Car.objects.filter(is_available__in=[True])), HOME_PAGE_SIZE).page()
+    attach_next_bookings(cars.object_list)
     return render(request, "index.html", {"owners": owners, "cars": cars})
 
 
@@ -46,24 +63,16 @@ def testimonial(request):
 
 
 def car(request):
-    today = timezone.now().date()
-    cars = Car.objects.all()
-    for c in cars:
-        booking = c.bookings.filter(
-            return_date__gte=today
-        ).order_by("pickup_date").first()
-        c.unavailable_booking = booking
-    return render(request, "car.html", {"cars": cars})
+    return render(request, "car.html", {"cars_html": _car_listing_html(request)})
 
 
-def car_partial(request):
-    sort = request.GET.get("sort")
+def _car_listing_queryset(sort):
     cars = Car.objects.all()
 
     if sort == "popular":
-        cars = cars.annotate(num_bookings=Count("bookings")).order_by("-num_bookings")
+        cars = cars.order_by("-booking_count")
     elif sort == "rating":
-        cars = cars.annotate(avg_rating=Avg("bookings__review__rating")).order_by("-avg_rating")
+        cars = cars.order_by("-avg_rating")
     elif sort == "price_low":
         cars = cars.order_by("price")
     elif sort == "price_high":
@@ -74,26 +83,47 @@ def car_partial(request):
         cars = cars.filter(transmission="AUTO")
     elif sort == "economic":
         cars = cars.filter(price__lte=50)
+    return with_next_booking(cars)
+
+
+def _car_listing_html(request, sort=None):
+    """The rendered ``car_partial.html`` page, from the fragment cache when possible."""
+    def render_listing():
+        # صفحة وحدة + زر "Load more" (cursor)
+        page = paginate(request, _car_listing_queryset(sort), CARS_PAGE_SIZE)
+        cars = attach_next_bookings(page.object_list)
+        return render_to_string("car_partial.html", {"cars": cars, "page": page}, request)
 
-    today = timezone.now().date()
-    for car in cars:
-        car.unavailable_booking = car.bookings.filter(
-            return_date__gte=today
-        ).order_by("pickup_date").first()
+    # الـ HTML نفسه لكل الزوار: المفتاح هو الفلتر + باقي الـ query string (cursor)
+    params = (sort, sorted(request.GET.lists()))
+    return fragments.get_or_render("car_partial", params, [fragments.CAR_LISTINGS], render_listing)
 
-    return render(request, "car_partial.html", {"cars": cars})
+
+async def car_partial(request):
+    # async: تحت ASGI الطلب ما بيحجز thread وهو بيستنى القاعدة أو الكاش
+    sort = request.GET.get("sort")
+
+    async def render_listing():
+        page = await apaginate(request, _car_listing_queryset(sort), CARS_PAGE_SIZE)
+        cars = await aattach_next_bookings(page.object_list)
+        return render_to_string("car_partial.html", {"cars": cars, "page": page}, request)
+
+    params = (sort, sorted(request.GET.lists()))
+    return HttpResponse(
+        await fragments.aget_or_render("car_partial", params, [fragments.CAR_LISTINGS], render_listing)
+    )
 
 
 
 def detail(request, pk):
-    car = get_object_or_404(Car, pk=pk)
+    car = get_object_or_404(Car.objects.select_related("owner"), pk=pk)
 
     # نجيب كل التقييمات المرتبطة بالحجوزات لهذه السيارة
     reviews = Review.objects.filter(booking__car=car).select_related("user", "booking")
 
-    # ملخص التقييمات
-    avg_rating = reviews.aggregate(Avg("rating"))["rating__avg"]
-    total_reviews = reviews.count()
+    # ملخص التقييمات (محفوظ على السيارة)
+    avg_rating = car.avg_rating
+    total_reviews = car.rating_count
 
     return render(request, "detail.html", {
         "car": car,
@@ -222,15 +252,17 @@ def profile_view(request):
     user = request.user
 
     # آخر 5 حجوزات للمستخدم
-    recent_bookings = Booking.objects.filter(user=user).order_by('-created_at')[:5]
+    recent_bookings = Booking.objects.filter(user=user).select_related("car").order_by('-created_at')[:5]
 
     # آخر 5 عقود مرتبطة بالمستخدم (عن طريق الحجوزات)
     recent_contracts = Contract.objects.filter(booking__user=user).order_by('-created_at')[:5]
 
     # إحصائيات عامة
-    contracts = Contract.objects.filter(booking__user=user)
-    total_bookings = contracts.count()
-    total_paid = sum(c.total_price for c in contracts)
+    totals = Contract.objects.filter(booking__user=user).aggregate(
+        total_bookings=Count("id"), total_paid=Sum("total_amount")
+    )
+    total_bookings = totals["total_bookings"]
+    total_paid = totals["total_paid"] or 0
 
 
     return render(request, "profile.html", {
@@ -253,18 +285,15 @@ def owner_dashboard(request):
     cars = request.user.cars.all()[:5]
 
     # آخر 5 حجوزات
-    bookings = Booking.objects.filter(car__owner=request.user)[:5]
+    bookings = Booking.objects.filter(car__owner=request.user).select_related("user", "car")[:5]
 
     # التقييمات الخاصة بسيارات المالك
     reviews = Review.objects.filter(
         booking__car__owner=request.user
     ).select_related("booking__car", "user")
 
-    # ملخص لكل سيارة (متوسط وعدد التقييمات)
-    cars_with_stats = cars.annotate(
-        avg_rating=Avg("bookings__review__rating"),
-        total_reviews=Count("bookings__review")
-    )
+    # ملخص لكل سيارة (متوسط وعدد التقييمات محفوظين على السيارة)
+    cars_with_stats = cars
 
     # آخر 5 تعليقات
     recent_reviews = reviews.order_by("-created_at")[:5]
@@ -280,12 +309,11 @@ def owner_dashboard(request):
     # عدد المستخدمين الفريدين
     unique_customers = all_bookings.values("user").distinct().count()
 
-    # إجمالي الدفعات (محسوبة في بايثون باستخدام property total_price)
-    contracts = Contract.objects.filter(
+    # إجمالي الدفعات (SUM على المبلغ المحفوظ بالعقد)
+    total_payments = Contract.objects.filter(
         booking__car__owner=request.user,
         booking__status=Booking.STATUS_PAID
-    )
-    total_payments = sum(c.total_price for c in contracts)
+    ).aggregate(total=Sum("total_amount"))["total"] or 0
 
     # =========================
     # Top Customers & Top Cars
@@ -392,60 +420,42 @@ def booking_view(request):
         dropoff_lat = request.POST.get("dropoff_lat")
         dropoff_lng = request.POST.get("dropoff_lng")
 
-        # ✅ تحقق من وجود حجز متداخل (بالتاريخ)
-        overlap = Booking.objects.filter(
-            car=car,
-            return_date__gte=pickup_date,
-            pickup_date__lte=return_date,
-        )
-
-        # لو نفس اليوم → تحقق بالوقت كمان
-        if pickup_date == return_date:
-            overlap = overlap.filter(
-                pickup_time__lt=return_time,
-                return_time__gt=pickup_time,
+        # ✅ إنشاء الحجز مع قفل السيارة (ما في حجزين متداخلين لنفس السيارة)
+        try:
+            create_booking(
+                user=request.user,
+                car_id=car.pk,
+                pickup_date=pickup_date,
+                pickup_time=pickup_time,
+                return_date=return_date,
+                return_time=return_time,
+                trip_location=trip_location_text,
+                pickup_lat=pickup_lat if pickup_lat else None,
+                pickup_lng=pickup_lng if pickup_lng else None,
+                dropoff_lat=dropoff_lat if dropoff_lat else None,
+                dropoff_lng=dropoff_lng if dropoff_lng else None,
+                distance_km=distance_km,
+                special_request=request.POST.get("special_request", ""),
             )
-
-        if overlap.exists():
+        except BookingConflict:
             return JsonResponse({
                 "status": "error",
                 "message": " This car is already booked in the selected period."
             }, status=400)
 
-        # إنشاء الحجز
-        Booking.objects.create(
-            user=request.user,
-            car=car,
-            trip_location=trip_location_text,
-            pickup_lat=pickup_lat if pickup_lat else None,
-            pickup_lng=pickup_lng if pickup_lng else None,
-            dropoff_lat=dropoff_lat if dropoff_lat else None,
-            dropoff_lng=dropoff_lng if dropoff_lng else None,
-            distance_km=distance_km,
-            pickup_date=pickup_date,
-            pickup_time=pickup_time,
-            return_date=return_date,
-            return_time=return_time,
-            special_request=request.POST.get("special_request", ""),
-        )
-
         return JsonResponse({"status": "success", "message": " Booking successful! Please wait for confirmation."})
 
     return JsonResponse({"status": "error", "message": "Invalid request."}, status=400)
 
 @login_required(login_url="login")
 def approve_booking(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, car__owner=request.user)
-    booking.status = "approved"
-    booking.save()
-
-    send_mail(
-        " Booking Approved",
-        f"Hello {booking.user.username}, your booking for {booking.car.name} has been approved.",
-        "noreply@royalcars.com",
-        [booking.user.email],
-        fail_silently=True,
-    )
+    booking = get_object_or_404(Booking.objects.select_related("user", "car"), id=booking_id, car__owner=request.user)
+    # الإيميل للزبون بيطلع من core.signals.notify_renter
+    try:
+        booking.transition_to(Booking.STATUS_APPROVED)
+    except InvalidTransition:
+        messages.warning(request, " This booking can no longer be approved.")
+        return redirect("owner_dashboard")
 
     messages.success(request, " Booking approved and email sent.")
     return redirect("owner_dashboard")
@@ -453,77 +463,52 @@ def approve_booking(request, booking_id):
 
 @login_required(login_url="login")
 def reject_booking(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, car__owner=request.user)
-    booking.status = "rejected"
-    booking.save()
-
-    send_mail(
-        " Booking Rejected",
-        f"Hello {booking.user.username}, your booking for {booking.car.name} has been rejected.",
-        "noreply@royalcars.com",
-        [booking.user.email],
-        fail_silently=True,
-    )
+    booking = get_object_or_404(Booking.objects.select_related("user", "car"), id=booking_id, car__owner=request.user)
+    try:
+        booking.transition_to(Booking.STATUS_REJECTED)
+    except InvalidTransition:
+        messages.warning(request, " This booking can no longer be rejected.")
+        return redirect("owner_dashboard")
 
     messages.info(request, " Booking rejected.")
     return redirect("owner_dashboard")
 
 @login_required(login_url="login")
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).select_related("car", "contract")
-    awaiting_contract = bookings.filter(status="awaiting_contract").first()
+    all_bookings = Booking.objects.filter(user=request.user).select_related("car", "contract", "review")
+    awaiting_contract = (
+        all_bookings.select_related("car__owner__owner_profile", "user").filter(status="awaiting_contract").first()
+    )
+    bookings = paginate(request, all_bookings, BOOKINGS_PAGE_SIZE)
 
     # نحسب التوتال المدفوع
-    paid_bookings = bookings.filter(status="paid")
-    total_paid = sum(
-        (b.rental_days or 1) * float(b.car.price)
-        for b in paid_bookings
-        if b.car and b.car.price
-    )
+    total_paid = Contract.objects.filter(
+        booking__user=request.user, booking__status=Booking.STATUS_PAID
+    ).aggregate(total=Sum("total_amount"))["total"] or 0
 
     return render(request, "my_bookings.html", {
         "bookings": bookings,
         "awaiting_contract": awaiting_contract,
         "total_paid": total_paid,
+        "page": bookings,
     })
 
 @login_required(login_url="login")
 def pay_booking(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(Booking.objects.select_related("car"), id=booking_id, user=request.user)
 
     if booking.status != "approved":
         messages.warning(request, " You can only pay after the owner approves your booking.")
         return redirect("my_bookings")
-    # مبلغ الدفع (سعر اليوم الواحد) بالسنت
-    rental_days = booking.rental_days or 1  # لو الفرق صفر نخليه يوم واحد
-    total_amount_cents = int(float(booking.car.price) * rental_days * 100)
-
-    # جلسة Stripe Checkout
-    session = stripe.checkout.Session.create(
-        mode="payment",
-        payment_method_types=["card"],
-        line_items=[
-    {
-        "price_data": {
-            "currency": "usd",
-            "product_data": {
-                "name": f"{booking.car.name} ({rental_days} days)",
-                "description": f"Trip: {booking.trip_location}",
-                "images": [
-                    request.build_absolute_uri(booking.car.image.url)
-                      ] if booking.car.image else [],
-            },
-            "unit_amount": total_amount_cents,  # السعر الكلي
-        },
-        "quantity": 1,
-    }
-],
-        metadata={"booking_id": str(booking.id), "user_id": str(request.user.id)},
-        success_url=f"{settings.DOMAIN}/payment/success/?session_id={{CHECKOUT_SESSION_ID}}&booking={booking.id}",
-        cancel_url=f"{settings.DOMAIN}/payment/cancel/?booking={booking.id}",
-    )
+    # جلسة Stripe Checkout (نفس الجلسة المفتوحة لو لسا صالحة، core.payments)
+    image_url = request.build_absolute_uri(booking.car.image.url) if booking.car.image else None
+    try:
+        url = payments.checkout_url(booking, image_url)
+    except payments.StripeError:
+        messages.error(request, " Payment service is unavailable right now, please try again.")
+        return redirect("my_bookings")
 
-    return HttpResponseRedirect(session.url)
+    return HttpResponseRedirect(url)
 
 
 @login_required(login_url="login")
@@ -535,9 +520,13 @@ def payment_success(request):
 
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
 
-    # لا نغيّر إلى "paid" الآن
-    booking.status = "awaiting_contract"
-    booking.save(update_fields=["status"])
+    # لا نغيّر إلى "paid" الآن (وإعادة فتح الصفحة ما بتغيّر شي)
+    if booking.status != Booking.STATUS_AWAITING_CONTRACT:
+        try:
+            booking.transition_to(Booking.STATUS_AWAITING_CONTRACT)
+        except InvalidTransition:
+            messages.error(request, " Invalid payment confirmation.")
+            return redirect("my_bookings")
 
     # إنشاء العقد لو غير موجود
     Contract.objects.get_or_create(booking=booking)
@@ -596,6 +585,7 @@ def create_checkout_session(request):
                 success_url=f"{settings.DOMAIN}/payment/success/?booking={booking.id}",
                 cancel_url=f"{settings.DOMAIN}/payment/cancel/?booking={booking.id}",
             )
+            metrics.inc("stripe_checkout_sessions_total")
 
             return JsonResponse({"url": checkout_session.url})
         except Exception as e:
@@ -611,46 +601,110 @@ def create_checkout_session(request):
 # ===========================
 # SEARCH & COMPANIES
 # ===========================
-def search_cars(request):
-    query = request.GET.get("q", "")
-
-    cars = Car.objects.filter(
-        Q(name__icontains=query) |
-        Q(transmission__icontains=query) |
-        Q(year__icontains=query),
-        is_available=True   # ✅ فلترة السيارات المتاحة فقط
-    )
-
-    results = [{
+def _car_json(car):
+    return {
         "id": car.id,
         "name": car.name,
         "year": car.year,
         "transmission": car.transmission,
         "mileage": car.mileage,
         "price": str(car.price),
-        "image": car.image.url if car.image else "",
-    } for car in cars]
+        "image": _card_image_url(car),
+    }
+
+
+def _card_image_url(car):
+    if car.has_image_derivatives:
+        return images.urls(car.image, "jpg")["card"]
+    return car.image.url if car.image else ""
+
 
-    return JsonResponse({"results": results})
+async def search_cars(request):
+    query = request.GET.get("q", "")
+
+    def _int(name, default=None):
+        try:
+            return int(request.GET.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    transmission = request.GET.get("transmission", "").upper()
+    if transmission not in dict(Car.TRANSMISSION_CHOICES):
+        transmission = None
+
+    limit = _int("limit", search.DEFAULT_LIMIT)
+    offset = _int("offset", 0)
+
+    # ✅ بحث بالفهرس (core.search) + السيارات المتاحة فقط
+    cars, has_more = await search.asearch_cars(
+        query,
+        year_min=_int("year_min"),
+        year_max=_int("year_max"),
+        transmission=transmission,
+        limit=limit,
+        offset=offset,
+    )
+
+    results = [_car_json(car) for car in cars]
+
+    return JsonResponse({
+        "results": results,
+        "has_more": has_more,
+        "next_offset": max(0, offset) + len(results) if has_more else None,
+    })
+
+
+def _parse_datetime(value):
+    try:
+        parsed = parse_datetime(value or "")
+    except ValueError:
+        return None
+    if parsed and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+async def available_cars(request):
+    """Cars free for the whole ``?pickup=`` → ``?return=`` period (ISO datetimes), one keyset page."""
+    pickup = _parse_datetime(request.GET.get("pickup"))
+    drop = _parse_datetime(request.GET.get("return"))
+    if not pickup or not drop:
+        return JsonResponse({"status": "error", "message": "pickup and return must be datetimes."}, status=400)
+    if drop <= pickup:
+        return JsonResponse({"status": "error", "message": "return must be after pickup."}, status=400)
+    if timezone.localtime(pickup).date() < timezone.localdate():
+        return JsonResponse({"status": "error", "message": "pickup can't be in the past."}, status=400)
+
+    # فهرس الأيام المحجوزة (core.occupancy) بدل فحص التعارض لكل سيارة
+    cars = occupancy.available_cars(pickup, drop)
+    page = await apaginate(request, cars, search.MAX_LIMIT)
+
+    return JsonResponse({
+        "results": [_car_json(car) for car in page.object_list],
+        "has_more": page.has_next,
+        "next_cursor": page.next_cursor,
+    })
 
 
 
 def companies_list(request):
-    owners = User.objects.filter(role="owner", is_approved=True)
-    return render(request, "companies.html", {"owners": owners})
+    owners = paginate(request, User.objects.filter(role="owner", is_approved=True), COMPANIES_PAGE_SIZE)
+    return render(request, "companies.html", {"owners": owners, "page": owners})
 
 
 def owner_cars(request, owner_id):
     owner = get_object_or_404(User, id=owner_id, role="owner")
-    cars = Car.objects.filter(owner=owner)
-    cars_count = cars.count()   # ✅ عدد السيارات
-    return render(request, "owner_cars.html", {"owner": owner, "cars": cars,  "cars_count": cars_count})
+    page = paginate(request, with_next_booking(Car.objects.filter(owner=owner)), CARS_PAGE_SIZE)
+    cars = attach_next_bookings(page.object_list)
+    cars_count = Car.objects.filter(owner=owner).count()   # ✅ عدد السيارات
+    return render(request, "owner_cars.html", {"owner": owner, "cars": cars, "page": page, "cars_count": cars_count})
 
 
 def owner_profile(request, owner_id):
     owner = get_object_or_404(User, id=owner_id, role="owner")
-    cars = Car.objects.filter(owner=owner)
-    return render(request, "owner_cars.html", {"owner": owner, "cars": cars})
+    page = paginate(request, with_next_booking(Car.objects.filter(owner=owner)), CARS_PAGE_SIZE)
+    cars = attach_next_bookings(page.object_list)
+    return render(request, "owner_cars.html", {"owner": owner, "cars": cars, "page": page})
 
 
 # ===========================
@@ -672,7 +726,7 @@ def contact(request):
         full_message = f"From: {name} <{email}>\n\nMessage:\n{message}"
 
         try:
-            send_mail(full_subject, full_message, settings.DEFAULT_FROM_EMAIL, [to_email])
+            outbox.enqueue(full_subject, full_message, [to_email], from_email=settings.DEFAULT_FROM_EMAIL)
             messages.success(request, " Your message has been sent successfully.")
         except Exception as e:
             messages.error(request, f" Failed to send message: {e}")
@@ -682,25 +736,18 @@ def contact(request):
     return render(request, "contact.html", {"CONTACT_EMAIL": getattr(settings, "CONTACT_EMAIL", None)})
 
 
-
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseForbidden
-from .models import Booking, Contract
-
 @login_required(login_url="login")
 def contract_detail(request, booking_id):
     # Get the booking
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related("user", "car__owner__owner_profile"), id=booking_id)
 
     # Check ownership
-    if booking.user != request.user:
+    if booking.user_id != request.user.id:
         return HttpResponseForbidden("You are not allowed to view this contract.")
 
     # Get or create the contract
-    contract, _ = Contract.objects.get_or_create(
-        booking=booking,
-        defaults={"notes": "", "total_price": booking.rental_days * booking.car.price}
-    )
+    contract, _ = Contract.objects.get_or_create(booking=booking, defaults={"notes": ""})
+    contract.booking = booking  # الحجز محمّل مع السيارة والمالك، ما في داعي نرجع نجيبه
 
     # Render the template
     return render(request, "contract.html", {"contract": contract})
@@ -729,17 +776,15 @@ def create_review(request, booking_id):
     return redirect("profile")
 
 
-from django.db.models import Count, Avg
-
 def cars_list(request):
     cars = Car.objects.all()
     sort = request.GET.get("sort")
 
     if sort == "popular":  # الأكثر طلباً
-        cars = cars.annotate(num_bookings=Count("bookings")).order_by("-num_bookings")
+        cars = cars.order_by("-booking_count")
 
     elif sort == "rating":  # الأعلى تقييماً
-        cars = cars.annotate(avg_rating=Avg("bookings__review__rating")).order_by("-avg_rating")
+        cars = cars.order_by("-avg_rating")
 
     elif sort == "price_low":  # الأقل سعراً
         cars = cars.order_by("price")
@@ -802,8 +847,11 @@ def approve_contract(request, booking_id):
     Contract.objects.get_or_create(booking=booking)
 
     # غيّر الحالة إلى مدفوع
-    booking.status = Booking.STATUS_PAID
-    booking.save(update_fields=["status"])
+    try:
+        booking.transition_to(Booking.STATUS_PAID)
+    except InvalidTransition:
+        messages.warning(request, " This contract can no longer be approved.")
+        return redirect("my_bookings")
 
     messages.success(request, "✅ Contract approved. Your booking is now marked as paid.")
     return redirect("my_bookings")
@@ -813,10 +861,13 @@ def decline_contract(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
 
     if request.method == "POST":
-        booking.status = Booking.STATUS_REJECTED
+        try:
+            booking.transition_to(Booking.STATUS_REJECTED)
+        except InvalidTransition:
+            messages.warning(request, " This contract can no longer be declined.")
+            return redirect("my_bookings")
         booking.car.is_available = True
         booking.car.save(update_fields=["is_available"])
-        booking.save(update_fields=["status"])
 
         messages.info(request, "❌ You declined the contract. Your booking has been canceled.")
         return redirect("my_bookings")
@@ -830,20 +881,16 @@ def owner_bookings(request, owner_id):
         return redirect("index")
 
     # كل الحجوزات الخاصة بسيارات المالك
-    bookings = Booking.objects.filter(car__owner=request.user).select_related("car", "user")
+    bookings = paginate(
+        request, Booking.objects.filter(car__owner=request.user).select_related("car", "user"), BOOKINGS_PAGE_SIZE
+    )
 
     return render(request, "owner_bookings.html", {
         "bookings": bookings,
+        "page": bookings,
     })
 
 
-
-from django.db.models.functions import TruncMonth
-
-from collections import defaultdict
-from decimal import Decimal
-
-
 def admin_login(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -867,34 +914,8 @@ def admin_dashboard(request):
     if not getattr(request.user, "is_admin", False):
         return redirect("index")
 
-    # Users (بدون عدّ الـ Admins)
-    total_users = User.objects.exclude(role=User.Roles.ADMIN).count()
-    total_owners = User.objects.filter(role=User.Roles.OWNER).count()
-    total_renters = User.objects.filter(role=User.Roles.USER).count()
-
-    # Cars (خاصة بالملاك)
-    total_cars = Car.objects.count()
-    available_cars = Car.objects.filter(is_available=True).count()
-    unavailable_cars = total_cars - available_cars
-
-    # Bookings (خاصة بالمستخدمين والملاك)
-    total_bookings = Booking.objects.count()
-    pending = Booking.objects.filter(status=Booking.STATUS_PENDING).count()
-    approved = Booking.objects.filter(status=Booking.STATUS_APPROVED).count()
-    rejected = Booking.objects.filter(status=Booking.STATUS_REJECTED).count()
-    paid = Booking.objects.filter(status=Booking.STATUS_PAID).count()
-
-    # Payments (إجمالي المدفوعات)
-    paid_contracts = Contract.objects.filter(booking__status=Booking.STATUS_PAID)
-    total_payments = sum(c.total_price for c in paid_contracts)
-    payments_count = paid_contracts.count() 
-
-    # ✅ الأرباح = 10% من إجمالي المدفوعات
-    profits = total_payments * Decimal("0.10")
-
-    # Reviews
-    total_reviews = Review.objects.count()
-    avg_rating = Review.objects.aggregate(avg=Avg("rating"))["avg"] or 0
+    # كل الـ KPIs باستعلام واحد (core.reports)
+    metrics = report_metrics()
 
     # آخر 5 مستخدمين (بدون الادمن)
     recent_users = User.objects.exclude(role=User.Roles.ADMIN).order_by("-date_joined")[:5]
@@ -905,220 +926,86 @@ def admin_dashboard(request):
     # آخر 5 حجوزات
     recent_bookings = Booking.objects.select_related("user", "car").order_by("-created_at")[:5]
 
-    # بيانات للـ Chart.js (توزيع الحجوزات حسب الحالة)
-    booking_status_data = {
-        "pending": pending,
-        "approved": approved,
-        "rejected": rejected,
-        "paid": paid,
-    }
-
     # بيانات للـ Chart.js (المدفوعات الشهرية)
-    payments_by_month = (
-        Contract.objects.filter(booking__status=Booking.STATUS_PAID)
-        .annotate(month=TruncMonth("created_at"))
-        .values("month")
-        .annotate(total=Count("id"))
-        .order_by("month")
-    )
-    months = [p["month"].strftime("%b %Y") for p in payments_by_month]
-    payments = [p["total"] for p in payments_by_month]
-
-    # بيانات حجوزات المستخدمين (بدون الادمن)
-    users = User.objects.filter(role=User.Roles.USER)
-    user_booking_data = []
-    for u in users:
-        user_booking_data.append({
-            "username": u.username,
-            "pending": Booking.objects.filter(user=u, status=Booking.STATUS_PENDING).count(),
-            "approved": Booking.objects.filter(user=u, status=Booking.STATUS_APPROVED).count(),
-            "rejected": Booking.objects.filter(user=u, status=Booking.STATUS_REJECTED).count(),
-            "paid": Booking.objects.filter(user=u, status=Booking.STATUS_PAID).count(),
-        })
-
-    # مبالغ الملاك
-    owner_totals = defaultdict(Decimal)
-    contracts = Contract.objects.filter(booking__status=Booking.STATUS_PAID).select_related("booking__car__owner")
-    for c in contracts:
-        owner_totals[c.booking.car.owner.username] += Decimal(c.total_price)
-    owner_payments = [{"owner": k, "total": v} for k, v in owner_totals.items()]
+    monthly = payments_by_month()
+    months = [p["month"].strftime("%b %Y") for p in monthly]
+    payments = [p["count"] for p in monthly]
 
     context = {
         # KPIs
-        "total_users": total_users,
-        "total_owners": total_owners,
-        "total_renters": total_renters,
-        "total_cars": total_cars,
-        "available_cars": available_cars,
-        "unavailable_cars": unavailable_cars,
-        "total_bookings": total_bookings,
-        "pending": pending,
-        "approved": approved,
-        "rejected": rejected,
-        "paid": paid,
-        "total_payments": total_payments,
-        "profits": profits,   # ✅ الأرباح
-        "total_reviews": total_reviews,
-        "avg_rating": avg_rating,
+        **metrics,
         # Tables
         "recent_users": recent_users,
         "recent_cars": recent_cars,
         "recent_bookings": recent_bookings,
         # Charts
-        "booking_status_data": booking_status_data,
         "months": months,
         "payments": payments,
-        "user_booking_data": user_booking_data,
-        "owner_payments": list(owner_payments),
-        "payments_count": payments_count,
-
+        "user_booking_data": renter_bookings(),
+        "owner_payments": owner_payments(),
     }
     return render(request, "admin_dashboard.html", context)
 
 
-from decimal import Decimal
-
-import datetime
-from django.http import HttpResponse
-import openpyxl
-from django.db.models import Avg
-
-def export_admin_report_excel(request):
+def _report_range(request):
+    """``(start_date, end_date)`` من الـ query string؛ الاتنين أو ولا واحد. ``ValueError`` لو التاريخ غلط."""
     start_date = request.GET.get("start_date")
     end_date = request.GET.get("end_date")
+    if not (start_date and end_date):
+        return None, None
+    return datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
 
-    # فلترة حسب التاريخ
-    user_filter = {}
-    car_filter = {}
-    booking_filter = {}
-    contract_filter = {}
-    review_filter = {}
-
-    if start_date and end_date:
-        user_filter = {"date_joined__date__range": [start_date, end_date]}
-        car_filter = {"created_at__date__range": [start_date, end_date]}
-        booking_filter = {"created_at__date__range": [start_date, end_date]}
-        contract_filter = {"created_at__date__range": [start_date, end_date]}
-        review_filter = {"created_at__date__range": [start_date, end_date]}
-
-    # Users
-    total_users = User.objects.exclude(role=User.Roles.ADMIN).filter(**user_filter).count()
-    total_owners = User.objects.filter(role=User.Roles.OWNER, **user_filter).count()
-    total_regulars = User.objects.filter(role=User.Roles.USER, **user_filter).count()
-
-    # Cars
-    total_cars = Car.objects.filter(**car_filter).count()
-    available_cars = Car.objects.filter(is_available=True, **car_filter).count()
-    unavailable_cars = total_cars - available_cars
-
-    # Bookings
-    bookings = Booking.objects.filter(**booking_filter)
-    total_bookings = bookings.count()
-    pending = bookings.filter(status=Booking.STATUS_PENDING).count()
-    approved = bookings.filter(status=Booking.STATUS_APPROVED).count()
-    rejected = bookings.filter(status=Booking.STATUS_REJECTED).count()
-    paid = bookings.filter(status=Booking.STATUS_PAID).count()
-
-    # Payments
-    contracts = Contract.objects.filter(booking__status=Booking.STATUS_PAID, **contract_filter)
-    total_payments = sum(c.total_price for c in contracts)
-    payments_count = contracts.count()
-    profits = total_payments * Decimal("0.10")
 
+@login_required(login_url="login")
+def export_admin_report_excel(request):
+    if not getattr(request.user, "is_admin", False):
+        return HttpResponseForbidden()
+
+    # فلترة حسب التاريخ (أيام التجميع اليومية)
+    try:
+        start_date, end_date = _report_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid date range.")
+
+    m = report_metrics(start_date, end_date)
+
+    # ملخص + شيت لكل جدول (write_only + streaming)
+    summary_rows = [
+        ["Total Users", m["total_users"]],
+        ["Owners", m["total_owners"]],
+        ["Regular Users", m["total_renters"]],
+        ["Total Cars", m["total_cars"]],
+        ["Available Cars", m["available_cars"]],
+        ["Unavailable Cars", m["unavailable_cars"]],
+        ["Total Bookings", m["total_bookings"]],
+        ["Pending", m["pending"]],
+        ["Approved", m["approved"]],
+        ["Awaiting Contract", m["awaiting_contract"]],
+        ["Rejected", m["rejected"]],
+        ["Paid", m["paid"]],
+        ["Payments Count", m["payments_count"]],
+        ["Total Payments", float(m["total_payments"])],
+        ["Profits (10%)", float(m["profits"])],
+        ["Total Reviews", m["total_reviews"]],
+        ["Average Rating", round(m["avg_rating"], 1)],
+    ]
 
-    # Reviews
-    reviews = Review.objects.filter(**review_filter)
-    total_reviews = reviews.count()
-    avg_rating = reviews.aggregate(avg=Avg("rating"))["avg"] or 0
-
-    # إنشاء ملف Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Admin Report"
-
-    # العناوين
-    ws.append(["Metric", "Value"])
-    ws.append(["Total Users", total_users])
-    ws.append(["Owners", total_owners])
-    ws.append(["Regular Users", total_regulars])
-    ws.append(["Total Cars", total_cars])
-    ws.append(["Available Cars", available_cars])
-    ws.append(["Unavailable Cars", unavailable_cars])
-    ws.append(["Total Bookings", total_bookings])
-    ws.append(["Pending", pending])
-    ws.append(["Approved", approved])
-    ws.append(["Rejected", rejected])
-    ws.append(["Paid", paid])
-    ws.append(["Payments Count", payments_count])
-    ws.append(["Total Payments", float(total_payments)])
-    ws.append(["Profits (10%)", float(profits)])
-    ws.append(["Total Reviews", total_reviews])
-    ws.append(["Average Rating", round(avg_rating, 1)])
-
-    # تجهيز الاستجابة
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
     filename = f"admin_report_{datetime.date.today()}.xlsx"
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
+    return admin_report_response(summary_rows, filename, start_date, end_date)
 
 
-
-import datetime
-from decimal import Decimal
-from django.http import HttpResponse
-from django.db.models import Avg
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-
+@login_required(login_url="login")
 def export_admin_report_pdf(request):
-    start_date = request.GET.get("start_date")
-    end_date = request.GET.get("end_date")
-
-    # فلترة حسب التاريخ
-    user_filter = {}
-    car_filter = {}
-    booking_filter = {}
-    contract_filter = {}
-    review_filter = {}
-
-    if start_date and end_date:
-        user_filter = {"date_joined__date__range": [start_date, end_date]}
-        car_filter = {"created_at__date__range": [start_date, end_date]}
-        booking_filter = {"created_at__date__range": [start_date, end_date]}
-        contract_filter = {"created_at__date__range": [start_date, end_date]}
-        review_filter = {"created_at__date__range": [start_date, end_date]}
-
-    # Users
-    total_users = User.objects.exclude(role=User.Roles.ADMIN).filter(**user_filter).count()
-    total_owners = User.objects.filter(role=User.Roles.OWNER, **user_filter).count()
-    total_regulars = User.objects.filter(role=User.Roles.USER, **user_filter).count()
-
-    # Cars
-    total_cars = Car.objects.filter(**car_filter).count()
-    available_cars = Car.objects.filter(is_available=True, **car_filter).count()
-    unavailable_cars = total_cars - available_cars
-
-    # Bookings
-    bookings = Booking.objects.filter(**booking_filter)
-    total_bookings = bookings.count()
-    pending = bookings.filter(status=Booking.STATUS_PENDING).count()
-    approved = bookings.filter(status=Booking.STATUS_APPROVED).count()
-    rejected = bookings.filter(status=Booking.STATUS_REJECTED).count()
-    paid = bookings.filter(status=Booking.STATUS_PAID).count()
+    if not getattr(request.user, "is_admin", False):
+        return HttpResponseForbidden()
 
-    # Payments
-    contracts = Contract.objects.filter(booking__status=Booking.STATUS_PAID, **contract_filter)
-    total_payments = sum(c.total_price for c in contracts)
-    payments_count = contracts.count()
-    profits = total_payments * Decimal("0.10")
+    # فلترة حسب التاريخ (أيام التجميع اليومية)
+    try:
+        start_date, end_date = _report_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid date range.")
 
-    # Reviews
-    reviews = Review.objects.filter(**review_filter)
-    total_reviews = reviews.count()
-    avg_rating = reviews.aggregate(avg=Avg("rating"))["avg"] or 0
+    m = report_metrics(start_date, end_date)
 
     # تجهيز ملف PDF
     response = HttpResponse(content_type="application/pdf")
@@ -1136,29 +1023,42 @@ def export_admin_report_pdf(request):
     p.setFont("Helvetica", 12)
 
     # Users
-    p.drawString(50, y, f"Total Users: {total_users} (Owners: {total_owners}, Regular: {total_regulars})")
+    p.drawString(50, y, f"Total Users: {m['total_users']} (Owners: {m['total_owners']}, Regular: {m['total_renters']})")
     y -= 20
 
     # Cars
-    p.drawString(50, y, f"Total Cars: {total_cars} (Available: {available_cars}, Unavailable: {unavailable_cars})")
+    p.drawString(50, y, f"Total Cars: {m['total_cars']} (Available: {m['available_cars']}, Unavailable: {m['unavailable_cars']})")
     y -= 20
 
     # Bookings
-    p.drawString(50, y, f"Total Bookings: {total_bookings} (Pending: {pending}, Approved: {approved}, Rejected: {rejected}, Paid: {paid})")
+    p.drawString(50, y, f"Total Bookings: {m['total_bookings']} (Pending: {m['pending']}, Approved: {m['approved']}, Rejected: {m['rejected']}, Paid: {m['paid']})")
     y -= 20
 
     # Payments
-    p.drawString(50, y, f"Payments Count: {payments_count}")
+    p.drawString(50, y, f"Payments Count: {m['payments_count']}")
     y -= 20
-    p.drawString(50, y, f"Total Payments: ${total_payments:.2f}")
+    p.drawString(50, y, f"Total Payments: ${m['total_payments']:.2f}")
     y -= 20
-    p.drawString(50, y, f"Profits (10%): ${profits:.2f}")
+    p.drawString(50, y, f"Profits (10%): ${m['profits']:.2f}")
     y -= 20
 
     # Reviews
-    p.drawString(50, y, f"Total Reviews: {total_reviews}, Average Rating: {avg_rating:.1f}")
+    p.drawString(50, y, f"Total Reviews: {m['total_reviews']}, Average Rating: {m['avg_rating']:.1f}")
     y -= 40
 
     p.showPage()
     p.save()
     return response
+
+
+# ===========================
+# METRICS (core.metrics)
+# ===========================
+def metrics_view(request):
+    """Prometheus scrape endpoint: ``Authorization: Bearer <METRICS_TOKEN>``, or a logged-in admin."""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    header = request.headers.get("Authorization", "")
+    authorized = bool(token) and hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+    if not (authorized or getattr(request.user, "is_admin", False)):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -46,10 +46,12 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'core.apps.CoreStaticFilesConfig',
 ]
 
 MIDDLEWARE = [
+    # latency وعدد الاستعلامات لكل route (core.metrics)
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -137,6 +139,9 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "core.User"
+# request.user من الكاش (core.backends)، والـ session من الكاش مع نسخة في القاعدة
+AUTHENTICATION_BACKENDS = ["core.backends.CachedModelBackend"]
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 import os
 from dotenv import load_dotenv
 
@@ -150,6 +155,18 @@ STATICFILES_DIRS = [
 ]
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+# كاش مشترك بين كل الـ workers (fragments، ...)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("DJANGO_CACHE_DIR", os.path.join(BASE_DIR, "cache")),
+    }
+}
+# collectstatic بيكتب أسماء فيها hash + نسخ .gz/.br (core.storage)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "core.storage.CompressedManifestStaticFilesStorage"},
+}
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
@@ -163,5 +180,15 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+# مثلاً http://localhost:12111 لـ stripe-mock (core.payments)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
 DOMAIN = os.getenv("DOMAIN", "http://127.0.0.1:8000")
 
+# SQL profiler (core.profiler): SQL_PROFILER=1 بيشغّله، والاستعلامات الأبطأ من الحد بتنحفظ بـ SlowQuery
+if os.getenv("SQL_PROFILER"):
+    MIDDLEWARE.insert(0, "core.profiler.SQLProfilerMiddleware")
+SQL_PROFILER_THRESHOLD_MS = float(os.getenv("SQL_PROFILER_THRESHOLD_MS", 100))
+SQL_PROFILER_SAMPLE_RATE = float(os.getenv("SQL_PROFILER_SAMPLE_RATE", 1))
+# /metrics/ (core.metrics): ملف لكل worker بنفس المجلد، والـ scrape بيجمعهم
+METRICS_DIR = os.getenv("DJANGO_METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")